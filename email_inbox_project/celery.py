@@ -3,9 +3,9 @@ from celery import Celery
 
 #  Make sure this matches folder where settings.py exists----------------------------------------------------------
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'employee.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'email_inbox_project.settings')
 
-app = Celery('employee')
+app = Celery('email_inbox_project')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
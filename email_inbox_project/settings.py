@@ -122,6 +122,9 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -136,4 +139,48 @@ CELERY_RESULT_BACKEND = config('REDIS_URL', default='redis://localhost:6379/0')
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json' 
 CELERY_RESULT_SERIALIZER = 'json'
-CELERY_TIMEZONE = 'UTC'
\ No newline at end of file
+CELERY_TIMEZONE = 'UTC'
+CELERY_BEAT_SCHEDULE = {
+    'sync-all-email-accounts': {
+        'task': 'inboxapp.tasks.sync_all_email_accounts',
+        'schedule': 300.0,
+    },
+}
+
+# Inbox
+INBOX_PAGE_SIZE = 25
+IMAP_FETCH_CHUNK_SIZE = 100
+# Sync envelopes only; bodies are downloaded when an email is opened
+INBOX_SYNC_HEADERS_ONLY = True
+# Rows per IN lookup / bulk_create when saving synced emails
+INBOX_BULK_BATCH_SIZE = 500
+# Decoded attachment bytes kept in memory before spilling to a temp file
+INBOX_ATTACHMENT_BUFFER_SIZE = 1024 * 1024
+
+# Pooled IMAP sessions (seconds)
+IMAP_POOL_IDLE_TIMEOUT = 300
+IMAP_POOL_NOOP_INTERVAL = 60
+IMAP_POOL_ACQUIRE_TIMEOUT = 30
+IMAP_POOL_MAX_SESSIONS_PER_SERVER = 10
+
+# Concurrent sync engine (manage.py sync_mailboxes)
+IMAP_SYNC_PER_SERVER_LIMIT = 5
+IMAP_SYNC_MAX_WORKERS = 32
+
+# IDLE listener (manage.py listen_imap)
+IMAP_IDLE_REFRESH_SECONDS = 29 * 60
+IMAP_IDLE_POLL_INTERVAL = 60
+IMAP_IDLE_MAX_BACKOFF = 300
+
+# Keyword sets for classification and priority scoring; entries may be phrases
+INBOX_KEYWORD_SETS = {
+    'spam': ['win', 'free', 'offer', 'click'],
+    'ham': ['meeting', 'schedule', 'project'],
+    'urgency': ['urgent', 'action', 'important'],
+}
+
+# Priority scoring (manage.py score_emails after changing these)
+INBOX_IMPORTANT_SENDERS = ['boss@company.com', 'hr@company.com']
+
+# Spam probability at or above which an email is labelled spam
+INBOX_SPAM_THRESHOLD = 0.9
@@ -1,3 +1,5 @@
+from collections.abc import Mapping
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework import serializers
 from .models import (
     EmploymentDetail, Attendance, LeaveType, LeaveRequest, Payroll,
@@ -12,32 +14,148 @@ from .models import (
 )
 from users.models import Department, Position, User
 
+# Values of the ?choices= query parameter that drop per-row *_choices fields
+OMIT_CHOICES_VALUES = ('0', 'false', 'no')
+
+# Company-Scoped Related Object Resolution
+class CompanyRelatedResolver:
+    """Per-request cache of the user's company's related objects, by model and pk"""
+    
+    def __init__(self, company):
+        self.company = company
+        self.cache = {}
+    
+    def queryset(self, model):
+        if self.company is None:
+            return model.objects.none()
+        return model.objects.filter(company=self.company)
+    
+    def prime(self, model, pks):
+        """Load every uncached pk of a model with a single IN query"""
+        cache = self.cache.setdefault(model, {})
+        missing = set()
+        for pk in pks:
+            try:
+                pk = model._meta.pk.to_python(pk)
+            except DjangoValidationError:
+                continue
+            if pk not in cache:
+                missing.add(pk)
+        if not missing:
+            return
+        for obj in self.queryset(model).filter(pk__in=missing):
+            cache[obj.pk] = obj
+        for pk in missing:
+            cache.setdefault(pk, None)
+    
+    def get(self, model, pk):
+        """Return the object, or None when it is missing or in another company"""
+        pk = model._meta.pk.to_python(pk)
+        self.prime(model, [pk])
+        return self.cache[model][pk]
+
+def get_company_resolver(request):
+    resolver = getattr(request, '_company_related_resolver', None)
+    if resolver is None:
+        company = getattr(request.user, 'company', None) or None
+        resolver = CompanyRelatedResolver(company)
+        request._company_related_resolver = resolver
+    return resolver
+
+class CompanyPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """PrimaryKeyRelatedField limited to the request user's company
+
+    Lookups go through the request's CompanyRelatedResolver, so a pk seen
+    before in the same request, or primed by a bulk payload, costs no query.
+    """
+    
+    def get_queryset(self):
+        request = self.context.get('request')
+        if request is None:
+            return super().get_queryset()
+        return get_company_resolver(request).queryset(self.queryset.model)
+    
+    def to_internal_value(self, data):
+        request = self.context.get('request')
+        if request is None:
+            return super().to_internal_value(data)
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            obj = get_company_resolver(request).get(self.queryset.model, data)
+        except (DjangoValidationError, TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if obj is None:
+            self.fail('does_not_exist', pk_value=data)
+        return obj
+
+class CompanyBasedListSerializer(serializers.ListSerializer):
+    """Primes the resolver with every pk in a many=True payload before validation"""
+    
+    def to_internal_value(self, data):
+        request = self.context.get('request')
+        if request is not None and isinstance(data, list):
+            resolver = get_company_resolver(request)
+            pks_by_model = {}
+            for field in self.child.fields.values():
+                if isinstance(field, CompanyPrimaryKeyRelatedField) and not field.read_only:
+                    pks = pks_by_model.setdefault(field.queryset.model, set())
+                    for item in data:
+                        if isinstance(item, Mapping) and item.get(field.field_name) not in (None, ''):
+                            value = item[field.field_name]
+                            if isinstance(value, (int, str)) and not isinstance(value, bool):
+                                pks.add(value)
+            for model, pks in pks_by_model.items():
+                resolver.prime(model, pks)
+        return super().to_internal_value(data)
+
+    def run_child_validation(self, data):
+        # Bulk updates pass {pk: instance}; each row is validated against its own
+        if isinstance(self.instance, Mapping):
+            pk = self.child.Meta.model._meta.pk.to_python(data['id'])
+            self.child.instance = self.instance[pk]
+        return super().run_child_validation(data)
+
 # Base Company-Based Serializer
 class CompanyBasedSerializer(serializers.ModelSerializer):
-    def get_queryset_for_field(self, field_name, model_class):
-        """Filter related field querysets by user's company"""
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        meta = getattr(cls, 'Meta', None)
+        if meta is not None and not hasattr(meta, 'list_serializer_class'):
+            meta.list_serializer_class = CompanyBasedListSerializer
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Clients that read choices once from /meta/choices/ can skip them per row
         request = self.context.get('request')
-        if request and hasattr(request.user, 'company') and request.user.company:
-            return model_class.objects.filter(company=request.user.company)
-        return model_class.objects.none()
+        if request is not None:
+            params = getattr(request, 'query_params', request.GET)
+            if params.get('choices', '').lower() in OMIT_CHOICES_VALUES:
+                for name in [
+                    name for name, field in self.fields.items()
+                    if name.endswith('_choices') and isinstance(field, serializers.SerializerMethodField)
+                ]:
+                    self.fields.pop(name)
 
 # Employment Detail Serializer
 class EmploymentDetailSerializer(CompanyBasedSerializer):
     user_name = serializers.CharField(source='user.get_full_name', read_only=True)
-    user_id = serializers.PrimaryKeyRelatedField(
+    user_id = CompanyPrimaryKeyRelatedField(
         queryset=User.objects.all(), 
         source='user', 
         write_only=True
     )
     department_name = serializers.CharField(source='department.name', read_only=True)
-    department_id = serializers.PrimaryKeyRelatedField(
+    department_id = CompanyPrimaryKeyRelatedField(
         queryset=Department.objects.all(),
         source='department',
         write_only=True,
         required=False
     )
     position_name = serializers.CharField(source='position.name', read_only=True)
-    position_id = serializers.PrimaryKeyRelatedField(
+    position_id = CompanyPrimaryKeyRelatedField(
         queryset=Position.objects.all(),
         source='position',
         write_only=True,
@@ -62,15 +180,6 @@ class EmploymentDetailSerializer(CompanyBasedSerializer):
     
     def get_status_choices(self, obj):
         return EmploymentStatusChoices.choices
-    
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        if hasattr(self, 'context') and self.context.get('request'):
-            user = self.context['request'].user
-            if hasattr(user, 'company') and user.company:
-                self.fields['user_id'].queryset = User.objects.filter(company=user.company)
-                self.fields['department_id'].queryset = Department.objects.filter(company=user.company)
-                self.fields['position_id'].queryset = Position.objects.filter(company=user.company)
 
 # Task Category Serializer
 class TaskCategorySerializer(CompanyBasedSerializer):
@@ -81,19 +190,19 @@ class TaskCategorySerializer(CompanyBasedSerializer):
 # Task Serializer
 class TaskSerializer(CompanyBasedSerializer):
     assigned_to_name = serializers.CharField(source='assigned_to.get_full_name', read_only=True)
-    assigned_to_id = serializers.PrimaryKeyRelatedField(
+    assigned_to_id = CompanyPrimaryKeyRelatedField(
         queryset=User.objects.all(),
         source='assigned_to',
         write_only=True
     )
     assigned_by_name = serializers.CharField(source='assigned_by.get_full_name', read_only=True)
-    assigned_by_id = serializers.PrimaryKeyRelatedField(
+    assigned_by_id = CompanyPrimaryKeyRelatedField(
         queryset=User.objects.all(),
         source='assigned_by',
         write_only=True
     )
     category_name = serializers.CharField(source='category.name', read_only=True, allow_null=True)
-    category_id = serializers.PrimaryKeyRelatedField(
+    category_id = CompanyPrimaryKeyRelatedField(
         queryset=TaskCategory.objects.all(),
         source='category',
         write_only=True,
@@ -125,27 +234,21 @@ class TaskSerializer(CompanyBasedSerializer):
         return TaskStatusChoices.choices
     
     def get_comments_count(self, obj):
+        # TaskViewSet annotates the count; only unannotated instances query
+        if hasattr(obj, 'comments_count'):
+            return obj.comments_count
         return obj.comments.count()
-    
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        if hasattr(self, 'context') and self.context.get('request'):
-            user = self.context['request'].user
-            if hasattr(user, 'company') and user.company:
-                self.fields['assigned_to_id'].queryset = User.objects.filter(company=user.company)
-                self.fields['assigned_by_id'].queryset = User.objects.filter(company=user.company)
-                self.fields['category_id'].queryset = TaskCategory.objects.filter(company=user.company)
 
 # Task Comment Serializer
 class TaskCommentSerializer(CompanyBasedSerializer):
     author_name = serializers.CharField(source='author.get_full_name', read_only=True)
-    author_id = serializers.PrimaryKeyRelatedField(
+    author_id = CompanyPrimaryKeyRelatedField(
         queryset=User.objects.all(),
         source='author',
         write_only=True
     )
     task_title = serializers.CharField(source='task.title', read_only=True)
-    task_id = serializers.PrimaryKeyRelatedField(
+    task_id = CompanyPrimaryKeyRelatedField(
         queryset=Task.objects.all(),
         source='task',
         write_only=True
@@ -157,31 +260,23 @@ class TaskCommentSerializer(CompanyBasedSerializer):
             'id', 'task_id', 'task_title', 'author_id', 'author_name',
             'comment', 'created_at', 'updated_at'
         ]
-    
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        if hasattr(self, 'context') and self.context.get('request'):
-            user = self.context['request'].user
-            if hasattr(user, 'company') and user.company:
-                self.fields['author_id'].queryset = User.objects.filter(company=user.company)
-                self.fields['task_id'].queryset = Task.objects.filter(company=user.company)
 
 # Task Schedule Serializer
 class TaskScheduleSerializer(CompanyBasedSerializer):
     assigned_to_name = serializers.CharField(source='assigned_to.get_full_name', read_only=True)
-    assigned_to_id = serializers.PrimaryKeyRelatedField(
+    assigned_to_id = CompanyPrimaryKeyRelatedField(
         queryset=User.objects.all(),
         source='assigned_to',
         write_only=True
     )
     assigned_by_name = serializers.CharField(source='assigned_by.get_full_name', read_only=True)
-    assigned_by_id = serializers.PrimaryKeyRelatedField(
+    assigned_by_id = CompanyPrimaryKeyRelatedField(
         queryset=User.objects.all(),
         source='assigned_by',
         write_only=True
     )
     category_name = serializers.CharField(source='category.name', read_only=True, allow_null=True)
-    category_id = serializers.PrimaryKeyRelatedField(
+    category_id = CompanyPrimaryKeyRelatedField(
         queryset=TaskCategory.objects.all(),
         source='category',
         write_only=True,
@@ -208,26 +303,17 @@ class TaskScheduleSerializer(CompanyBasedSerializer):
     
     def get_frequency_choices(self, obj):
         return TaskFrequencyChoices.choices
-    
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        if hasattr(self, 'context') and self.context.get('request'):
-            user = self.context['request'].user
-            if hasattr(user, 'company') and user.company:
-                self.fields['assigned_to_id'].queryset = User.objects.filter(company=user.company)
-                self.fields['assigned_by_id'].queryset = User.objects.filter(company=user.company)
-                self.fields['category_id'].queryset = TaskCategory.objects.filter(company=user.company)
 
 # Email Log Serializer
 class EmailLogSerializer(CompanyBasedSerializer):
     recipient_name = serializers.CharField(source='recipient.get_full_name', read_only=True)
-    recipient_id = serializers.PrimaryKeyRelatedField(
+    recipient_id = CompanyPrimaryKeyRelatedField(
         queryset=User.objects.all(),
         source='recipient',
         write_only=True
     )
     task_title = serializers.CharField(source='task.title', read_only=True, allow_null=True)
-    task_id = serializers.PrimaryKeyRelatedField(
+    task_id = CompanyPrimaryKeyRelatedField(
         queryset=Task.objects.all(),
         source='task',
         write_only=True,
@@ -242,14 +328,274 @@ class EmailLogSerializer(CompanyBasedSerializer):
             'task_id', 'task_title', 'sent_successfully', 'error_message',
             'created_at', 'updated_at'
         ]
+
+# Attendance Serializer
+class AttendanceSerializer(CompanyBasedSerializer):
+    user_name = serializers.CharField(source='user.get_full_name', read_only=True)
+    user_id = CompanyPrimaryKeyRelatedField(
+        queryset=User.objects.all(),
+        source='user',
+        write_only=True
+    )
     
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        if hasattr(self, 'context') and self.context.get('request'):
-            user = self.context['request'].user
-            if hasattr(user, 'company') and user.company:
-                self.fields['recipient_id'].queryset = User.objects.filter(company=user.company)
-                self.fields['task_id'].queryset = Task.objects.filter(company=user.company)
-
-# Include all other existing serializers (Attendance, Leave, Payroll, etc.)
-# ... (keeping all the previous serializers as they were)
\ No newline at end of file
+    # Choice fields
+    status_choices = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Attendance
+        fields = [
+            'id', 'user_id', 'user_name', 'date', 'check_in', 'check_out',
+            'status', 'status_choices', 'remarks', 'created_at', 'updated_at'
+        ]
+    
+    def get_status_choices(self, obj):
+        return AttendanceStatusChoices.choices
+
+# Leave Type Serializer
+class LeaveTypeSerializer(CompanyBasedSerializer):
+    class Meta:
+        model = LeaveType
+        fields = ['id', 'name', 'max_days', 'created_at', 'updated_at']
+
+# Leave Request Serializer
+class LeaveRequestSerializer(CompanyBasedSerializer):
+    user_name = serializers.CharField(source='user.get_full_name', read_only=True)
+    user_id = CompanyPrimaryKeyRelatedField(
+        queryset=User.objects.all(),
+        source='user',
+        write_only=True
+    )
+    leave_type_name = serializers.CharField(source='leave_type.name', read_only=True)
+    leave_type_id = CompanyPrimaryKeyRelatedField(
+        queryset=LeaveType.objects.all(),
+        source='leave_type',
+        write_only=True
+    )
+    approved_by_name = serializers.CharField(source='approved_by.get_full_name', read_only=True, allow_null=True)
+    approved_by_id = CompanyPrimaryKeyRelatedField(
+        queryset=User.objects.all(),
+        source='approved_by',
+        write_only=True,
+        required=False,
+        allow_null=True
+    )
+    
+    # Choice fields
+    status_choices = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = LeaveRequest
+        fields = [
+            'id', 'user_id', 'user_name', 'leave_type_id', 'leave_type_name',
+            'start_date', 'end_date', 'reason', 'status', 'status_choices',
+            'approved_by_id', 'approved_by_name', 'created_at', 'updated_at'
+        ]
+    
+    def get_status_choices(self, obj):
+        return LeaveStatusChoices.choices
+
+# Payroll Serializer
+class PayrollSerializer(CompanyBasedSerializer):
+    user_name = serializers.CharField(source='user.get_full_name', read_only=True)
+    user_id = CompanyPrimaryKeyRelatedField(
+        queryset=User.objects.all(),
+        source='user',
+        write_only=True
+    )
+    
+    # Choice fields
+    status_choices = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Payroll
+        fields = [
+            'id', 'user_id', 'user_name', 'month', 'basic_salary', 'allowances',
+            'deductions', 'net_salary', 'payment_date', 'status', 'status_choices',
+            'created_at', 'updated_at'
+        ]
+    
+    def get_status_choices(self, obj):
+        return PayrollStatusChoices.choices
+
+# Performance Review Serializer
+class PerformanceReviewSerializer(CompanyBasedSerializer):
+    user_name = serializers.CharField(source='user.get_full_name', read_only=True)
+    user_id = CompanyPrimaryKeyRelatedField(
+        queryset=User.objects.all(),
+        source='user',
+        write_only=True
+    )
+    reviewer_name = serializers.CharField(source='reviewer.get_full_name', read_only=True, allow_null=True)
+    reviewer_id = CompanyPrimaryKeyRelatedField(
+        queryset=User.objects.all(),
+        source='reviewer',
+        write_only=True,
+        required=False,
+        allow_null=True
+    )
+    
+    class Meta:
+        model = PerformanceReview
+        fields = [
+            'id', 'user_id', 'user_name', 'review_date', 'reviewer_id',
+            'reviewer_name', 'rating', 'comments', 'goals', 'created_at', 'updated_at'
+        ]
+
+# Training Program Serializer
+class TrainingProgramSerializer(CompanyBasedSerializer):
+    class Meta:
+        model = TrainingProgram
+        fields = [
+            'id', 'title', 'description', 'start_date', 'end_date', 'trainer',
+            'is_mandatory', 'created_at', 'updated_at'
+        ]
+
+# Employee Training Serializer
+class EmployeeTrainingSerializer(CompanyBasedSerializer):
+    user_name = serializers.CharField(source='user.get_full_name', read_only=True)
+    user_id = CompanyPrimaryKeyRelatedField(
+        queryset=User.objects.all(),
+        source='user',
+        write_only=True
+    )
+    training_program_title = serializers.CharField(source='training_program.title', read_only=True)
+    training_program_id = CompanyPrimaryKeyRelatedField(
+        queryset=TrainingProgram.objects.all(),
+        source='training_program',
+        write_only=True
+    )
+    
+    # Choice fields
+    status_choices = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = EmployeeTraining
+        fields = [
+            'id', 'user_id', 'user_name', 'training_program_id',
+            'training_program_title', 'completion_date', 'status',
+            'status_choices', 'certificate', 'created_at', 'updated_at'
+        ]
+    
+    def get_status_choices(self, obj):
+        return TrainingStatusChoices.choices
+
+# Project Serializer
+class ProjectSerializer(CompanyBasedSerializer):
+    manager_name = serializers.CharField(source='manager.get_full_name', read_only=True, allow_null=True)
+    manager_id = CompanyPrimaryKeyRelatedField(
+        queryset=User.objects.all(),
+        source='manager',
+        write_only=True,
+        required=False,
+        allow_null=True
+    )
+    department_name = serializers.CharField(source='department.name', read_only=True, allow_null=True)
+    department_id = CompanyPrimaryKeyRelatedField(
+        queryset=Department.objects.all(),
+        source='department',
+        write_only=True,
+        required=False,
+        allow_null=True
+    )
+    
+    class Meta:
+        model = Project
+        fields = [
+            'id', 'name', 'description', 'start_date', 'end_date', 'manager_id',
+            'manager_name', 'department_id', 'department_name', 'created_at', 'updated_at'
+        ]
+
+# Project Assignment Serializer
+class ProjectAssignmentSerializer(CompanyBasedSerializer):
+    user_name = serializers.CharField(source='user.get_full_name', read_only=True)
+    user_id = CompanyPrimaryKeyRelatedField(
+        queryset=User.objects.all(),
+        source='user',
+        write_only=True
+    )
+    project_name = serializers.CharField(source='project.name', read_only=True)
+    project_id = CompanyPrimaryKeyRelatedField(
+        queryset=Project.objects.all(),
+        source='project',
+        write_only=True
+    )
+    
+    # Choice fields
+    status_choices = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = ProjectAssignment
+        fields = [
+            'id', 'user_id', 'user_name', 'project_id', 'project_name', 'role',
+            'assigned_date', 'completion_date', 'status', 'status_choices',
+            'created_at', 'updated_at'
+        ]
+    
+    def get_status_choices(self, obj):
+        return ProjectStatusChoices.choices
+
+# Disciplinary Action Serializer
+class DisciplinaryActionSerializer(CompanyBasedSerializer):
+    user_name = serializers.CharField(source='user.get_full_name', read_only=True)
+    user_id = CompanyPrimaryKeyRelatedField(
+        queryset=User.objects.all(),
+        source='user',
+        write_only=True
+    )
+    issued_by_name = serializers.CharField(source='issued_by.get_full_name', read_only=True, allow_null=True)
+    issued_by_id = CompanyPrimaryKeyRelatedField(
+        queryset=User.objects.all(),
+        source='issued_by',
+        write_only=True,
+        required=False,
+        allow_null=True
+    )
+    
+    # Choice fields
+    action_type_choices = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = DisciplinaryAction
+        fields = [
+            'id', 'user_id', 'user_name', 'incident_date', 'description',
+            'action_type', 'action_type_choices', 'issued_by_id', 'issued_by_name',
+            'duration', 'resolved', 'resolution_date', 'created_at', 'updated_at'
+        ]
+    
+    def get_action_type_choices(self, obj):
+        return DisciplinaryActionChoices.choices
+
+# Benefit Type Serializer
+class BenefitTypeSerializer(CompanyBasedSerializer):
+    class Meta:
+        model = BenefitType
+        fields = ['id', 'name', 'description', 'cost', 'created_at', 'updated_at']
+
+# Employee Benefit Serializer
+class EmployeeBenefitSerializer(CompanyBasedSerializer):
+    user_name = serializers.CharField(source='user.get_full_name', read_only=True)
+    user_id = CompanyPrimaryKeyRelatedField(
+        queryset=User.objects.all(),
+        source='user',
+        write_only=True
+    )
+    benefit_type_name = serializers.CharField(source='benefit_type.name', read_only=True)
+    benefit_type_id = CompanyPrimaryKeyRelatedField(
+        queryset=BenefitType.objects.all(),
+        source='benefit_type',
+        write_only=True
+    )
+    
+    # Choice fields
+    status_choices = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = EmployeeBenefit
+        fields = [
+            'id', 'user_id', 'user_name', 'benefit_type_id', 'benefit_type_name',
+            'start_date', 'end_date', 'details', 'status', 'status_choices',
+            'created_at', 'updated_at'
+        ]
+    
+    def get_status_choices(self, obj):
+        return BenefitStatusChoices.choices
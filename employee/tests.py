@@ -1,3 +1,474 @@
+"""Tests for the employee task API
+
+These need the project's users app (User with a company, Department,
+Position, TimestampedModel, TenantMixin), which is not part of this
+repository, and employee is not in INSTALLED_APPS of email_inbox_project.
+They run only where both are present.
+"""
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+from users.models import User
+from .models import (
+    Attendance, Payroll, Task, TaskCategory, TaskComment, TaskPriorityChoices, TaskStatusChoices
+)
+from .serializers import TaskSerializer
+from .views import (
+    AttendanceViewSet, ChoicesMetadataView, PayrollViewSet, TaskCategoryViewSet, TaskViewSet
+)
+
+Company = Task._meta.get_field('company').related_model
+
+class TaskListQueryCountTests(TestCase):
+    """Task list actions must not issue one COUNT per task for comments_count"""
+
+    actions = ['list', 'my_tasks', 'overdue_tasks']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Acme')
+        cls.user = User.objects.create_user(
+            username='worker', password='secret', company=cls.company
+        )
+
+    def create_tasks(self, count, comments=2):
+        for index in range(count):
+            task = Task.objects.create(
+                title=f'Task {index}',
+                description='',
+                assigned_to=self.user,
+                assigned_by=self.user,
+                status=TaskStatusChoices.PENDING,
+                due_date=timezone.now() - timedelta(days=1),
+                company=self.company
+            )
+            for _ in range(comments):
+                TaskComment.objects.create(
+                    task=task, author=self.user, comment='ok', company=self.company
+                )
+
+    def get(self, action):
+        request = APIRequestFactory().get('/')
+        force_authenticate(request, user=self.user)
+        view = TaskViewSet.as_view({'get': action})
+        with CaptureQueriesContext(connection) as queries:
+            response = view(request)
+            response.render()
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_query_count_does_not_grow_with_tasks(self):
+        self.create_tasks(2)
+        baseline = {action: self.get(action)[1] for action in self.actions}
+
+        self.create_tasks(20)
+        for action in self.actions:
+            with self.subTest(action=action):
+                response, query_count = self.get(action)
+                self.assertEqual(len(response.data), 22)
+                self.assertEqual(query_count, baseline[action])
+
+    def test_comments_count_comes_from_annotation(self):
+        self.create_tasks(3, comments=4)
+        for action in self.actions:
+            with self.subTest(action=action):
+                response, _ = self.get(action)
+                self.assertEqual([task['comments_count'] for task in response.data], [4, 4, 4])
+
+class BulkEndpointTests(TestCase):
+    """Bulk create, partial update and upsert on CompanyFilteredViewSet"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Acme')
+        cls.other_company = Company.objects.create(name='Globex')
+        cls.user = User.objects.create_user(
+            username='manager', password='secret', company=cls.company
+        )
+
+    def send(self, method, action, rows, viewset=TaskCategoryViewSet):
+        request = getattr(APIRequestFactory(), method)('/', rows, format='json')
+        force_authenticate(request, user=self.user)
+        view = viewset.as_view({method: action})
+        with CaptureQueriesContext(connection) as queries:
+            response = view(request)
+        return response, len(queries)
+
+    def test_bulk_create(self):
+        rows = [{'name': f'Category {index}', 'color': '#000000'} for index in range(50)]
+        response, query_count = self.send('post', 'bulk_create', rows)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(TaskCategory.objects.filter(company=self.company).count(), 50)
+        self.assertLess(query_count, 10)
+
+    def test_bulk_create_reports_row_errors_and_writes_nothing(self):
+        rows = [{'name': 'Ok'}, {'color': '#ffffff'}, {'name': 'x' * 51}]
+        response, _ = self.send('post', 'bulk_create', rows)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2])
+        self.assertFalse(TaskCategory.objects.exists())
+
+    def test_bulk_update(self):
+        categories = [
+            TaskCategory.objects.create(name=f'Category {index}', company=self.company)
+            for index in range(3)
+        ]
+        foreign = TaskCategory.objects.create(name='Theirs', company=self.other_company)
+        rows = [{'id': category.id, 'color': '#123456'} for category in categories]
+
+        response, _ = self.send('patch', 'bulk_update', rows + [{'id': foreign.id, 'color': '#123456'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors'][0]['index'], 3)
+
+        response, _ = self.send('patch', 'bulk_update', rows + [rows[1]])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors'], [{'index': 3, 'errors': {'id': ['Duplicate id in payload.']}}])
+
+        response, _ = self.send('patch', 'bulk_update', rows)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            set(TaskCategory.objects.filter(company=self.company).values_list('color', flat=True)),
+            {'#123456'}
+        )
+        foreign.refresh_from_db()
+        self.assertEqual(foreign.color, '#007bff')
+
+    def test_bulk_create_reports_natural_key_clashes(self):
+        TaskCategory.objects.create(name='Bugs', company=self.company)
+        TaskCategory.objects.create(name='Docs', company=self.other_company)
+        rows = [{'name': 'Features'}, {'name': 'Features'}, {'name': 'Bugs'}, {'name': 'Docs'}]
+
+        response, _ = self.send('post', 'bulk_create', rows)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors'], [
+            {'index': 1, 'errors': {'non_field_errors': ['Duplicate natural key, also at row 0.']}},
+            {'index': 2, 'errors': {'non_field_errors': ['The fields name must make a unique set.']}},
+        ])
+        self.assertEqual(TaskCategory.objects.filter(company=self.company).count(), 1)
+
+    def test_attendance_bulk_create_rejects_stored_user_and_date(self):
+        Attendance.objects.create(user=self.user, date=date(2024, 3, 1), company=self.company)
+        rows = [
+            {'user_id': self.user.pk, 'date': '2024-03-02'},
+            {'user_id': self.user.pk, 'date': '2024-03-01'},
+        ]
+
+        response, _ = self.send('post', 'bulk_create', rows, viewset=AttendanceViewSet)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors'], [
+            {'index': 1, 'errors': {'non_field_errors': ['The fields user, date must make a unique set.']}},
+        ])
+        self.assertEqual(Attendance.objects.count(), 1)
+
+    def test_bulk_update_reports_natural_key_clashes(self):
+        bugs, features, docs = [
+            TaskCategory.objects.create(name=name, company=self.company)
+            for name in ('Bugs', 'Features', 'Docs')
+        ]
+
+        response, _ = self.send('patch', 'bulk_update', [
+            {'id': bugs.id, 'name': 'Bugs'},
+            {'id': features.id, 'name': 'Docs'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors'], [
+            {'index': 1, 'errors': {'non_field_errors': ['The fields name must make a unique set.']}},
+        ])
+
+        response, _ = self.send('patch', 'bulk_update', [
+            {'id': features.id, 'name': 'Ideas'},
+            {'id': docs.id, 'name': 'Ideas'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors'], [
+            {'index': 1, 'errors': {'non_field_errors': ['Duplicate natural key, also at row 0.']}},
+        ])
+        self.assertEqual(
+            sorted(TaskCategory.objects.values_list('name', flat=True)), ['Bugs', 'Docs', 'Features']
+        )
+
+    def test_bulk_upsert_on_natural_key(self):
+        existing = TaskCategory.objects.create(name='Bugs', color='#ff0000', company=self.company)
+        TaskCategory.objects.create(name='Bugs', color='#ff0000', company=self.other_company)
+        rows = [{'name': 'Bugs', 'color': '#00ff00'}, {'name': 'Features', 'color': '#0000ff'}]
+
+        response, _ = self.send('post', 'bulk_upsert', rows)
+        self.assertEqual(response.status_code, 200)
+        existing.refresh_from_db()
+        self.assertEqual(existing.color, '#00ff00')
+        self.assertEqual(TaskCategory.objects.filter(company=self.company).count(), 2)
+        self.assertEqual(TaskCategory.objects.get(company=self.other_company).color, '#ff0000')
+
+        response, _ = self.send('post', 'bulk_upsert', rows + [{'name': 'Bugs'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors'][0]['index'], 2)
+
+    def test_attendance_bulk_create(self):
+        staff = [
+            User.objects.create_user(username=f'staff{index}', password='secret', company=self.company)
+            for index in range(20)
+        ]
+        rows = [
+            {'user_id': user.pk, 'date': f'2024-03-{day:02d}', 'status': 'present'}
+            for user in staff for day in range(1, 6)
+        ]
+        response, query_count = self.send('post', 'bulk_create', rows, viewset=AttendanceViewSet)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Attendance.objects.filter(company=self.company).count(), 100)
+        self.assertLess(query_count, 10)
+
+    def test_payroll_bulk_upsert_on_user_and_month(self):
+        Payroll.objects.create(
+            user=self.user, month='2024-03-01', basic_salary='1000.00', net_salary='1000.00',
+            company=self.company
+        )
+        rows = [
+            {'user_id': self.user.pk, 'month': '2024-03-01', 'basic_salary': '1200.00', 'net_salary': '1100.00'},
+            {'user_id': self.user.pk, 'month': '2024-04-01', 'basic_salary': '1200.00', 'net_salary': '1200.00'},
+        ]
+        response, _ = self.send('post', 'bulk_upsert', rows, viewset=PayrollViewSet)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            list(Payroll.objects.order_by('month').values_list('net_salary', flat=True)),
+            [Decimal('1100.00'), Decimal('1200.00')]
+        )
+        self.assertEqual([row['net_salary'] for row in response.data], ['1100.00', '1200.00'])
+
+    def task_rows(self, count):
+        return [
+            {
+                'title': f'Task {index}',
+                'description': 'Bulk task',
+                'assigned_to_id': self.user.pk,
+                'assigned_by_id': self.user.pk,
+                'due_date': '2030-01-01T00:00:00Z',
+            }
+            for index in range(count)
+        ]
+
+    def test_task_bulk_create_does_not_count_comments_per_task(self):
+        response, baseline = self.send('post', 'bulk_create', self.task_rows(2), viewset=TaskViewSet)
+        self.assertEqual(response.status_code, 201)
+
+        response, query_count = self.send('post', 'bulk_create', self.task_rows(30), viewset=TaskViewSet)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(query_count, baseline)
+        self.assertEqual({task['comments_count'] for task in response.data}, {0})
+
+    def test_task_bulk_update_returns_annotated_rows(self):
+        self.send('post', 'bulk_create', self.task_rows(30), viewset=TaskViewSet)
+        tasks = list(Task.objects.order_by('pk'))
+        for task in tasks[:2]:
+            TaskComment.objects.create(task=task, author=self.user, comment='ok', company=self.company)
+
+        rows = [{'id': task.pk, 'title': 'Renamed'} for task in reversed(tasks[:2])]
+        response, baseline = self.send('patch', 'bulk_update', rows, viewset=TaskViewSet)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([task['id'] for task in response.data], [row['id'] for row in rows])
+        self.assertEqual([task['comments_count'] for task in response.data], [1, 1])
+
+        rows = [{'id': task.pk, 'title': 'Renamed again'} for task in tasks]
+        response, query_count = self.send('patch', 'bulk_update', rows, viewset=TaskViewSet)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(query_count, baseline)
+        self.assertEqual([task['comments_count'] for task in response.data], [1, 1] + [0] * 28)
+
+class BulkValidationQueryCountTests(TestCase):
+    """A many=True payload resolves related pks with one query per related model"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Acme')
+        cls.other_company = Company.objects.create(name='Globex')
+        cls.users = [
+            User.objects.create_user(username=f'user{index}', password='secret', company=cls.company)
+            for index in range(5)
+        ]
+        cls.outsider = User.objects.create_user(
+            username='outsider', password='secret', company=cls.other_company
+        )
+        cls.categories = [
+            TaskCategory.objects.create(name=f'Category {index}', company=cls.company)
+            for index in range(3)
+        ]
+
+    def validate(self, rows):
+        request = APIRequestFactory().post('/')
+        request.user = self.users[0]
+        serializer = TaskSerializer(data=rows, many=True, context={'request': request})
+        with CaptureQueriesContext(connection) as queries:
+            valid = serializer.is_valid()
+        return serializer, valid, len(queries)
+
+    def row(self, index, assigned_to=None):
+        return {
+            'title': f'Task {index}',
+            'description': 'Bulk task',
+            'assigned_to_id': (assigned_to or self.users[index % 5]).pk,
+            'assigned_by_id': self.users[(index + 1) % 5].pk,
+            'category_id': self.categories[index % 3].pk,
+            'due_date': '2030-01-01T00:00:00Z',
+        }
+
+    def test_one_query_per_related_model(self):
+        serializer, valid, query_count = self.validate([self.row(index) for index in range(50)])
+        self.assertTrue(valid, serializer.errors)
+        self.assertEqual(query_count, 2)
+
+    def test_pk_from_another_company_fails(self):
+        rows = [self.row(index) for index in range(50)]
+        rows.append(self.row(50, assigned_to=self.outsider))
+
+        serializer, valid, query_count = self.validate(rows)
+        self.assertFalse(valid)
+        self.assertEqual(query_count, 2)
+        errors = serializer.errors
+        if isinstance(errors, dict):
+            errors = [errors.get(index, {}) for index in range(len(rows))]
+        self.assertFalse(any(errors[:50]))
+        self.assertEqual(errors[50]['assigned_to_id'][0].code, 'does_not_exist')
+
+class StreamingExportTests(TestCase):
+    """The export action streams rows of the user's company as CSV or NDJSON"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Acme')
+        cls.user = User.objects.create_user(
+            username='exporter', password='secret', company=cls.company
+        )
+        for index in range(5):
+            TaskCategory.objects.create(name=f'Category {index}', company=cls.company)
+        other_company = Company.objects.create(name='Globex')
+        TaskCategory.objects.create(name='Theirs', company=other_company)
+
+        outsider = User.objects.create_user(username='outsider', password='secret', company=other_company)
+        start = date(2024, 3, 1)
+        for day in range(3):
+            Attendance.objects.create(
+                user=cls.user, date=start + timedelta(days=day), status='present', company=cls.company
+            )
+        Attendance.objects.create(user=outsider, date=start, status='absent', company=other_company)
+        for month in (1, 2):
+            Payroll.objects.create(
+                user=cls.user, month=date(2024, month, 1), basic_salary='1000.00',
+                deductions='50.00', net_salary='950.00', company=cls.company
+            )
+        Payroll.objects.create(
+            user=outsider, month=date(2024, 1, 1), basic_salary='1.00', net_salary='1.00',
+            company=other_company
+        )
+
+    def export(self, viewset=TaskCategoryViewSet, **params):
+        request = APIRequestFactory().get('/', params)
+        force_authenticate(request, user=self.user)
+        response = viewset.as_view({'get': 'export'})(request)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        response, content = self.export(fields='id,name')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = content.splitlines()
+        self.assertEqual(lines[0], 'id,name')
+        self.assertEqual([line.split(',')[1] for line in lines[1:]], [f'Category {index}' for index in range(5)])
+
+    def test_ndjson(self):
+        response, content = self.export(output='ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(rows), 5)
+        self.assertNotIn('company_id', rows[0])
+        self.assertIn('created_at', rows[0])
+
+    def test_attendance_csv(self):
+        response, content = self.export(AttendanceViewSet, fields='user_id,date,status')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="attendance.csv"')
+        self.assertEqual(content.splitlines(), [
+            'user_id,date,status',
+            f'{self.user.pk},2024-03-01,present',
+            f'{self.user.pk},2024-03-02,present',
+            f'{self.user.pk},2024-03-03,present',
+        ])
+
+    def test_payroll_ndjson(self):
+        response, content = self.export(PayrollViewSet, output='ndjson')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="payroll.ndjson"')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['month'] for row in rows], ['2024-01-01', '2024-02-01'])
+        self.assertEqual({row['net_salary'] for row in rows}, {'950.00'})
+        self.assertNotIn('company_id', rows[0])
+
+    def test_unknown_field(self):
+        request = APIRequestFactory().get('/', {'fields': 'company_id'})
+        force_authenticate(request, user=self.user)
+        response = TaskCategoryViewSet.as_view({'get': 'export'})(request)
+        self.assertEqual(response.status_code, 400)
+
+class ChoicesMetadataTests(TestCase):
+    """Choice lists come once from /meta/choices/ and can be left out per row"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Acme')
+        cls.user = User.objects.create_user(
+            username='reader', password='secret', company=cls.company
+        )
+        Task.objects.create(
+            title='Task', description='', assigned_to=cls.user, assigned_by=cls.user,
+            status=TaskStatusChoices.PENDING, due_date=timezone.now(), company=cls.company
+        )
+
+    def get_metadata(self, **headers):
+        request = APIRequestFactory().get('/meta/choices/', headers=headers)
+        force_authenticate(request, user=self.user)
+        return ChoicesMetadataView.as_view()(request)
+
+    def list_tasks(self, **params):
+        request = APIRequestFactory().get('/', params)
+        force_authenticate(request, user=self.user)
+        response = TaskViewSet.as_view({'get': 'list'})(request)
+        self.assertEqual(response.status_code, 200)
+        return response.data[0]
+
+    def test_metadata_lists_every_choice_class(self):
+        response = self.get_metadata()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['task_priority'], [[value, str(label)] for value, label in TaskPriorityChoices.choices])
+        self.assertEqual(response.data['task_status'], [[value, str(label)] for value, label in TaskStatusChoices.choices])
+        self.assertIn('employment_type', response.data)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('max-age=3600', response['Cache-Control'])
+
+    def test_matching_etag_is_not_modified(self):
+        etag = self.get_metadata()['ETag']
+        for header in (etag, f'"stale", {etag}'):
+            with self.subTest(header=header):
+                response = self.get_metadata(if_none_match=header)
+                self.assertEqual(response.status_code, 304)
+                self.assertIsNone(response.data)
+                self.assertEqual(response['ETag'], etag)
+
+    def test_stale_etag_gets_the_choices(self):
+        response = self.get_metadata(if_none_match='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('task_status', response.data)
+
+    def test_rows_carry_choices_by_default(self):
+        row = self.list_tasks()
+        self.assertEqual(row['priority_choices'], TaskPriorityChoices.choices)
+        self.assertEqual(row['status_choices'], TaskStatusChoices.choices)
 
-# Create your tests here.
+    def test_choices_false_drops_choice_fields(self):
+        for value in ('false', '0', 'no', 'False'):
+            with self.subTest(choices=value):
+                row = self.list_tasks(choices=value)
+                self.assertNotIn('priority_choices', row)
+                self.assertNotIn('status_choices', row)
+                self.assertEqual(row['status'], TaskStatusChoices.PENDING)
+        self.assertIn('status_choices', self.list_tasks(choices='true'))
@@ -6,7 +6,7 @@ from .views import (
     TrainingProgramViewSet, EmployeeTrainingViewSet, ProjectViewSet,
     ProjectAssignmentViewSet, DisciplinaryActionViewSet, BenefitTypeViewSet,
     EmployeeBenefitViewSet, TaskViewSet, TaskCategoryViewSet,
-    TaskCommentViewSet, TaskScheduleViewSet, EmailLogViewSet
+    TaskCommentViewSet, TaskScheduleViewSet, EmailLogViewSet, ChoicesMetadataView
 )
 
 router = DefaultRouter()
@@ -34,5 +34,6 @@ router.register(r'task-schedules', TaskScheduleViewSet)
 router.register(r'email-logs', EmailLogViewSet)
 
 urlpatterns = [
+    path('meta/choices/', ChoicesMetadataView.as_view(), name='choices-metadata'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,13 +1,30 @@
+import csv
+import hashlib
+import inspect
+import json
+import re
+from collections.abc import Mapping
+from functools import lru_cache
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.validators import UniqueTogetherValidator
+from rest_framework.views import APIView
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models import Count
+from django.http import StreamingHttpResponse
 from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from . import models as employee_models
 from .models import (
     EmploymentDetail, Attendance, LeaveType, LeaveRequest, Payroll,
     PerformanceReview, TrainingProgram, EmployeeTraining, Project, 
     ProjectAssignment, DisciplinaryAction, BenefitType, EmployeeBenefit,
-    Task, TaskCategory, TaskComment, TaskSchedule, EmailLog
+    Task, TaskCategory, TaskComment, TaskSchedule, EmailLog, TaskStatusChoices
 )
 from .serializers import (
     EmploymentDetailSerializer, AttendanceSerializer, LeaveTypeSerializer,
@@ -19,8 +36,72 @@ from .serializers import (
 )
 from .tasks import send_task_assignment_email, create_scheduled_task
 
+# Streaming Export
+class EchoBuffer:
+    """File-like object whose write() hands the line back to csv.writer's caller"""
+    
+    def write(self, value):
+        return value
+
+class StreamingExportMixin:
+    """GET <resource>/export/?output=csv|ndjson streams the filtered rows
+    
+    Rows are read with .values().iterator(), so neither model instances nor
+    the serialized list are ever held in memory and worker memory stays flat
+    however many rows a company has. ?fields=a,b limits the columns.
+    """
+    export_chunk_size = 2000
+    # Columns available to export; defaults to the model's concrete fields
+    export_fields = None
+    
+    def get_export_fields(self):
+        fields = self.export_fields or [
+            field.attname for field in self.queryset.model._meta.concrete_fields
+            if field.name != 'company'
+        ]
+        requested = self.request.query_params.get('fields')
+        if not requested:
+            return list(fields)
+        requested = [name.strip() for name in requested.split(',') if name.strip()]
+        unknown = [name for name in requested if name not in fields]
+        if unknown:
+            raise ValidationError({'error': f"Unknown export fields: {', '.join(unknown)}"})
+        return requested
+    
+    def csv_rows(self, rows, fields):
+        writer = csv.writer(EchoBuffer())
+        yield writer.writerow(fields)
+        for row in rows:
+            yield writer.writerow([row[name] for name in fields])
+    
+    def ndjson_rows(self, rows, fields):
+        encoder = DjangoJSONEncoder(ensure_ascii=False)
+        for row in rows:
+            yield encoder.encode(row) + '\n'
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        output = request.query_params.get('output', 'csv').lower()
+        if output not in ('csv', 'ndjson'):
+            raise ValidationError({'error': 'output must be csv or ndjson'})
+        fields = self.get_export_fields()
+        rows = (
+            self.filter_queryset(self.get_queryset())
+            .order_by('pk')
+            .values(*fields)
+            .iterator(chunk_size=self.export_chunk_size)
+        )
+        
+        filename = self.queryset.model._meta.model_name
+        if output == 'csv':
+            response = StreamingHttpResponse(self.csv_rows(rows, fields), content_type='text/csv')
+        else:
+            response = StreamingHttpResponse(self.ndjson_rows(rows, fields), content_type='application/x-ndjson')
+        response['Content-Disposition'] = f'attachment; filename="{filename}.{output}"'
+        return response
+
 # Base ViewSet with Company Filtering
-class CompanyFilteredViewSet(viewsets.ModelViewSet):
+class CompanyFilteredViewSet(StreamingExportMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
@@ -31,6 +112,228 @@ class CompanyFilteredViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         if hasattr(self.request.user, 'company') and self.request.user.company:
             serializer.save(company=self.request.user.company)
+    
+    # Bulk Endpoints
+    # Largest list payload accepted by the bulk endpoints
+    bulk_max_rows = 5000
+    bulk_batch_size = 500
+    # Fields identifying a row for bulk upsert; defaults to the model's unique_together
+    natural_key_fields = None
+    
+    def get_natural_key_fields(self):
+        if self.natural_key_fields is not None:
+            return list(self.natural_key_fields)
+        unique_together = self.queryset.model._meta.unique_together
+        return list(unique_together[0]) if unique_together else []
+    
+    def get_bulk_rows(self, request):
+        """The list payload of a bulk request, checked for shape and size"""
+        if not (hasattr(request.user, 'company') and request.user.company):
+            raise ValidationError({'error': 'User is not assigned to a company'})
+        rows = request.data
+        if not isinstance(rows, list) or not rows:
+            raise ValidationError({'error': 'Expected a non-empty list of objects'})
+        if len(rows) > self.bulk_max_rows:
+            raise ValidationError({'error': f'At most {self.bulk_max_rows} rows per request'})
+        return rows
+    
+    def get_bulk_serializer(self, rows, **kwargs):
+        return self.get_serializer(data=rows, many=True, **kwargs)
+    
+    def bulk_error_response(self, errors):
+        """400 listing the errors of each failed row by its index in the payload"""
+        if isinstance(errors, Mapping):
+            errors = errors.items()
+        else:
+            # Older DRF returns one entry per row, newer only the failed rows by index
+            errors = enumerate(errors)
+        return Response(
+            {'errors': [{'index': index, 'errors': error} for index, error in errors if error]},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    def natural_key_errors(self, objs, check_existing=True):
+        """Per-row errors for natural keys repeated in the payload or already stored
+        
+        objs maps payload index to an unsaved or modified instance. Stored
+        rows are found with a single IN query per request; a row never
+        clashes with itself. Without a company-scoped key there is nothing
+        to check.
+        """
+        key_fields = self.get_natural_key_fields()
+        if 'company' not in key_fields:
+            return {}
+        model = self.queryset.model
+        key_attnames = [model._meta.get_field(name).attname for name in key_fields]
+        errors = {}
+        keys = {}
+        for index, obj in objs.items():
+            key = tuple(getattr(obj, attname) for attname in key_attnames)
+            # NULLs never collide in a unique constraint
+            if None in key:
+                continue
+            if key in keys:
+                errors[index] = {'non_field_errors': [f'Duplicate natural key, also at row {keys[key]}.']}
+            else:
+                keys[key] = index
+        if check_existing and keys:
+            names = ', '.join(name for name in key_fields if name != 'company')
+            lookup = {
+                f'{attname}__in': {key[position] for key in keys}
+                for position, attname in enumerate(key_attnames)
+            }
+            for pk, *key in model.objects.filter(**lookup).values_list(model._meta.pk.attname, *key_attnames):
+                index = keys.get(tuple(key))
+                if index is not None and objs[index].pk != pk:
+                    errors[index] = {'non_field_errors': [f'The fields {names} must make a unique set.']}
+        return errors
+    
+    def build_bulk_instance(self, attrs):
+        obj = self.queryset.model(**attrs)
+        obj.company = self.request.user.company
+        return obj
+    
+    def perform_bulk_create(self, objs):
+        return self.queryset.model.objects.bulk_create(objs, batch_size=self.bulk_batch_size)
+    
+    def get_bulk_response_data(self, objs):
+        """Serialize written rows as read back through get_queryset(), in payload order"""
+        fetched = self.get_queryset().in_bulk([obj.pk for obj in objs])
+        return self.get_serializer([fetched[obj.pk] for obj in objs], many=True).data
+    
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_create(self, request):
+        """Create every row of a list payload in one transaction, or none of them"""
+        serializer = self.get_bulk_serializer(self.get_bulk_rows(request))
+        if not serializer.is_valid():
+            return self.bulk_error_response(serializer.errors)
+        objs = [self.build_bulk_instance(attrs) for attrs in serializer.validated_data]
+        errors = self.natural_key_errors(dict(enumerate(objs)))
+        if errors:
+            return self.bulk_error_response(dict(sorted(errors.items())))
+        with transaction.atomic():
+            objs = self.perform_bulk_create(objs)
+        return Response(self.get_serializer(objs, many=True).data, status=status.HTTP_201_CREATED)
+    
+    @bulk_create.mapping.patch
+    def bulk_update(self, request):
+        """Partially update rows identified by "id" with a single bulk_update"""
+        rows = self.get_bulk_rows(request)
+        model = self.queryset.model
+        errors = {}
+        ids = {}
+        seen = set()
+        for index, row in enumerate(rows):
+            try:
+                pk = model._meta.pk.to_python(row['id'])
+            except (KeyError, TypeError, DjangoValidationError):
+                errors[index] = {'id': ['A valid id is required.']}
+                continue
+            if pk in seen:
+                errors[index] = {'id': ['Duplicate id in payload.']}
+            seen.add(pk)
+            ids[index] = pk
+        
+        instances = self.get_queryset().in_bulk(seen)
+        for index, pk in ids.items():
+            if pk not in instances:
+                errors[index] = {'id': ['Not found.']}
+        if errors:
+            return self.bulk_error_response(dict(sorted(errors.items())))
+        
+        # Each row is validated against its own instance, see CompanyBasedListSerializer
+        serializer = self.get_bulk_serializer(rows, instance=instances, partial=True)
+        if not serializer.is_valid():
+            return self.bulk_error_response(serializer.errors)
+        
+        objs = []
+        fields = set()
+        for index, attrs in enumerate(serializer.validated_data):
+            obj = instances[ids[index]]
+            for name, value in attrs.items():
+                setattr(obj, name, value)
+            fields.update(attrs)
+            objs.append(obj)
+        errors = self.natural_key_errors(dict(enumerate(objs)))
+        if errors:
+            return self.bulk_error_response(dict(sorted(errors.items())))
+        # bulk_update skips pre_save, so auto_now fields are stamped here
+        now = timezone.now()
+        for field in model._meta.concrete_fields:
+            if getattr(field, 'auto_now', False):
+                for obj in objs:
+                    setattr(obj, field.attname, now)
+                fields.add(field.name)
+        if fields:
+            with transaction.atomic():
+                model.objects.bulk_update(objs, sorted(fields), batch_size=self.bulk_batch_size)
+        return Response(self.get_bulk_response_data(objs))
+    
+    @action(detail=False, methods=['post'], url_path='bulk-upsert')
+    def bulk_upsert(self, request):
+        """Insert rows, updating those whose natural key already exists
+        
+        Uses a single INSERT ... ON CONFLICT per batch on the natural key
+        fields. Existing rows get every field sent in the payload.
+        """
+        key_fields = self.get_natural_key_fields()
+        if 'company' not in key_fields:
+            return Response(
+                {'error': 'This resource has no company-scoped natural key to upsert on'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        rows = self.get_bulk_rows(request)
+        model = self.queryset.model
+        
+        serializer = self.get_bulk_serializer(rows)
+        # Existing natural keys are the point of an upsert, not a validation error
+        serializer.child.validators = [
+            validator for validator in serializer.child.validators
+            if not isinstance(validator, UniqueTogetherValidator)
+        ]
+        if not serializer.is_valid():
+            return self.bulk_error_response(serializer.errors)
+        
+        key_attnames = [model._meta.get_field(name).attname for name in key_fields]
+        objs = [self.build_bulk_instance(attrs) for attrs in serializer.validated_data]
+        # Stored keys are updated in place; only repeats within the payload fail
+        errors = self.natural_key_errors(dict(enumerate(objs)), check_existing=False)
+        if errors:
+            return self.bulk_error_response(dict(sorted(errors.items())))
+        update_fields = {name for attrs in serializer.validated_data for name in attrs}
+        
+        update_fields.difference_update(key_fields)
+        update_fields.update(
+            field.name for field in model._meta.concrete_fields if getattr(field, 'auto_now', False)
+        )
+        with transaction.atomic():
+            if update_fields:
+                objs = model.objects.bulk_create(
+                    objs,
+                    batch_size=self.bulk_batch_size,
+                    update_conflicts=True,
+                    unique_fields=key_fields,
+                    update_fields=sorted(update_fields)
+                )
+            else:
+                objs = model.objects.bulk_create(
+                    objs, batch_size=self.bulk_batch_size, ignore_conflicts=True
+                )
+        # ignore_conflicts leaves pks unset; find those rows by natural key
+        missing = {
+            tuple(getattr(obj, attname) for attname in key_attnames): obj
+            for obj in objs if obj.pk is None
+        }
+        if missing:
+            lookup = {
+                f'{attname}__in': {key[position] for key in missing}
+                for position, attname in enumerate(key_attnames)
+            }
+            for row in model.objects.filter(**lookup).values(model._meta.pk.attname, *key_attnames):
+                key = tuple(row[attname] for attname in key_attnames)
+                if key in missing:
+                    missing[key].pk = row[model._meta.pk.attname]
+        return Response(self.get_bulk_response_data(objs))
 
 # Employment Management ViewSets
 class EmploymentDetailViewSet(CompanyFilteredViewSet):
@@ -94,11 +397,23 @@ class TaskViewSet(CompanyFilteredViewSet):
     queryset = Task.objects.select_related('assigned_to', 'assigned_by', 'category').all()
     serializer_class = TaskSerializer
     
+    def get_queryset(self):
+        # One aggregate for the whole page instead of a COUNT per task
+        return super().get_queryset().annotate(comments_count=Count('comments'))
+    
     def perform_create(self, serializer):
         task = serializer.save(company=self.request.user.company)
         # Send email notification asynchronously
         send_task_assignment_email.delay(task.id)
     
+    def perform_bulk_create(self, objs):
+        tasks = super().perform_bulk_create(objs)
+        for task in tasks:
+            # New tasks have no comments; saves the serializer a COUNT per task
+            task.comments_count = 0
+            transaction.on_commit(lambda task_id=task.id: send_task_assignment_email.delay(task_id))
+        return tasks
+    
     @action(detail=True, methods=['post'])
     def add_comment(self, request, pk=None):
         task = self.get_object()
@@ -155,8 +470,14 @@ class TaskScheduleViewSet(CompanyFilteredViewSet):
         schedule = serializer.save(company=self.request.user.company)
         # Create the first scheduled task
         create_scheduled_task.delay(schedule.id)
+    
+    def perform_bulk_create(self, objs):
+        schedules = super().perform_bulk_create(objs)
+        for schedule in schedules:
+            transaction.on_commit(lambda schedule_id=schedule.id: create_scheduled_task.delay(schedule_id))
+        return schedules
 
-class EmailLogViewSet(viewsets.ReadOnlyModelViewSet):
+class EmailLogViewSet(StreamingExportMixin, viewsets.ReadOnlyModelViewSet):
     queryset = EmailLog.objects.select_related('recipient', 'task').all()
     serializer_class = EmailLogSerializer
     permission_classes = [IsAuthenticated]
@@ -164,4 +485,31 @@ class EmailLogViewSet(viewsets.ReadOnlyModelViewSet):
     def get_queryset(self):
         if hasattr(self.request.user, 'company') and self.request.user.company:
             return self.queryset.filter(company=self.request.user.company)
-        return self.queryset.none()
\ No newline at end of file
+        return self.queryset.none()
+
+# Choice Metadata
+@lru_cache(maxsize=1)
+def get_choices_metadata():
+    """All TextChoices of employee.models keyed by name, and an ETag for them"""
+    choices = {}
+    for name, value in vars(employee_models).items():
+        if (inspect.isclass(value) and issubclass(value, models.Choices)
+                and value.__module__ == employee_models.__name__):
+            key = re.sub(r'(?<!^)(?=[A-Z])', '_', name.removesuffix('Choices')).lower()
+            choices[key] = [[choice, str(label)] for choice, label in value.choices]
+    body = json.dumps(choices, sort_keys=True).encode()
+    return choices, f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+class ChoicesMetadataView(APIView):
+    """Every choice list in one cacheable response"""
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        choices, etag = get_choices_metadata()
+        if etag in request.headers.get('If-None-Match', ''):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(choices)
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, max_age=3600)
+        return response
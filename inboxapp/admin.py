@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import EmailAccount, Email, EmailAttachment
+from .models import EmailAccount, Email, EmailAttachment, AttachmentBlob, MailboxStats
 
 @admin.register(EmailAccount)
 class EmailAccountAdmin(admin.ModelAdmin):
@@ -29,3 +29,14 @@ class EmailAttachmentAdmin(admin.ModelAdmin):
     list_filter = ['content_type', 'created_at']
     search_fields = ['filename', 'email__subject']
     readonly_fields = ['created_at']
+
+@admin.register(AttachmentBlob)
+class AttachmentBlobAdmin(admin.ModelAdmin):
+    list_display = ['sha256', 'size', 'ref_count', 'created_at']
+    search_fields = ['sha256']
+    readonly_fields = ['sha256', 'file', 'size', 'ref_count', 'created_at']
+
+@admin.register(MailboxStats)
+class MailboxStatsAdmin(admin.ModelAdmin):
+    list_display = ['account', 'total_count', 'unread_count', 'attachment_bytes', 'updated_at']
+    readonly_fields = ['account', 'total_count', 'unread_count', 'attachment_bytes', 'updated_at']
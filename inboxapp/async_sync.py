@@ -0,0 +1,61 @@
+import asyncio
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from .models import EmailAccount
+from .email_utils import fetch_account_emails, store_synced_emails
+
+logger = logging.getLogger(__name__)
+
+async def _sync_one(account, semaphore, executor):
+    loop = asyncio.get_running_loop()
+    saved_count = 0
+    async with semaphore:
+        chunks = fetch_account_emails(account)
+        try:
+            while True:
+                # imaplib blocks, so the IMAP round trips run on worker threads
+                chunk = await loop.run_in_executor(executor, next, chunks, None)
+                if chunk is None:
+                    break
+                # Persistence stays on one thread; SQLite allows a single writer anyway
+                saved_count += await sync_to_async(store_synced_emails)(account, *chunk)
+        finally:
+            # If storing failed midway, this logs the half-used session out
+            await loop.run_in_executor(executor, chunks.close)
+    return saved_count
+
+async def sync_accounts(accounts, per_server_limit=None, max_workers=None):
+    """Sync many accounts concurrently, at most per_server_limit per IMAP server
+
+    Returns a dict of account id to saved count, or to the exception
+    raised while syncing that account.
+    """
+    accounts = list(accounts)
+    if not accounts:
+        return {}
+
+    per_server_limit = per_server_limit or getattr(settings, 'IMAP_SYNC_PER_SERVER_LIMIT', 5)
+    max_workers = max_workers or getattr(settings, 'IMAP_SYNC_MAX_WORKERS', 32)
+    semaphores = defaultdict(lambda: asyncio.Semaphore(per_server_limit))
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(accounts))) as executor:
+        results = await asyncio.gather(
+            *(
+                _sync_one(account, semaphores[account.imap_server], executor)
+                for account in accounts
+            ),
+            return_exceptions=True
+        )
+
+    for account, result in zip(accounts, results):
+        if isinstance(result, Exception):
+            logger.error(f"Sync failed for {account}: {result}")
+    return {account.id: result for account, result in zip(accounts, results)}
+
+def sync_all_accounts(queryset=None, **kwargs):
+    """Run the concurrent sync from synchronous code (commands, celery)"""
+    accounts = list(queryset if queryset is not None else EmailAccount.objects.all())
+    return async_to_sync(sync_accounts)(accounts, **kwargs)
@@ -0,0 +1,152 @@
+import binascii
+import hashlib
+import tempfile
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import F
+from .models import AttachmentBlob
+
+BLOB_DIR = 'attachments/blobs'
+
+class SpooledAttachment:
+    """Decoded attachment content in a temp file, with size and digest
+
+    Stays in memory up to buffer_size bytes, then spills to disk, so the
+    decoded payload is never held in memory as a whole.
+    """
+
+    def __init__(self, buffer_size=None):
+        if buffer_size is None:
+            buffer_size = getattr(settings, 'INBOX_ATTACHMENT_BUFFER_SIZE', 1024 * 1024)
+        self.file = tempfile.SpooledTemporaryFile(max_size=buffer_size)
+        self.hasher = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.file.write(data)
+        self.hasher.update(data)
+        self.size += len(data)
+
+    @property
+    def sha256(self):
+        return self.hasher.hexdigest()
+
+    def open(self):
+        self.file.seek(0)
+        return self.file
+
+    def close(self):
+        self.file.close()
+
+def _encoded_chunks(payload, chunk_size):
+    for start in range(0, len(payload), chunk_size):
+        chunk = payload[start:start + chunk_size]
+        yield chunk.encode('ascii', errors='ignore') if isinstance(chunk, str) else chunk
+
+def spool_payload(payload, encoding, buffer_size=None, chunk_size=64 * 1024):
+    """Decode a transfer-encoded payload chunk by chunk into a SpooledAttachment"""
+    spool = SpooledAttachment(buffer_size)
+    encoding = (encoding or '').lower()
+
+    if encoding == 'base64':
+        pending = b''
+        for chunk in _encoded_chunks(payload, chunk_size):
+            pending += b''.join(chunk.split())
+            usable = len(pending) - len(pending) % 4
+            if usable:
+                spool.write(binascii.a2b_base64(pending[:usable]))
+                pending = pending[usable:]
+        if pending.rstrip(b'='):
+            spool.write(binascii.a2b_base64(pending + b'=' * (-len(pending) % 4)))
+    elif encoding == 'quoted-printable':
+        pending = b''
+        for chunk in _encoded_chunks(payload, chunk_size):
+            pending += chunk
+            # Only decode whole lines so soft breaks and =XX escapes stay intact
+            cut = pending.rfind(b'\n') + 1
+            if cut:
+                spool.write(binascii.a2b_qp(pending[:cut]))
+                pending = pending[cut:]
+        if pending:
+            spool.write(binascii.a2b_qp(pending))
+    else:
+        for chunk in _encoded_chunks(payload, chunk_size):
+            spool.write(chunk)
+
+    return spool
+
+def spool_part(part, buffer_size=None):
+    """Decode an email.message part's attachment payload into a spool"""
+    encoding = str(part.get('Content-Transfer-Encoding', '')).strip().lower()
+    if encoding in ('base64', 'quoted-printable'):
+        # The encoded text is already in memory; decode it incrementally
+        return spool_payload(part.get_payload(), encoding, buffer_size)
+    return spool_payload(part.get_payload(decode=True) or b'', '', buffer_size)
+
+def blob_name(digest):
+    """Storage path for a digest, fanned out so no directory gets huge"""
+    return f"{BLOB_DIR}/{digest[:2]}/{digest}"
+
+def _blob_storage():
+    return AttachmentBlob._meta.get_field('file').storage
+
+def acquire_blobs(spools):
+    """Return one AttachmentBlob per SpooledAttachment, adding a reference to each
+
+    Content already stored is not written again; new digests are saved
+    once, streamed from the spool, under a path derived from the digest.
+    """
+    digests = [spool.sha256 for spool in spools]
+    unique = dict(zip(digests, spools))
+    if not unique:
+        return []
+
+    blobs = {
+        blob.sha256: blob
+        for blob in AttachmentBlob.objects.filter(sha256__in=list(unique))
+    }
+
+    storage = _blob_storage()
+    missing = []
+    for digest, spool in unique.items():
+        if digest in blobs:
+            continue
+        name = blob_name(digest)
+        if not storage.exists(name):
+            name = storage.save(name, File(spool.open(), name=name))
+        missing.append(AttachmentBlob(sha256=digest, file=name, size=spool.size))
+
+    if missing:
+        # Another worker may have inserted the same digest meanwhile
+        AttachmentBlob.objects.bulk_create(missing, ignore_conflicts=True)
+        blobs.update({
+            blob.sha256: blob
+            for blob in AttachmentBlob.objects.filter(sha256__in=[blob.sha256 for blob in missing])
+        })
+
+    _add_references(blobs[digest].pk for digest in digests)
+    return [blobs[digest] for digest in digests]
+
+def _add_references(blob_ids, step=1):
+    ids_by_count = defaultdict(list)
+    for blob_id, count in Counter(blob_ids).items():
+        ids_by_count[count].append(blob_id)
+    for count, ids in ids_by_count.items():
+        AttachmentBlob.objects.filter(pk__in=ids).update(ref_count=F('ref_count') + count * step)
+
+def release_blobs(blob_ids):
+    """Drop one reference per id and delete blobs nobody uses anymore"""
+    blob_ids = [blob_id for blob_id in blob_ids if blob_id]
+    if not blob_ids:
+        return
+
+    with transaction.atomic():
+        _add_references(blob_ids, step=-1)
+        unused = list(AttachmentBlob.objects.filter(pk__in=set(blob_ids), ref_count__lte=0))
+        AttachmentBlob.objects.filter(pk__in=[blob.pk for blob in unused]).delete()
+
+    storage = _blob_storage()
+    for blob in unused:
+        transaction.on_commit(lambda name=blob.file.name: storage.delete(name))
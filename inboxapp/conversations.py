@@ -0,0 +1,144 @@
+import re
+from django.conf import settings
+from django.db import transaction
+from .models import Email, ThreadContainer
+
+MESSAGE_ID_RE = re.compile(r'<[^<>\s]+>')
+
+def parse_message_ids(value):
+    """Return the <message-id> tokens of an In-Reply-To/References header"""
+    return [message_id for message_id in MESSAGE_ID_RE.findall(value or '') if len(message_id) <= 255]
+
+def normalize_message_id(value):
+    """Reduce a Message-ID header to its bare <id> form"""
+    ids = parse_message_ids(value)
+    return ids[0] if ids else (value or '').strip()
+
+def thread_references(email_data):
+    """Message-IDs an email points at: References, then In-Reply-To"""
+    ids = parse_message_ids(email_data.get('references'))
+    for message_id in parse_message_ids(email_data.get('in_reply_to')):
+        if message_id not in ids:
+            ids.append(message_id)
+    return ids
+
+class UnionFind:
+    """Disjoint sets over hashable keys, with path halving"""
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, key):
+        self.parent.setdefault(key, key)
+        while self.parent[key] != key:
+            self.parent[key] = self.parent[self.parent[key]]
+            key = self.parent[key]
+        return key
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[root_b] = root_a
+
+    def groups(self):
+        groups = {}
+        for key in self.parent:
+            groups.setdefault(self.find(key), []).append(key)
+        return groups.values()
+
+def assign_threads(emails_data):
+    """Give every email dict a thread_id, merging threads it connects
+
+    Every Message-ID seen, including ones only referenced so far, has a
+    ThreadContainer row holding its thread. A thread is identified by the
+    smallest container id in it, so ids stay put as messages arrive and
+    only change when a new message joins two existing threads, in which
+    case the younger thread is folded into the older one.
+    Must run inside the transaction that saves the emails.
+    """
+    emails_data = list(emails_data)
+    if not emails_data:
+        return
+
+    batch_size = getattr(settings, 'INBOX_BULK_BATCH_SIZE', 500)
+    links = UnionFind()
+    for email_data in emails_data:
+        own_id = normalize_message_id(email_data['message_id'])
+        links.find(own_id)
+        for reference in thread_references(email_data):
+            links.union(own_id, reference)
+
+    message_ids = list(links.parent)
+    ThreadContainer.objects.bulk_create(
+        [ThreadContainer(message_id=message_id) for message_id in message_ids],
+        batch_size=batch_size,
+        ignore_conflicts=True
+    )
+    containers = {}
+    for start in range(0, len(message_ids), batch_size):
+        for container in ThreadContainer.objects.filter(message_id__in=message_ids[start:start + batch_size]):
+            containers[container.message_id] = container
+            if container.thread_id:
+                # Batch emails touching the same stored thread end up together
+                links.union(container.message_id, ('thread', container.thread_id))
+
+    thread_of = {}
+    changed = []
+    for group in links.groups():
+        group_containers = [containers[key] for key in group if isinstance(key, str)]
+        threads = {container.thread_id or container.id for container in group_containers}
+        thread_id = min(threads)
+
+        merged = threads - {thread_id}
+        if merged:
+            ThreadContainer.objects.filter(thread_id__in=merged).update(thread_id=thread_id)
+            Email.objects.filter(thread_id__in=merged).update(thread_id=thread_id)
+
+        for container in group_containers:
+            thread_of[container.message_id] = thread_id
+            if container.thread_id != thread_id:
+                container.thread_id = thread_id
+                changed.append(container)
+
+    ThreadContainer.objects.bulk_update(changed, ['thread_id'], batch_size=batch_size)
+
+    for email_data in emails_data:
+        email_data['thread_id'] = thread_of[normalize_message_id(email_data['message_id'])]
+
+def backfill_threads(emails=None):
+    """Assign thread ids to stored emails that have none, oldest first
+
+    For emails synced before threading existed; works in id-keyset
+    batches, one transaction each. Returns the number of emails threaded.
+    """
+    emails = Email.objects.all() if emails is None else emails
+    emails = emails.filter(thread_id__isnull=True).only(
+        'message_id', 'in_reply_to', 'references'
+    ).order_by('id')
+    batch_size = getattr(settings, 'INBOX_BULK_BATCH_SIZE', 500)
+
+    threaded = 0
+    last_id = 0
+    while True:
+        batch = list(emails.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return threaded
+        emails_data = [
+            {
+                'message_id': email_obj.message_id,
+                'in_reply_to': email_obj.in_reply_to,
+                'references': email_obj.references,
+            }
+            for email_obj in batch
+        ]
+        with transaction.atomic():
+            assign_threads(emails_data)
+            for email_obj, email_data in zip(batch, emails_data):
+                email_obj.thread_id = email_data['thread_id']
+            Email.objects.bulk_update(batch, ['thread_id'], batch_size=batch_size)
+        threaded += len(batch)
+        last_id = batch[-1].id
+
+def get_conversation(thread_id):
+    """All emails of a thread, oldest first, via email_thread_idx"""
+    return Email.objects.filter(thread_id=thread_id).order_by('date_received', 'id')
@@ -1,143 +1,197 @@
-import imaplib
 import email
+import logging
 import os
-from email.header import decode_header
-from django.core.files.base import ContentFile
 from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 from .models import Email, EmailAttachment, EmailAccount
+from .imap_utils import (
+    get_uidvalidity, search_new_uids, fetch_items, fetch_messages,
+    find_uid_by_message_id, parse_envelope, parse_bodystructure
+)
+from .imap_pool import get_pool, imap_connection
+from .attachments import acquire_blobs, spool_payload
+from .html_text import html_to_text
+from .mime import clean_filename, decode_mime_words, decode_part, decode_text, parse_message
+from .stats import apply_stats_delta
+from .conversations import assign_threads
+from .scoring import score_emails
+from .spam import SpamClassifier
+from .similarity import index_emails
 from datetime import datetime
-import re
-
-def clean_filename(filename):
-    """Clean filename for safe storage"""
-    return re.sub(r'[<>:"/\\|?*]', '_', filename)
-
-def decode_mime_words(s):
-    """Decode MIME encoded words"""
-    if s is None:
-        return ""
-    decoded_parts = decode_header(s)
-    decoded_string = ""
-    for part, encoding in decoded_parts:
-        if isinstance(part, bytes):
-            decoded_string += part.decode(encoding or 'utf-8', errors='ignore')
-        else:
-            decoded_string += part
-    return decoded_string
-
-def fetch_emails(username, password, imap_server='imap.gmail.com', imap_port=993):
-    """Fetch emails from IMAP server"""
+
+logger = logging.getLogger(__name__)
+
+# Items fetched per message when only the inbox listing is needed
+HEADER_FETCH_ITEMS = '(UID FLAGS ENVELOPE BODYSTRUCTURE RFC822.SIZE BODY.PEEK[HEADER.FIELDS (REFERENCES)])'
+REFERENCES_ITEM = 'BODY[HEADER.FIELDS (REFERENCES)]'
+TEXT_CONTENT_TYPES = ('text/plain', 'text/html')
+
+def parse_email_message(raw_email, uid=None, uidvalidity=None):
+    """Parse a raw RFC822 message into the dict save_emails_to_db expects"""
+    email_data = parse_message(raw_email)
+    email_data['message_id'] = email_data['message_id'] or f"unknown_{uidvalidity}_{uid}"
+    email_data['uid'] = uid
+    return email_data
+
+def parse_email_envelope(fetched, uid=None, uidvalidity=None):
+    """Build the save_emails_to_db dict from a header-only FETCH
+
+    The body is left empty and body_loaded is False; load_email_body
+    downloads it when the email is first opened.
+    """
+    envelope = parse_envelope(fetched.get('ENVELOPE'))
+    sender = (envelope['from'] or [{'name': '', 'email': 'Unknown'}])[0]
+    flags = fetched.get('FLAGS') or []
+    references = fetched.get(REFERENCES_ITEM)
+    if isinstance(references, bytes):
+        references = email.message_from_bytes(references).get('References', '')
+
     try:
-        # Connect to IMAP server
-        mail = imaplib.IMAP4_SSL(imap_server, imap_port)
-        mail.login(username, password)
-        mail.select('inbox')
+        date_received = email.utils.parsedate_to_datetime(envelope['date'])
+    except:
+        date_received = datetime.now()
 
-        # Search for all emails
-        status, messages = mail.search(None, 'ALL')
-        email_ids = messages[0].split()
+    email_data = {
+        'subject': decode_mime_words(envelope['subject']),
+        'sender': sender['email'],
+        'sender_name': decode_mime_words(sender['name']),
+        'recipient': ', '.join(address['email'] for address in envelope['to']) or 'Unknown',
+        'date_received': date_received,
+        'body_text': '',
+        'body_html': '',
+        'message_id': envelope['message_id'] or f"unknown_{uidvalidity}_{uid}",
+        'in_reply_to': envelope['in_reply_to'],
+        'references': references or '',
+        'uid': uid,
+        'is_read': '\\Seen' in flags,
+        'message_size': fetched.get('RFC822.SIZE') or 0,
+        'mime_parts': parse_bodystructure(fetched.get('BODYSTRUCTURE')),
+        'body_loaded': False,
+        'attachments': []
+    }
 
-        # Get the last 20 emails
-        recent_emails = email_ids[-20:] if len(email_ids) > 20 else email_ids
-        
-        emails_data = []
-        
-        for email_id in reversed(recent_emails):  # Most recent first
-            status, msg_data = mail.fetch(email_id, '(RFC822)')
-            
-            for response_part in msg_data:
-                if isinstance(response_part, tuple):
-                    msg = email.message_from_bytes(response_part[1])
-                    
-                    # Extract email details
-                    subject = decode_mime_words(msg.get("Subject", "No Subject"))
-                    sender = decode_mime_words(msg.get("From", "Unknown"))
-                    recipient = decode_mime_words(msg.get("To", "Unknown"))
-                    date_str = msg.get("Date", "")
-                    message_id = msg.get("Message-ID", f"unknown_{email_id.decode()}")
-                    
-                    # Parse date
-                    try:
-                        date_received = email.utils.parsedate_to_datetime(date_str)
-                    except:
-                        date_received = datetime.now()
-                    
-                    # Extract sender name and email
-                    sender_name = ""
-                    sender_email = sender
-                    if '<' in sender and '>' in sender:
-                        sender_name = sender.split('<')[0].strip().strip('"')
-                        sender_email = sender.split('<')[1].split('>')[0]
-                    
-                    # Get email body
-                    body_text = ""
-                    body_html = ""
-                    attachments = []
-                    
-                    if msg.is_multipart():
-                        for part in msg.walk():
-                            content_type = part.get_content_type()
-                            content_disposition = str(part.get("Content-Disposition"))
-                            
-                            if "attachment" in content_disposition:
-                                # Handle attachments
-                                filename = part.get_filename()
-                                if filename:
-                                    filename = decode_mime_words(filename)
-                                    filename = clean_filename(filename)
-                                    
-                                    attachment_data = {
-                                        'filename': filename,
-                                        'content': part.get_payload(decode=True),
-                                        'content_type': content_type,
-                                        'size': len(part.get_payload(decode=True))
-                                    }
-                                    attachments.append(attachment_data)
-                            
-                            elif content_type == "text/plain" and "attachment" not in content_disposition:
-                                body_text = part.get_payload(decode=True).decode('utf-8', errors='ignore')
-                            elif content_type == "text/html" and "attachment" not in content_disposition:
-                                body_html = part.get_payload(decode=True).decode('utf-8', errors='ignore')
-                    else:
-                        # Single part message
-                        content_type = msg.get_content_type()
-                        if content_type == "text/plain":
-                            body_text = msg.get_payload(decode=True).decode('utf-8', errors='ignore')
-                        elif content_type == "text/html":
-                            body_html = msg.get_payload(decode=True).decode('utf-8', errors='ignore')
-                    
-                    email_data = {
-                        'subject': subject,
-                        'sender': sender_email,
-                        'sender_name': sender_name,
-                        'recipient': recipient,
-                        'date_received': date_received,
-                        'body_text': body_text,
-                        'body_html': body_html,
-                        'message_id': message_id,
-                        'attachments': attachments
-                    }
-                    
-                    emails_data.append(email_data)
-        
-        mail.close()
-        mail.logout()
-        
-        return emails_data
+    return email_data
+
+def fetch_emails(username, password, imap_server='imap.gmail.com', imap_port=993,
+                 uidvalidity=None, last_seen_uid=0, chunk_size=None, headers_only=False):
+    """Fetch emails newer than last_seen_uid from IMAP server
+
+    A generator yielding the mailbox UIDVALIDITY and the emails of each
+    chunk, oldest first, and at least once. Messages are downloaded
+    chunk_size at a time, one FETCH per chunk, so the caller can store a
+    chunk before the next is requested and a dropped connection loses
+    only the chunk in flight. When UIDVALIDITY differs from the one
+    given, the whole mailbox is fetched again because the old UIDs no
+    longer identify messages. With headers_only, only envelope and
+    structure are fetched and the bodies are left for load_email_body.
+    Login, pool and network errors are logged and raised so callers can
+    report the failed sync.
+    """
+    if chunk_size is None:
+        chunk_size = getattr(settings, 'IMAP_FETCH_CHUNK_SIZE', 100)
+
+    try:
+        with get_pool().connection(imap_server, imap_port, username, password) as mail:
+            current_uidvalidity = get_uidvalidity(mail)
+            if current_uidvalidity != uidvalidity:
+                last_seen_uid = 0
+
+            # Only ask for UIDs we have not seen yet
+            new_uids = search_new_uids(mail, last_seen_uid)
+            if not new_uids:
+                yield current_uidvalidity, []
+
+            for start in range(0, len(new_uids), chunk_size):
+                chunk = new_uids[start:start + chunk_size]
+                if headers_only:
+                    emails_data = [
+                        parse_email_envelope(fetched, uid, current_uidvalidity)
+                        for uid, fetched in fetch_items(mail, chunk, HEADER_FETCH_ITEMS, chunk_size)
+                    ]
+                else:
+                    emails_data = [
+                        parse_email_message(raw_email, uid, current_uidvalidity)
+                        for uid, raw_email in fetch_messages(mail, chunk, chunk_size=chunk_size)
+                    ]
+                yield current_uidvalidity, emails_data
         
-    except Exception as e:
-        print(f"Error fetching emails: {str(e)}")
-        return []
+    except Exception:
+        logger.exception(f"Fetching emails for {username} from {imap_server} failed")
+        raise
+
+def create_attachments(items):
+    """Create EmailAttachment rows for (email_obj, attachment_data) pairs
+
+    Contents are stored once per SHA-256 digest and shared between rows,
+    so a file forwarded many times is only written the first time.
+    """
+    items = list(items)
+    try:
+        blobs = acquire_blobs([attachment_data['file'] for _, attachment_data in items])
+
+        attachments = [
+            EmailAttachment(
+                email=email_obj,
+                blob=blob,
+                file_path=blob.file.name,
+                filename=attachment_data['filename'],
+                file_size=attachment_data['size'],
+                content_type=attachment_data['content_type']
+            )
+            for (email_obj, attachment_data), blob in zip(items, blobs)
+        ]
+        sizes = {}
+        for attachment in attachments:
+            account_id = attachment.email.account_id
+            sizes[account_id] = sizes.get(account_id, 0) + attachment.file_size
+
+        with transaction.atomic():
+            attachments = EmailAttachment.objects.bulk_create(
+                attachments,
+                batch_size=getattr(settings, 'INBOX_BULK_BATCH_SIZE', 500)
+            )
+            for account_id, size in sizes.items():
+                apply_stats_delta(account_id, attachment_bytes=size)
+        return attachments
+    finally:
+        for _, attachment_data in items:
+            attachment_data['file'].close()
 
 def save_emails_to_db(emails_data, account):
-    """Save fetched emails to database"""
-    saved_count = 0
-    
+    """Save fetched emails to database
+
+    Runs in one transaction: a single IN query per batch finds emails we
+    already have, new emails are inserted with bulk_create, then their
+    attachment blobs are stored and the rows bulk-created as well. Thread
+    ids and the account's MailboxStats counters are updated in the same
+    transaction.
+    """
+    emails_data = list(emails_data)
+
+    # Drop duplicates within the batch, keeping the first occurrence
+    pending = {}
     for email_data in emails_data:
-        # Check if email already exists
-        if not Email.objects.filter(message_id=email_data['message_id']).exists():
-            # Create email record
-            email_obj = Email.objects.create(
+        pending.setdefault(email_data['message_id'], email_data)
+    if not pending:
+        return 0
+
+    batch_size = getattr(settings, 'INBOX_BULK_BATCH_SIZE', 500)
+    message_ids = list(pending)
+
+    with transaction.atomic():
+        # Check which emails already exist
+        for start in range(0, len(message_ids), batch_size):
+            existing = Email.objects.filter(
+                message_id__in=message_ids[start:start + batch_size]
+            ).values_list('message_id', flat=True)
+            for message_id in existing:
+                del pending[message_id]
+
+        assign_threads(pending.values())
+
+        new_emails = [
+            Email(
                 account=account,
                 subject=email_data['subject'],
                 sender=email_data['sender'],
@@ -146,26 +200,184 @@ def save_emails_to_db(emails_data, account):
                 date_received=email_data['date_received'],
                 body_text=email_data['body_text'],
                 body_html=email_data['body_html'],
-                message_id=email_data['message_id']
+                is_read=email_data.get('is_read', False),
+                message_id=email_data['message_id'],
+                uid=email_data.get('uid'),
+                message_size=email_data.get('message_size', 0),
+                mime_parts=email_data.get('mime_parts', []),
+                body_loaded=email_data.get('body_loaded', True),
+                in_reply_to=(email_data.get('in_reply_to') or '')[:255],
+                references=email_data.get('references') or '',
+                thread_id=email_data.get('thread_id')
             )
-            
-            # Save attachments
-            for attachment_data in email_data['attachments']:
-                file_content = ContentFile(attachment_data['content'])
-                
-                attachment = EmailAttachment(
-                    email=email_obj,
-                    filename=attachment_data['filename'],
-                    file_size=attachment_data['size'],
-                    content_type=attachment_data['content_type']
-                )
-                
-                attachment.file_path.save(
-                    attachment_data['filename'],
-                    file_content,
-                    save=True
-                )
-            
-            saved_count += 1
+            for email_data in pending.values()
+        ]
+        score_emails(new_emails)
+        SpamClassifier().classify_emails(new_emails)
+        Email.objects.bulk_create(new_emails, batch_size=batch_size)
+        index_emails(new_emails)
+        apply_stats_delta(
+            account.id,
+            total=len(new_emails),
+            unread=sum(1 for email_obj in new_emails if not email_obj.is_read)
+        )
+
+        # Save attachments
+        create_attachments(
+            (email_obj, attachment_data)
+            for email_obj, email_data in zip(new_emails, pending.values())
+            for attachment_data in email_data['attachments']
+        )
+
+    # Release temp files of emails that turned out to be stored already
+    for email_data in emails_data:
+        for attachment_data in email_data['attachments']:
+            attachment_data['file'].close()
     
+    return len(new_emails)
+
+def load_email_body(email_obj):
+    """Download the body and attachments of an email synced headers-only
+
+    Only the text parts and attachments listed in mime_parts are fetched,
+    with BODY.PEEK so the message is not marked as seen on the server.
+    The email row is locked while the body is fetched and stored, so
+    concurrent opens of one email download and count it once; the later
+    ones find body_loaded set and only re-read the row.
+    """
+    if email_obj.body_loaded:
+        return email_obj
+
+    with transaction.atomic():
+        locked = Email.objects.select_for_update().get(pk=email_obj.pk)
+        if locked.body_loaded:
+            email_obj.refresh_from_db()
+            return email_obj
+        _store_email_body(email_obj)
+
+    return email_obj
+
+def _store_email_body(email_obj):
+    account = email_obj.account
+    parts = [
+        part for part in email_obj.mime_parts
+        if part['attachment'] or part['content_type'] in TEXT_CONTENT_TYPES
+    ]
+    if parts:
+        query = '(UID ' + ' '.join(f"BODY.PEEK[{part['section']}]" for part in parts) + ')'
+    else:
+        query = '(UID BODY.PEEK[])'
+
+    body_text = ""
+    body_html = ""
+    attachments = []
+
+    try:
+        with imap_connection(account, readonly=True) as mail:
+            uid = email_obj.uid or find_uid_by_message_id(mail, email_obj.message_id)
+            fetched = {}
+            if uid is not None:
+                fetched = next((items for _, items in fetch_items(mail, [uid], query)), {})
+    except Exception:
+        logger.exception(f"Loading the body of email {email_obj.pk} failed")
+        return
+
+    if not fetched:
+        return
+
+    if not parts:
+        # No usable structure, fall back to parsing the whole message
+        email_data = parse_email_message(fetched.get('BODY[]') or b'', uid)
+        body_text = email_data['body_text']
+        body_html = email_data['body_html']
+        attachments = email_data['attachments']
+
+    for part in parts:
+        payload = fetched.get(f"BODY[{part['section']}]") or b''
+        if isinstance(payload, str):
+            payload = payload.encode()
+
+        if part['attachment']:
+            filename = decode_mime_words(part['filename']) or f"part-{part['section']}"
+            spool = spool_payload(payload, part['encoding'])
+            attachments.append({
+                'filename': clean_filename(filename),
+                'file': spool,
+                'content_type': part['content_type'],
+                'size': spool.size
+            })
+        elif part['content_type'] == 'text/plain':
+            body_text = decode_text(decode_part(payload, part['encoding']), part['charset'])
+        elif part['content_type'] == 'text/html':
+            body_html = decode_text(decode_part(payload, part['encoding']), part['charset'])
+
+    if not body_text and body_html:
+        body_text = html_to_text(body_html)
+
+    email_obj.body_text = body_text
+    email_obj.body_html = body_html
+    email_obj.uid = uid
+    email_obj.body_loaded = True
+    score_emails([email_obj])
+    update_fields = ['body_text', 'body_html', 'uid', 'body_loaded', 'priority_score']
+    if not email_obj.spam_feedback:
+        SpamClassifier().classify_emails([email_obj])
+        update_fields += ['spam_label', 'spam_score']
+    email_obj.save(update_fields=update_fields)
+    index_emails([email_obj])
+
+    create_attachments((email_obj, attachment_data) for attachment_data in attachments)
+
+def fetch_account_emails(account):
+    """Fetch mail above the account's high-water mark without touching the database
+
+    Yields (uidvalidity, emails_data) per chunk, see fetch_emails.
+    """
+    return fetch_emails(
+        account.email,
+        account.password,
+        account.imap_server,
+        account.imap_port,
+        uidvalidity=account.uidvalidity,
+        last_seen_uid=account.last_seen_uid,
+        headers_only=getattr(settings, 'INBOX_SYNC_HEADERS_ONLY', True)
+    )
+
+def store_synced_emails(account, uidvalidity, emails_data):
+    """Save one fetched chunk and advance the account's sync state
+
+    The account row is locked for the duration, so overlapping syncs of
+    one account (beat, a manual sync, IDLE) store one after the other and
+    the later one skips the emails the earlier one saved. last_seen_uid
+    moves past each stored chunk, so an interrupted sync resumes there.
+    """
+    if uidvalidity is None:
+        return 0
+
+    with transaction.atomic():
+        locked = EmailAccount.objects.select_for_update().get(pk=account.pk)
+        account.uidvalidity = locked.uidvalidity
+        account.last_seen_uid = locked.last_seen_uid
+
+        if uidvalidity != account.uidvalidity:
+            # Stored UIDs belong to the previous UIDVALIDITY, start over
+            account.emails.update(uid=None)
+            account.last_seen_uid = 0
+
+        saved_count = save_emails_to_db(emails_data, account)
+
+        account.uidvalidity = uidvalidity
+        account.last_seen_uid = max(
+            [account.last_seen_uid] + [email_data['uid'] for email_data in emails_data]
+        )
+        account.last_synced_at = timezone.now()
+        account.save(update_fields=['uidvalidity', 'last_seen_uid', 'last_synced_at'])
+
+    return saved_count
+
+def sync_account(account):
+    """Fetch new mail for an account and store it chunk by chunk"""
+    saved_count = 0
+    for uidvalidity, emails_data in fetch_account_emails(account):
+        saved_count += store_synced_emails(account, uidvalidity, emails_data)
     return saved_count
@@ -0,0 +1,71 @@
+import re
+from html.parser import HTMLParser
+
+# Elements whose content is never shown as text. Containers such as head
+# and svg are not listed: mail HTML often leaves them unclosed, which would
+# hide the rest of the message; their text-bearing children are covered here
+SKIP_TAGS = frozenset({'script', 'style', 'noscript', 'template', 'title'})
+# Elements that start a new line in rendered text
+BLOCK_TAGS = frozenset({
+    'address', 'article', 'aside', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt',
+    'fieldset', 'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4',
+    'h5', 'h6', 'header', 'hr', 'li', 'main', 'nav', 'ol', 'p', 'pre', 'section',
+    'table', 'tbody', 'tfoot', 'thead', 'tr', 'ul',
+})
+# Table cells are separated by a space, rows by a line break
+CELL_TAGS = frozenset({'td', 'th'})
+
+SPACES_RE = re.compile(r'[ \t\r\f\v\xa0]+')
+BLANK_LINES_RE = re.compile(r'\n{3,}')
+
+class HTMLTextExtractor(HTMLParser):
+    """Collect the visible text of an HTML document from parser events
+
+    Nothing is kept but a list of text chunks, so memory and time grow
+    linearly with the input. Block elements become line breaks.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.chunks = []
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'body':
+            # Whatever was left open before the body was never visible
+            self.skip_depth = 0
+        elif tag in SKIP_TAGS:
+            self.skip_depth += 1
+        elif tag in BLOCK_TAGS:
+            self.chunks.append('\n')
+        elif tag in CELL_TAGS:
+            self.chunks.append(' ')
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self.chunks.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            if self.skip_depth:
+                self.skip_depth -= 1
+        elif tag in BLOCK_TAGS:
+            self.chunks.append('\n')
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.chunks.append(data)
+
+    def text(self):
+        text = SPACES_RE.sub(' ', ''.join(self.chunks))
+        text = '\n'.join(line.strip() for line in text.split('\n'))
+        return BLANK_LINES_RE.sub('\n\n', text).strip()
+
+def html_to_text(html):
+    """Plain text of an HTML body, without script/style and with line breaks kept"""
+    if not html:
+        return ''
+    extractor = HTMLTextExtractor()
+    extractor.feed(html)
+    extractor.close()
+    return extractor.text()
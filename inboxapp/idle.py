@@ -0,0 +1,145 @@
+import imaplib
+import logging
+import re
+import socket
+import threading
+import time
+from django.conf import settings
+from django.db import close_old_connections
+from .email_utils import sync_account
+
+logger = logging.getLogger(__name__)
+
+EXISTS_RE = re.compile(rb'\* \d+ EXISTS')
+
+# RFC 2177: clients should re-issue IDLE at least every 29 minutes
+IDLE_REFRESH_SECONDS = 29 * 60
+
+class IdleSession:
+    """Run IMAP IDLE on a logged-in connection with the mailbox selected
+
+    imaplib has no IDLE support before Python 3.14, so the command is
+    driven over the raw socket with our own line buffer.
+    """
+
+    def __init__(self, mail, response_timeout=30):
+        self.mail = mail
+        self.response_timeout = response_timeout
+        self.buffer = b''
+
+    def _readline(self, timeout):
+        while b'\r\n' not in self.buffer:
+            self.mail.sock.settimeout(timeout)
+            chunk = self.mail.sock.recv(4096)
+            if not chunk:
+                raise imaplib.IMAP4.abort("connection closed during IDLE")
+            self.buffer += chunk
+        line, self.buffer = self.buffer.split(b'\r\n', 1)
+        return line
+
+    def wait(self, timeout, stop_event=None):
+        """IDLE until new mail arrives or timeout passes
+
+        Returns True when the server reported EXISTS.
+        """
+        tag = self.mail._new_tag()
+        self.mail.send(tag + b' IDLE\r\n')
+        line = self._readline(self.response_timeout)
+        if not line.startswith(b'+'):
+            raise imaplib.IMAP4.error(f"IDLE rejected: {line!r}")
+
+        deadline = time.monotonic() + timeout
+        has_new_mail = False
+        try:
+            while not has_new_mail and not (stop_event and stop_event.is_set()):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    # Wake up periodically so a stop request is noticed
+                    line = self._readline(min(remaining, 5))
+                except socket.timeout:
+                    continue
+                if EXISTS_RE.match(line):
+                    has_new_mail = True
+        finally:
+            self.mail.send(b'DONE\r\n')
+            while not self._readline(self.response_timeout).startswith(tag):
+                pass
+            self.mail.sock.settimeout(None)
+
+        return has_new_mail
+
+class IdleListener:
+    """Keep an IDLE session open for one account and sync on new mail
+
+    Reconnects with exponential backoff after errors and falls back to
+    polling when the server does not advertise IDLE.
+    """
+
+    def __init__(self, account, stop_event=None, on_new_mail=sync_account):
+        self.account = account
+        self.stop_event = stop_event or threading.Event()
+        self.on_new_mail = on_new_mail
+        self.refresh_seconds = getattr(settings, 'IMAP_IDLE_REFRESH_SECONDS', IDLE_REFRESH_SECONDS)
+        self.poll_interval = getattr(settings, 'IMAP_IDLE_POLL_INTERVAL', 60)
+        self.max_backoff = getattr(settings, 'IMAP_IDLE_MAX_BACKOFF', 300)
+
+    def _connect(self):
+        # A dedicated connection; pooled sessions are not held for minutes
+        mail = imaplib.IMAP4_SSL(self.account.imap_server, self.account.imap_port)
+        mail.login(self.account.email, self.account.password)
+        mail.select('inbox', readonly=True)
+        return mail
+
+    def _sync(self):
+        close_old_connections()
+        try:
+            self.account.refresh_from_db()
+            saved_count = self.on_new_mail(self.account)
+            if saved_count:
+                logger.info(f"{self.account}: {saved_count} new emails")
+        finally:
+            close_old_connections()
+
+    def _listen(self, mail):
+        # Catch up on anything that arrived while we were disconnected
+        self._sync()
+
+        if 'IDLE' not in mail.capabilities:
+            while not self.stop_event.wait(self.poll_interval):
+                mail.noop()
+                self._sync()
+            return
+
+        session = IdleSession(mail)
+        while not self.stop_event.is_set():
+            if session.wait(self.refresh_seconds, self.stop_event):
+                self._sync()
+
+    def run(self):
+        backoff = 1
+        while not self.stop_event.is_set():
+            mail = None
+            started = time.monotonic()
+            try:
+                mail = self._connect()
+                self._listen(mail)
+            except (imaplib.IMAP4.error, OSError) as e:
+                logger.warning(f"IDLE connection for {self.account} failed: {e}")
+            except Exception:
+                # A failed sync (locked database, integrity error, ...) must
+                # not end the listener; retry with the same backoff
+                logger.exception(f"IDLE listener for {self.account} failed")
+            finally:
+                if mail is not None:
+                    try:
+                        mail.logout()
+                    except Exception:
+                        pass
+
+            if time.monotonic() - started > self.max_backoff:
+                backoff = 1
+            if self.stop_event.wait(backoff):
+                break
+            backoff = min(backoff * 2, self.max_backoff)
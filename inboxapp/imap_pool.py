@@ -0,0 +1,215 @@
+import atexit
+import imaplib
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+class PoolTimeout(Exception):
+    """No IMAP session became available within the acquire timeout"""
+
+class PooledSession:
+    def __init__(self, mail, password):
+        self.mail = mail
+        self.password = password
+        self.last_used = time.monotonic()
+
+    def logout(self):
+        try:
+            self.mail.logout()
+        except Exception:
+            pass
+
+class IMAPConnectionPool:
+    """Process-wide pool of logged-in IMAP4_SSL sessions
+
+    Sessions are keyed by (server, port, username) and handed out one
+    caller at a time. Idle sessions are logged out after idle_timeout,
+    checked with NOOP when unused for noop_interval, and no more than
+    max_sessions_per_server are open against one server at once.
+    """
+
+    def __init__(self, idle_timeout=300, noop_interval=60,
+                 max_sessions_per_server=10, acquire_timeout=30):
+        self.idle_timeout = idle_timeout
+        self.noop_interval = noop_interval
+        self.max_sessions_per_server = max_sessions_per_server
+        self.acquire_timeout = acquire_timeout
+        self._idle = defaultdict(list)
+        self._open_per_server = defaultdict(int)
+        self._condition = threading.Condition()
+
+    def _connect(self, server, port, username, password):
+        mail = imaplib.IMAP4_SSL(server, port)
+        mail.login(username, password)
+        return PooledSession(mail, password)
+
+    def _is_alive(self, session):
+        if time.monotonic() - session.last_used < self.noop_interval:
+            return True
+        try:
+            status, data = session.mail.noop()
+            return status == 'OK'
+        except Exception:
+            return False
+
+    def _discard(self, server, session):
+        """Log out a checked-out session and free its slot"""
+        session.logout()
+        with self._condition:
+            self._open_per_server[server] -= 1
+            self._condition.notify()
+
+    def _take(self, server, sessions, session):
+        """Remove an idle session to be logged out; call with the lock held"""
+        sessions.remove(session)
+        self._open_per_server[server] -= 1
+        return session
+
+    def _take_expired(self):
+        """Sessions idle longer than idle_timeout; call with the lock held"""
+        now = time.monotonic()
+        return [
+            self._take(key[0], sessions, session)
+            for key, sessions in self._idle.items()
+            for session in list(sessions)
+            if now - session.last_used > self.idle_timeout
+        ]
+
+    def _take_idle_on_server(self, server):
+        """An idle session of another account on the same server; call with the lock held"""
+        for key, sessions in self._idle.items():
+            if key[0] == server and sessions:
+                return self._take(server, sessions, sessions[0])
+        return None
+
+    def acquire(self, server, port, username, password):
+        key = (server, port, username)
+        deadline = time.monotonic() + self.acquire_timeout
+
+        while True:
+            # Only bookkeeping happens under the lock; NOOP, LOGOUT and LOGIN
+            # are network round trips and must not stall other accounts
+            session = None
+            to_close = []
+            reserved = False
+            timed_out = False
+
+            with self._condition:
+                to_close.extend(self._take_expired())
+
+                idle = self._idle[key]
+                while idle and session is None:
+                    if idle[-1].password == password:
+                        session = idle.pop()
+                    else:
+                        to_close.append(self._take(server, idle, idle[-1]))
+
+                if session is None:
+                    if self._open_per_server[server] >= self.max_sessions_per_server:
+                        evicted = self._take_idle_on_server(server)
+                        if evicted is not None:
+                            to_close.append(evicted)
+                    if self._open_per_server[server] < self.max_sessions_per_server:
+                        # Reserve the slot before logging in outside the lock
+                        self._open_per_server[server] += 1
+                        reserved = True
+                    elif not to_close:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            timed_out = True
+                        else:
+                            self._condition.wait(remaining)
+
+                if to_close:
+                    self._condition.notify_all()
+
+            for closing in to_close:
+                closing.logout()
+
+            if timed_out:
+                raise PoolTimeout(f"No IMAP session available for {server}")
+            if session is not None:
+                if self._is_alive(session):
+                    return session
+                self._discard(server, session)
+            elif reserved:
+                break
+
+        try:
+            return self._connect(server, port, username, password)
+        except Exception:
+            with self._condition:
+                self._open_per_server[server] -= 1
+                self._condition.notify()
+            raise
+
+    def release(self, server, port, username, session, discard=False):
+        if discard:
+            self._discard(server, session)
+            return
+        with self._condition:
+            session.last_used = time.monotonic()
+            self._idle[(server, port, username)].append(session)
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self, server, port, username, password, mailbox='inbox', readonly=False):
+        """Borrow a logged-in session with mailbox selected
+
+        The session goes back to the pool on exit, or is logged out if
+        the block raised, since its protocol state is then unknown.
+        """
+        session = self.acquire(server, port, username, password)
+        try:
+            if mailbox:
+                session.mail.select(mailbox, readonly=readonly)
+            yield session.mail
+        except BaseException:
+            self.release(server, port, username, session, discard=True)
+            raise
+        else:
+            self.release(server, port, username, session)
+
+    def close_all(self):
+        with self._condition:
+            to_close = [
+                self._take(key[0], sessions, session)
+                for key, sessions in self._idle.items()
+                for session in list(sessions)
+            ]
+            self._condition.notify_all()
+        for session in to_close:
+            session.logout()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Return the process-wide pool, configured from settings"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = IMAPConnectionPool(
+                idle_timeout=getattr(settings, 'IMAP_POOL_IDLE_TIMEOUT', 300),
+                noop_interval=getattr(settings, 'IMAP_POOL_NOOP_INTERVAL', 60),
+                max_sessions_per_server=getattr(settings, 'IMAP_POOL_MAX_SESSIONS_PER_SERVER', 10),
+                acquire_timeout=getattr(settings, 'IMAP_POOL_ACQUIRE_TIMEOUT', 30),
+            )
+            atexit.register(_pool.close_all)
+        return _pool
+
+def imap_connection(account, mailbox='inbox', readonly=False):
+    """Borrow a pooled session for an EmailAccount"""
+    return get_pool().connection(
+        account.imap_server,
+        account.imap_port,
+        account.email,
+        account.password,
+        mailbox=mailbox,
+        readonly=readonly
+    )
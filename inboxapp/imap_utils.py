@@ -0,0 +1,249 @@
+import re
+from django.conf import settings
+
+STATUS_UIDVALIDITY_RE = re.compile(rb'UIDVALIDITY (\d+)')
+LITERAL_RE = re.compile(rb'\{\d+\}$')
+
+def get_uidvalidity(mail, mailbox='inbox'):
+    """Return the UIDVALIDITY of the selected mailbox"""
+    status, data = mail.response('UIDVALIDITY')
+    if data and data[0]:
+        return int(data[0])
+
+    # Some servers only report it through STATUS
+    status, data = mail.status(mailbox, '(UIDVALIDITY)')
+    if status == 'OK' and data and data[0]:
+        match = STATUS_UIDVALIDITY_RE.search(data[0])
+        if match:
+            return int(match.group(1))
+    return None
+
+def search_new_uids(mail, last_seen_uid=0):
+    """Return UIDs above the high-water mark, oldest first"""
+    status, data = mail.uid('search', None, 'UID', f'{last_seen_uid + 1}:*')
+    if status != 'OK' or not data or not data[0]:
+        return []
+
+    # "n:*" always matches the highest UID, even when it is below n
+    uids = sorted(int(uid) for uid in data[0].split())
+    return [uid for uid in uids if uid > last_seen_uid]
+
+def format_uid_set(uids):
+    """Format UIDs as an IMAP sequence set, collapsing runs into ranges"""
+    ranges = []
+    for uid in sorted(set(uids)):
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ','.join(
+        str(start) if start == end else f'{start}:{end}'
+        for start, end in ranges
+    )
+
+def _tokenize_text(text):
+    """Split the non-literal part of an IMAP response into tokens"""
+    position = 0
+    length = len(text)
+    while position < length:
+        char = text[position:position + 1]
+        if char in (b' ', b'\r', b'\n'):
+            position += 1
+        elif char in (b'(', b')'):
+            yield char.decode(), None
+            position += 1
+        elif char == b'"':
+            value = bytearray()
+            position += 1
+            while position < length and text[position:position + 1] != b'"':
+                if text[position:position + 1] == b'\\':
+                    position += 1
+                value += text[position:position + 1]
+                position += 1
+            yield 'string', bytes(value)
+            position += 1
+        else:
+            start = position
+            depth = 0
+            while position < length:
+                char = text[position:position + 1]
+                if char == b'[':
+                    depth += 1
+                elif char == b']':
+                    depth -= 1
+                elif depth == 0 and char in (b' ', b'(', b')'):
+                    break
+                position += 1
+            yield 'atom', text[start:position]
+
+def _tokenize(data):
+    """Yield tokens from an imaplib FETCH response, literals included"""
+    for response_part in data:
+        if isinstance(response_part, tuple):
+            text, literal = response_part
+            text = LITERAL_RE.sub(b'', text)
+        else:
+            text, literal = response_part, None
+        yield from _tokenize_text(text)
+        if literal is not None:
+            yield 'literal', literal
+
+def _token_value(kind, value):
+    if kind == 'literal':
+        return value
+    if kind == 'string':
+        return value.decode('utf-8', errors='replace')
+    if value.upper() == b'NIL':
+        return None
+    if value.isdigit():
+        return int(value)
+    return value.decode('utf-8', errors='replace')
+
+def parse_fetch_response(data):
+    """Parse the data of a FETCH response into one dict per message
+
+    Keys are the item names as returned by the server (UID, FLAGS,
+    ENVELOPE, BODY[TEXT], ...), values are nested lists, ints, str,
+    None for NIL, and bytes for literals.
+    """
+    stack = []
+    for kind, value in _tokenize(data):
+        if kind == '(':
+            stack.append([])
+        elif kind == ')':
+            if not stack:
+                continue
+            closed = stack.pop()
+            if stack:
+                stack[-1].append(closed)
+            else:
+                yield {
+                    str(closed[index]).upper(): closed[index + 1]
+                    for index in range(0, len(closed) - 1, 2)
+                }
+        elif stack:
+            # Sequence numbers outside the item list are not needed
+            stack[-1].append(_token_value(kind, value))
+
+def _text(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='replace')
+    return '' if value is None else str(value)
+
+def _parse_addresses(addresses):
+    return [
+        {
+            'name': _text(name),
+            'email': f"{_text(mailbox)}@{_text(host)}" if host else _text(mailbox),
+        }
+        for name, route, mailbox, host in (addresses or [])
+    ]
+
+def parse_envelope(envelope):
+    """Turn an ENVELOPE list into a dict of raw header values"""
+    fields = list(envelope or []) + [None] * 10
+    date, subject, from_, sender, reply_to, to, cc, bcc, in_reply_to, message_id = fields[:10]
+    return {
+        'date': _text(date),
+        'subject': _text(subject),
+        'from': _parse_addresses(from_),
+        'to': _parse_addresses(to),
+        'cc': _parse_addresses(cc),
+        'in_reply_to': _text(in_reply_to),
+        'message_id': _text(message_id),
+    }
+
+def _params_dict(params):
+    if not isinstance(params, list):
+        return {}
+    return {
+        str(params[index]).lower(): params[index + 1]
+        for index in range(0, len(params) - 1, 2)
+    }
+
+def parse_bodystructure(structure, section=''):
+    """Flatten a BODYSTRUCTURE into a list of leaf part descriptions
+
+    Each part carries its section number for BODY[section] fetches.
+    """
+    if not isinstance(structure, list) or not structure:
+        return []
+
+    if isinstance(structure[0], list):
+        parts = []
+        for index, child in enumerate(structure, start=1):
+            if not isinstance(child, list):
+                break  # multipart subtype and extension data follow the children
+            child_section = f'{section}.{index}' if section else str(index)
+            parts.extend(parse_bodystructure(child, child_section))
+        return parts
+
+    fields = structure + [None] * 12
+    maintype = str(fields[0]).lower()
+    subtype = str(fields[1]).lower()
+    params = _params_dict(fields[2])
+
+    # Position of the disposition depends on the body type (RFC 3501 7.4.2)
+    if maintype == 'text':
+        disposition = fields[9]
+    elif maintype == 'message' and subtype == 'rfc822':
+        disposition = fields[11]
+    else:
+        disposition = fields[8]
+
+    disposition_type = ''
+    disposition_params = {}
+    if isinstance(disposition, list) and disposition:
+        disposition_type = str(disposition[0]).lower()
+        disposition_params = _params_dict(disposition[1] if len(disposition) > 1 else None)
+
+    filename = _text(disposition_params.get('filename') or params.get('name'))
+    return [{
+        'section': section or '1',
+        'content_type': f'{maintype}/{subtype}',
+        'charset': _text(params.get('charset')),
+        'encoding': str(fields[5] or '7bit').lower(),
+        'size': fields[6] if isinstance(fields[6], int) else 0,
+        'filename': filename,
+        'attachment': disposition_type == 'attachment' or (
+            bool(filename) and maintype not in ('text', 'multipart')
+        ),
+    }]
+
+def fetch_items(mail, uids, items, chunk_size=None):
+    """Run one UID FETCH per chunk of UIDs, yielding (uid, items)
+
+    Responses are parsed and yielded as they are read, so callers can
+    start processing the first chunk before the next one is requested.
+    """
+    if chunk_size is None:
+        chunk_size = getattr(settings, 'IMAP_FETCH_CHUNK_SIZE', 100)
+
+    uids = list(uids)
+    for start in range(0, len(uids), chunk_size):
+        chunk = uids[start:start + chunk_size]
+        status, data = mail.uid('fetch', format_uid_set(chunk), items)
+        if status != 'OK':
+            continue
+
+        for fetched in parse_fetch_response(data):
+            if isinstance(fetched.get('UID'), int):
+                yield fetched['UID'], fetched
+
+def fetch_messages(mail, uids, chunk_size=None):
+    """Fetch full RFC822 messages in batches, yielding (uid, raw_email)"""
+    for uid, fetched in fetch_items(mail, uids, '(UID RFC822)', chunk_size):
+        if isinstance(fetched.get('RFC822'), bytes):
+            yield uid, fetched['RFC822']
+
+def quote_string(value):
+    """Quote a value as an IMAP quoted string (RFC 3501 section 4.3)"""
+    value = value.replace('\r', '').replace('\n', '')
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def find_uid_by_message_id(mail, message_id):
+    """Look up the UID of a message by its Message-ID header"""
+    status, data = mail.uid('search', None, 'HEADER', 'Message-ID', quote_string(message_id))
+    if status != 'OK' or not data or not data[0]:
+        return None
+    return int(data[0].split()[-1])
@@ -0,0 +1,116 @@
+import re
+from functools import lru_cache
+import numpy as np
+from django.conf import settings
+
+WORD_RE = re.compile(r'\w+')
+
+DEFAULT_KEYWORD_SETS = {
+    'spam': ['win', 'free', 'offer', 'click'],
+    'ham': ['meeting', 'schedule', 'project'],
+    'urgency': ['urgent', 'action', 'important'],
+}
+
+def tokenize(text):
+    """Lowercased word tokens, the same split keyword_frequency always used"""
+    return WORD_RE.findall((text or '').lower())
+
+class KeywordMatcher:
+    """Aho-Corasick automaton over word tokens
+
+    Built once from {label: [keyword or phrase, ...]}; a text is then
+    matched against every set in one pass over its tokens. Matching is
+    on whole words, so "free" does not hit "freedom", and a phrase such
+    as "act now" matches those two words in sequence.
+    """
+
+    def __init__(self, keyword_sets):
+        self.labels = list(keyword_sets)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+        for label_index, label in enumerate(self.labels):
+            # A keyword listed twice counts twice, as keyword_frequency always did
+            for keyword in keyword_sets[label]:
+                pattern = tuple(tokenize(keyword))
+                if pattern:
+                    self._add(pattern, label_index)
+        self._link()
+
+    def _add(self, pattern, label_index):
+        node = 0
+        for token in pattern:
+            child = self._goto[node].get(token)
+            if child is None:
+                child = len(self._goto)
+                self._goto[node][token] = child
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = child
+        self._out[node].append(label_index)
+
+    def _link(self):
+        # Breadth-first, so a node's failure target is always finished first
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for token, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and token not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(token, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+                queue.append(child)
+
+    def match(self, text):
+        """Return a list of hit counts, one per label in self.labels"""
+        goto, fail, out = self._goto, self._fail, self._out
+        counts = [0] * len(self.labels)
+        node = 0
+        for token in tokenize(text):
+            while node and token not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(token, 0)
+            for label_index in out[node]:
+                counts[label_index] += 1
+        return counts
+
+    def count(self, text):
+        """Return {label: hits} for one text"""
+        return dict(zip(self.labels, self.match(text)))
+
+    def count_many(self, texts):
+        """Return an (n_texts, n_labels) array of hit counts"""
+        texts = list(texts)
+        counts = np.zeros((len(texts), len(self.labels)), dtype=np.int64)
+        for row, text in enumerate(texts):
+            counts[row] = self.match(text)
+        return counts
+
+    def column(self, label):
+        return self.labels.index(label)
+
+def get_keyword_sets():
+    return getattr(settings, 'INBOX_KEYWORD_SETS', DEFAULT_KEYWORD_SETS)
+
+@lru_cache(maxsize=1)
+def _default_matcher():
+    return KeywordMatcher(get_keyword_sets())
+
+def get_matcher():
+    """Matcher for the configured INBOX_KEYWORD_SETS, built once per process"""
+    return _default_matcher()
+
+@lru_cache(maxsize=128)
+def get_keywords_matcher(keywords):
+    """Matcher for one tuple of keywords under the label 'keywords', built once"""
+    return KeywordMatcher({'keywords': keywords})
+
+def classify_texts(texts, matcher=None):
+    """Label each text 'spam' when spam keywords outnumber ham ones, else 'important'"""
+    matcher = matcher or get_matcher()
+    counts = matcher.count_many(texts)
+    is_spam = counts[:, matcher.column('spam')] > counts[:, matcher.column('ham')]
+    return ['spam' if spam else 'important' for spam in is_spam.tolist()]
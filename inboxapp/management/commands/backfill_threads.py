@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from inboxapp.conversations import backfill_threads
+from inboxapp.models import Email
+
+class Command(BaseCommand):
+    help = "Assign thread ids to emails stored before conversation threading"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--account', type=int, action='append', help="Only thread these account ids")
+
+    def handle(self, *args, **options):
+        emails = Email.objects.all()
+        if options['account']:
+            emails = emails.filter(account_id__in=options['account'])
+        threaded = backfill_threads(emails)
+        self.stdout.write(self.style.SUCCESS(f"Threaded {threaded} emails"))
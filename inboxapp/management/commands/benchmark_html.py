@@ -0,0 +1,65 @@
+import random
+import re
+import time
+from bs4 import BeautifulSoup
+from django.core.management.base import BaseCommand
+from inboxapp.html_text import html_to_text
+
+def clean_text(text):
+    clean = re.sub(r'<[^>]+>', '', text)
+    return re.sub(r'\s+', ' ', clean).strip()
+
+def marketing_email(rng, products):
+    """A table-layout newsletter with inline styles, a style block, tracking pixels and a script"""
+    rows = []
+    for index in range(products):
+        rows.append(
+            f'<tr><td style="padding:12px;border-bottom:1px solid #eee" width="120">'
+            f'<a href="https://shop.example.com/p/{index}?utm_source=newsletter&amp;utm_medium=email">'
+            f'<img src="https://cdn.example.com/{index}.jpg" width="120" alt="Product {index}"></a></td>'
+            f'<td style="font-family:Arial,sans-serif;font-size:14px;color:#333">'
+            f'<h3 style="margin:0 0 6px 0">Product {index} &ndash; {rng.choice(["New", "Sale", "Limited"])}</h3>'
+            f'<p style="margin:0">Only &euro;{rng.randint(5, 500)}.99 &nbsp;<s>&euro;{rng.randint(500, 900)}</s></p>'
+            f'<p style="margin:6px 0 0 0">{" ".join(rng.choice(["great", "deal", "today", "free", "shipping", "exclusive"]) for _ in range(25))}</p>'
+            f'</td></tr>'
+        )
+    return (
+        '<!DOCTYPE html><html><head><meta charset="utf-8"><title>Deals</title>'
+        '<style>' + 'td{padding:0} .btn{background:#f60;color:#fff} ' * 50 + '</style></head>'
+        '<body style="margin:0;background:#f4f4f4">'
+        '<table width="100%" cellpadding="0" cellspacing="0"><tr><td align="center">'
+        '<table width="600" cellpadding="0" cellspacing="0" style="background:#fff">'
+        + ''.join(rows) +
+        '</table></td></tr></table>'
+        '<img src="https://track.example.com/open.gif?id=123" width="1" height="1">'
+        '<script>window.dataLayer = window.dataLayer || []; function gtag(){dataLayer.push(arguments);}</script>'
+        '<p style="font-size:11px;color:#999">You received this email because you subscribed. '
+        '<a href="https://example.com/unsubscribe">Unsubscribe</a></p></body></html>'
+    )
+
+class Command(BaseCommand):
+    help = "Compare html_to_text with BeautifulSoup get_text() + clean_text on large marketing emails"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--emails', type=int, default=50)
+        parser.add_argument('--products', type=int, default=200, help="Product rows per email")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        corpus = [marketing_email(rng, options['products']) for _ in range(options['emails'])]
+        size = sum(len(html) for html in corpus)
+        self.stdout.write(f"{len(corpus)} emails, {size / len(corpus) / 1024:.0f} KiB average")
+
+        paths = (
+            ('BeautifulSoup', lambda html: clean_text(BeautifulSoup(html, "html.parser").get_text())),
+            ('html_to_text', html_to_text),
+        )
+        for name, convert in paths:
+            started = time.perf_counter()
+            for html in corpus:
+                convert(html)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{name:>14}: {len(corpus) / elapsed:,.1f} emails/s, {size / elapsed / 2 ** 20:,.1f} MiB/s"
+            )
@@ -0,0 +1,86 @@
+import email
+import email.utils
+import time
+from pathlib import Path
+from bs4 import BeautifulSoup
+from django.core.management.base import BaseCommand
+from inboxapp.attachments import spool_part
+from inboxapp.mime import decode_mime_words, parse_message
+
+FIXTURES = Path(__file__).resolve().parents[2] / 'fixtures' / 'eml'
+
+def legacy_parse(raw_email):
+    """The previous path: parse_email_message, then get_body and save_attachments walks"""
+    msg = email.message_from_bytes(raw_email)
+
+    # parse_email_message: headers, then bodies decoded as utf-8
+    decode_mime_words(msg.get("Subject", "No Subject"))
+    decode_mime_words(msg.get("From", "Unknown"))
+    decode_mime_words(msg.get("To", "Unknown"))
+    try:
+        email.utils.parsedate_to_datetime(msg.get("Date", ""))
+    except (TypeError, ValueError):
+        pass
+
+    body_text = body_html = ""
+    for part in msg.walk():
+        content_type = part.get_content_type()
+        content_disposition = str(part.get("Content-Disposition"))
+        if "attachment" in content_disposition:
+            if part.get_filename():
+                spool_part(part).close()
+        elif content_type == "text/plain":
+            body_text = part.get_payload(decode=True).decode('utf-8', errors='ignore')
+        elif content_type == "text/html":
+            body_html = part.get_payload(decode=True).decode('utf-8', errors='ignore')
+
+    # get_body, parsing HTML with BeautifulSoup
+    body = None
+    for part in msg.walk():
+        if part.get_content_type() == "text/plain":
+            body = part.get_payload(decode=True).decode(errors="ignore")
+            break
+        if part.get_content_type() == "text/html":
+            body = BeautifulSoup(part.get_payload(decode=True).decode(errors="ignore"), "html.parser").get_text()
+            break
+
+    # save_attachments
+    for part in msg.walk():
+        if part.get_content_maintype() != 'multipart' and part.get('Content-Disposition') and part.get_filename():
+            part.get_payload(decode=True)
+
+    return body_text, body_html, body
+
+def single_pass(raw_email):
+    parsed = parse_message(raw_email)
+    for attachment in parsed['attachments']:
+        attachment['file'].close()
+    return parsed
+
+class Command(BaseCommand):
+    help = "Compare MIME parse throughput of the single-pass parser with the old three-walk path"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=str(FIXTURES), help="Directory of .eml files")
+        parser.add_argument('--iterations', type=int, default=200)
+
+    def handle(self, *args, **options):
+        corpus = [path.read_bytes() for path in sorted(Path(options['path']).glob('*.eml'))]
+        if not corpus:
+            self.stderr.write(f"No .eml files in {options['path']}")
+            return
+
+        # Warm up both paths before timing
+        for raw_email in corpus:
+            legacy_parse(raw_email)
+            single_pass(raw_email)
+
+        total = len(corpus) * options['iterations']
+        self.stdout.write(f"{len(corpus)} messages x {options['iterations']} iterations")
+        for name, parse in (('legacy (3 walks)', legacy_parse), ('single pass', single_pass)):
+            started = time.perf_counter()
+            for _ in range(options['iterations']):
+                for raw_email in corpus:
+                    parse(raw_email)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"{name:>18}: {total / elapsed:,.0f} messages/s")
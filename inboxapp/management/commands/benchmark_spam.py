@@ -0,0 +1,77 @@
+import random
+import time
+from collections import Counter
+from django.core.management.base import BaseCommand
+from inboxapp.models import SpamModel
+from inboxapp.spam import SPAM, HAM, SpamClassifier
+
+class InMemorySpamClassifier(SpamClassifier):
+    """Same scoring, with the term tables held in dicts instead of the database"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.counts = {}
+        self.model = SpamModel(pk=1)
+
+    def add(self, terms, label):
+        column = 0 if label == SPAM else 1
+        for term, count in terms.items():
+            if term not in self.counts:
+                self.counts[term] = [0, 0]
+                self.model.vocabulary_size += 1
+            self.counts[term][column] += count
+        setattr(self.model, f'{label}_messages', getattr(self.model, f'{label}_messages') + 1)
+        setattr(self.model, f'{label}_tokens', getattr(self.model, f'{label}_tokens') + sum(terms.values()))
+
+    def totals(self):
+        return self.model
+
+    def term_counts(self, terms):
+        return {term: tuple(self.counts[term]) for term in terms if term in self.counts}
+
+class Command(BaseCommand):
+    help = "Measure spam classification throughput on a synthetic corpus (no database writes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=20000, help="Messages to classify")
+        parser.add_argument('--train', type=int, default=2000, help="Messages to train on")
+        parser.add_argument('--vocabulary', type=int, default=5000)
+        parser.add_argument('--length', type=int, default=150, help="Words per message")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        vocabulary = [f'w{index}' for index in range(options['vocabulary'])]
+        # Each class favours its own third of the vocabulary
+        third = len(vocabulary) // 3
+        favoured = {SPAM: vocabulary[:third], HAM: vocabulary[third:2 * third]}
+
+        def message(label):
+            words = [
+                rng.choice(favoured[label]) if rng.random() < 0.3 else rng.choice(vocabulary)
+                for _ in range(options['length'])
+            ]
+            return Counter(words)
+
+        classifier = InMemorySpamClassifier()
+        for _ in range(options['train']):
+            label = rng.choice((SPAM, HAM))
+            classifier.add(message(label), label)
+
+        labels = [rng.choice((SPAM, HAM)) for _ in range(options['messages'])]
+        corpus = [message(label) for label in labels]
+
+        batch_size = options['batch_size']
+        correct = 0
+        started = time.perf_counter()
+        for start in range(0, len(corpus), batch_size):
+            probabilities = classifier.predict(corpus[start:start + batch_size])
+            for probability, label in zip(probabilities.tolist(), labels[start:start + batch_size]):
+                correct += (probability >= 0.5) == (label == SPAM)
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            f"Classified {len(corpus)} messages in {elapsed:.2f}s "
+            f"({len(corpus) / elapsed:,.0f} messages/s), accuracy {correct / len(corpus):.1%}"
+        )
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from inboxapp.models import Email
+from inboxapp.similarity import index_emails
+
+class Command(BaseCommand):
+    help = "Rebuild MinHash signatures and LSH buckets used for related emails"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--account', type=int, action='append', help="Only index these account ids")
+
+    def handle(self, *args, **options):
+        emails = Email.objects.only('account_id', 'subject', 'body_text').order_by('id')
+        if options['account']:
+            emails = emails.filter(account_id__in=options['account'])
+
+        batch_size = getattr(settings, 'INBOX_BULK_BATCH_SIZE', 500)
+        last_id = 0
+        indexed = 0
+        while True:
+            batch = list(emails.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            indexed += index_emails(batch)
+            last_id = batch[-1].id
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} emails"))
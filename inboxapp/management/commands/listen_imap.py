@@ -0,0 +1,38 @@
+import threading
+from django.core.management.base import BaseCommand
+from inboxapp.idle import IdleListener
+from inboxapp.models import EmailAccount
+
+class Command(BaseCommand):
+    help = "Hold an IMAP IDLE session per email account and ingest new mail as it arrives"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--account', type=int, action='append', help="Only listen for these account ids")
+
+    def handle(self, *args, **options):
+        accounts = EmailAccount.objects.all()
+        if options['account']:
+            accounts = accounts.filter(id__in=options['account'])
+
+        stop_event = threading.Event()
+        threads = [
+            threading.Thread(
+                target=IdleListener(account, stop_event).run,
+                name=f"idle-{account.id}",
+                daemon=True
+            )
+            for account in accounts
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f"Listening for new mail on {len(threads)} accounts")
+
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping listeners")
+            stop_event.set()
+            for thread in threads:
+                thread.join(timeout=10)
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from inboxapp.search import rebuild_search_index
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index over emails"
+
+    def handle(self, *args, **options):
+        rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt"))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from inboxapp.models import EmailAccount
+from inboxapp.stats import recompute_stats
+
+class Command(BaseCommand):
+    help = "Recompute per-account total/unread/attachment counters from scratch"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--account', type=int, action='append', help="Only repair these account ids")
+
+    def handle(self, *args, **options):
+        accounts = EmailAccount.objects.all()
+        if options['account']:
+            accounts = accounts.filter(id__in=options['account'])
+        repaired = recompute_stats(accounts)
+        self.stdout.write(self.style.SUCCESS(f"Recomputed stats for {repaired} accounts"))
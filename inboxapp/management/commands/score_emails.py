@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from inboxapp.models import Email
+from inboxapp.scoring import score_queryset
+
+class Command(BaseCommand):
+    help = "Recompute stored priority scores, e.g. after changing keywords or senders"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--account', type=int, action='append', help="Only score these account ids")
+
+    def handle(self, *args, **options):
+        emails = Email.objects.all()
+        if options['account']:
+            emails = emails.filter(account_id__in=options['account'])
+        scored = score_queryset(emails)
+        self.stdout.write(self.style.SUCCESS(f"Scored {scored} emails"))
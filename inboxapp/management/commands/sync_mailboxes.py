@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from inboxapp.async_sync import sync_all_accounts
+from inboxapp.models import EmailAccount
+
+class Command(BaseCommand):
+    help = "Sync all email accounts concurrently from this process"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--account', type=int, action='append', help="Only sync these account ids")
+        parser.add_argument('--per-server', type=int, help="Concurrent syncs allowed per IMAP server")
+        parser.add_argument('--workers', type=int, help="Threads used for IMAP I/O")
+
+    def handle(self, *args, **options):
+        accounts = EmailAccount.objects.all()
+        if options['account']:
+            accounts = accounts.filter(id__in=options['account'])
+
+        results = sync_all_accounts(
+            accounts,
+            per_server_limit=options['per_server'],
+            max_workers=options['workers']
+        )
+
+        failed = 0
+        for account_id, result in results.items():
+            if isinstance(result, Exception):
+                failed += 1
+                self.stderr.write(f"Account {account_id}: {result}")
+            else:
+                self.stdout.write(f"Account {account_id}: {result} new emails")
+        self.stdout.write(self.style.SUCCESS(f"Synced {len(results) - failed} of {len(results)} accounts"))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-17 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inboxapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailaccount',
+            name='last_synced_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-17 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inboxapp', '0002_emailaccount_last_synced_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailaccount',
+            name='uidvalidity',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='emailaccount',
+            name='last_seen_uid',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='email',
+            name='uid',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-17 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inboxapp', '0003_incremental_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='email',
+            name='message_size',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='email',
+            name='mime_parts',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='email',
+            name='body_loaded',
+            field=models.BooleanField(default=True),
+        ),
+    ]
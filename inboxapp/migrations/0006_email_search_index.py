@@ -0,0 +1,68 @@
+# Generated by Django 5.2.3 on 2026-10-17 11:30
+
+from django.db import migrations
+
+SQLITE_CREATE = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS inboxapp_email_fts USING fts5(
+        subject, sender, sender_name, body_text,
+        content='inboxapp_email', content_rowid='id'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS inboxapp_email_fts_ai AFTER INSERT ON inboxapp_email BEGIN
+        INSERT INTO inboxapp_email_fts(rowid, subject, sender, sender_name, body_text)
+        VALUES (new.id, new.subject, new.sender, new.sender_name, new.body_text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS inboxapp_email_fts_ad AFTER DELETE ON inboxapp_email BEGIN
+        INSERT INTO inboxapp_email_fts(inboxapp_email_fts, rowid, subject, sender, sender_name, body_text)
+        VALUES ('delete', old.id, old.subject, old.sender, old.sender_name, old.body_text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS inboxapp_email_fts_au AFTER UPDATE OF subject, sender, sender_name, body_text ON inboxapp_email BEGIN
+        INSERT INTO inboxapp_email_fts(inboxapp_email_fts, rowid, subject, sender, sender_name, body_text)
+        VALUES ('delete', old.id, old.subject, old.sender, old.sender_name, old.body_text);
+        INSERT INTO inboxapp_email_fts(rowid, subject, sender, sender_name, body_text)
+        VALUES (new.id, new.subject, new.sender, new.sender_name, new.body_text);
+    END""",
+    "INSERT INTO inboxapp_email_fts(inboxapp_email_fts) VALUES ('rebuild')",
+]
+
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS inboxapp_email_fts_au",
+    "DROP TRIGGER IF EXISTS inboxapp_email_fts_ad",
+    "DROP TRIGGER IF EXISTS inboxapp_email_fts_ai",
+    "DROP TABLE IF EXISTS inboxapp_email_fts",
+]
+
+PG_CREATE = [
+    "CREATE INDEX IF NOT EXISTS inboxapp_email_search_idx ON inboxapp_email USING GIN ("
+    "to_tsvector('english', coalesce(subject, '') || ' ' || coalesce(sender, '') || ' ' "
+    "|| coalesce(sender_name, '') || ' ' || coalesce(body_text, '')))",
+]
+
+PG_DROP = [
+    "DROP INDEX IF EXISTS inboxapp_email_search_idx",
+]
+
+
+def run(schema_editor, sqlite_statements, pg_statements):
+    vendor = schema_editor.connection.vendor
+    statements = sqlite_statements if vendor == 'sqlite' else pg_statements if vendor == 'postgresql' else []
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def forwards(apps, schema_editor):
+    run(schema_editor, SQLITE_CREATE, PG_CREATE)
+
+
+def backwards(apps, schema_editor):
+    run(schema_editor, SQLITE_DROP, PG_DROP)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inboxapp', '0005_attachmentblob'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
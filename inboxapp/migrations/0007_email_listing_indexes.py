@@ -0,0 +1,29 @@
+# Generated by Django 5.2.3 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inboxapp', '0006_email_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='email',
+            options={'ordering': ['-date_received', '-id']},
+        ),
+        migrations.AddIndex(
+            model_name='email',
+            index=models.Index(fields=['-date_received', '-id'], name='email_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='email',
+            index=models.Index(fields=['account', '-date_received', '-id'], name='email_account_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='email',
+            index=models.Index(fields=['account', 'is_read', '-date_received', '-id'], name='email_account_unread_idx'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.3 on 2026-10-17 12:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def populate_stats(apps, schema_editor):
+    EmailAccount = apps.get_model('inboxapp', 'EmailAccount')
+    Email = apps.get_model('inboxapp', 'Email')
+    EmailAttachment = apps.get_model('inboxapp', 'EmailAttachment')
+    MailboxStats = apps.get_model('inboxapp', 'MailboxStats')
+
+    counts = {
+        row['account_id']: row
+        for row in Email.objects.values('account_id').annotate(
+            total=Count('id'), unread=Count('id', filter=Q(is_read=False))
+        )
+    }
+    sizes = dict(
+        EmailAttachment.objects.values('email__account_id')
+        .annotate(size=Sum('file_size'))
+        .values_list('email__account_id', 'size')
+    )
+    MailboxStats.objects.bulk_create([
+        MailboxStats(
+            account_id=account_id,
+            total_count=counts.get(account_id, {}).get('total', 0),
+            unread_count=counts.get(account_id, {}).get('unread', 0),
+            attachment_bytes=sizes.get(account_id) or 0,
+        )
+        for account_id in EmailAccount.objects.values_list('id', flat=True)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inboxapp', '0007_email_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MailboxStats',
+            fields=[
+                ('account', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='inboxapp.emailaccount')),
+                ('total_count', models.IntegerField(default=0)),
+                ('unread_count', models.IntegerField(default=0)),
+                ('attachment_bytes', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Mailbox stats',
+            },
+        ),
+        migrations.RunPython(populate_stats, migrations.RunPython.noop),
+    ]
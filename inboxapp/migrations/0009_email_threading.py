@@ -0,0 +1,40 @@
+# Generated by Django 5.2.3 on 2026-10-17 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inboxapp', '0008_mailboxstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThreadContainer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message_id', models.CharField(max_length=255, unique=True)),
+                ('thread_id', models.BigIntegerField(blank=True, db_index=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='email',
+            name='in_reply_to',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='email',
+            name='references',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='email',
+            name='thread_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='email',
+            index=models.Index(fields=['thread_id', 'date_received', 'id'], name='email_thread_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.3 on 2026-10-17 13:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inboxapp', '0009_email_threading'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='email',
+            name='priority_score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='email',
+            index=models.Index(fields=['account', '-priority_score', '-date_received'], name='email_account_priority_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inboxapp', '0010_email_priority_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpamModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('spam_messages', models.PositiveIntegerField(default=0)),
+                ('ham_messages', models.PositiveIntegerField(default=0)),
+                ('spam_tokens', models.BigIntegerField(default=0)),
+                ('ham_tokens', models.BigIntegerField(default=0)),
+                ('vocabulary_size', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SpamTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=100, unique=True)),
+                ('spam_count', models.PositiveIntegerField(default=0)),
+                ('ham_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='email',
+            name='spam_feedback',
+            field=models.CharField(blank=True, choices=[('spam', 'Spam'), ('ham', 'Not spam')], max_length=4),
+        ),
+        migrations.AddField(
+            model_name='email',
+            name='spam_label',
+            field=models.CharField(blank=True, choices=[('spam', 'Spam'), ('ham', 'Not spam')], max_length=4),
+        ),
+        migrations.AddField(
+            model_name='email',
+            name='spam_score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
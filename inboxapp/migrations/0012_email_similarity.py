@@ -0,0 +1,34 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inboxapp', '0011_email_spam_classifier'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailSignature',
+            fields=[
+                ('email', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='inboxapp.email')),
+                ('minhash', models.BinaryField()),
+                ('vector', models.BinaryField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SimilarityBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.BigIntegerField()),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='inboxapp.emailaccount')),
+                ('email', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similarity_buckets', to='inboxapp.email')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['account', 'key'], name='similarity_bucket_idx')],
+            },
+        ),
+    ]
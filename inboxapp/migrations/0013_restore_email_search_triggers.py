@@ -0,0 +1,46 @@
+# Generated by Django 5.2.3 on 2026-10-17 14:30
+
+from django.db import migrations
+
+# On SQLite, AddField/AlterField in 0009-0011 rebuilt inboxapp_email, which
+# drops the triggers created by 0006. Recreate them and re-read every email
+# into the index. Any later migration that rebuilds inboxapp_email on SQLite
+# has to do the same.
+SQLITE_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS inboxapp_email_fts_ai",
+    "DROP TRIGGER IF EXISTS inboxapp_email_fts_ad",
+    "DROP TRIGGER IF EXISTS inboxapp_email_fts_au",
+    """CREATE TRIGGER inboxapp_email_fts_ai AFTER INSERT ON inboxapp_email BEGIN
+        INSERT INTO inboxapp_email_fts(rowid, subject, sender, sender_name, body_text)
+        VALUES (new.id, new.subject, new.sender, new.sender_name, new.body_text);
+    END""",
+    """CREATE TRIGGER inboxapp_email_fts_ad AFTER DELETE ON inboxapp_email BEGIN
+        INSERT INTO inboxapp_email_fts(inboxapp_email_fts, rowid, subject, sender, sender_name, body_text)
+        VALUES ('delete', old.id, old.subject, old.sender, old.sender_name, old.body_text);
+    END""",
+    """CREATE TRIGGER inboxapp_email_fts_au AFTER UPDATE OF subject, sender, sender_name, body_text ON inboxapp_email BEGIN
+        INSERT INTO inboxapp_email_fts(inboxapp_email_fts, rowid, subject, sender, sender_name, body_text)
+        VALUES ('delete', old.id, old.subject, old.sender, old.sender_name, old.body_text);
+        INSERT INTO inboxapp_email_fts(rowid, subject, sender, sender_name, body_text)
+        VALUES (new.id, new.subject, new.sender, new.sender_name, new.body_text);
+    END""",
+    "INSERT INTO inboxapp_email_fts(inboxapp_email_fts) VALUES ('rebuild')",
+]
+
+
+def restore_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in SQLITE_TRIGGERS:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inboxapp', '0012_email_similarity'),
+    ]
+
+    operations = [
+        migrations.RunPython(restore_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,109 @@
+import base64
+import email
+import email.utils
+import quopri
+import re
+from datetime import datetime
+from email.header import decode_header
+from .attachments import spool_part
+from .html_text import html_to_text
+
+def clean_filename(filename):
+    """Clean filename for safe storage"""
+    return re.sub(r'[<>:"/\\|?*]', '_', filename)
+
+def decode_text(content, charset=None):
+    """Decode bytes with the declared charset, falling back to utf-8"""
+    try:
+        return content.decode(charset or 'utf-8', errors='replace')
+    except LookupError:
+        return content.decode('utf-8', errors='replace')
+
+def decode_mime_words(s):
+    """Decode MIME encoded words"""
+    if s is None:
+        return ""
+    return ''.join(
+        decode_text(part, encoding) if isinstance(part, bytes) else part
+        for part, encoding in decode_header(str(s))
+    )
+
+def decode_part(payload, encoding):
+    """Undo the Content-Transfer-Encoding of a fetched MIME part"""
+    if encoding == 'base64':
+        return base64.b64decode(payload)
+    if encoding == 'quoted-printable':
+        return quopri.decodestring(payload)
+    return payload
+
+def parse_headers(msg):
+    """Decoded envelope headers of an email.message.Message"""
+    sender_name, sender = email.utils.parseaddr(decode_mime_words(msg.get("From", "Unknown")))
+
+    try:
+        date_received = email.utils.parsedate_to_datetime(msg.get("Date", ""))
+    except (TypeError, ValueError):
+        date_received = datetime.now()
+
+    return {
+        'subject': decode_mime_words(msg.get("Subject", "No Subject")),
+        'sender': sender or "Unknown",
+        'sender_name': sender_name,
+        'recipient': decode_mime_words(msg.get("To", "Unknown")),
+        'date_received': date_received,
+        'message_id': str(msg.get("Message-ID", "")).strip(),
+        'in_reply_to': str(msg.get("In-Reply-To", "")),
+        'references': str(msg.get("References", "")),
+    }
+
+def walk_message(msg, with_attachments=True):
+    """Walk the MIME tree once and decode every part once
+
+    Returns body_text and body_html (the first part of each type, decoded
+    with its declared charset) and, unless with_attachments is False,
+    attachments as dicts holding a SpooledAttachment under 'file'. HTML-only
+    messages get body_text extracted from the HTML.
+    """
+    body_text = None
+    body_html = None
+    attachments = []
+
+    for index, part in enumerate(msg.walk()):
+        if part.is_multipart():
+            continue
+
+        content_type = part.get_content_type()
+        disposition = part.get_content_disposition()
+        filename = part.get_filename()
+
+        if disposition == 'attachment' or (filename and part.get_content_maintype() != 'text'):
+            if with_attachments:
+                filename = clean_filename(decode_mime_words(filename) or f"part-{index}")
+                spool = spool_part(part)
+                attachments.append({
+                    'filename': filename,
+                    'file': spool,
+                    'content_type': content_type,
+                    'size': spool.size
+                })
+        elif content_type == 'text/plain' and body_text is None:
+            body_text = decode_text(part.get_payload(decode=True) or b'', part.get_content_charset())
+        elif content_type == 'text/html' and body_html is None:
+            body_html = decode_text(part.get_payload(decode=True) or b'', part.get_content_charset())
+
+    if body_text is None and body_html:
+        body_text = html_to_text(body_html)
+
+    return {
+        'body_text': body_text or '',
+        'body_html': body_html or '',
+        'attachments': attachments,
+    }
+
+def parse_message(raw_email, with_attachments=True):
+    """Parse raw RFC822 bytes into headers, bodies and attachments in one pass"""
+    msg = email.message_from_bytes(raw_email)
+    parsed = parse_headers(msg)
+    parsed.update(walk_message(msg, with_attachments))
+    parsed['message_size'] = len(raw_email)
+    return parsed
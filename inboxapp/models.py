@@ -1,18 +1,60 @@
 from django.db import models
 from django.utils import timezone
 
-class EmailAccount(models.Model):
+def _deferred_stats():
+    from .stats import deferred_stats
+    return deferred_stats()
+
+class DeferredStatsQuerySet(models.QuerySet):
+    """Bulk deletes update MailboxStats once per account, not once per row"""
+
+    def delete(self):
+        with _deferred_stats():
+            return super().delete()
+
+class DeferredStatsDeleteMixin:
+    """The same for deleting one instance that cascades to many rows"""
+
+    def delete(self, *args, **kwargs):
+        with _deferred_stats():
+            return super().delete(*args, **kwargs)
+
+class EmailAccount(DeferredStatsDeleteMixin, models.Model):
     name = models.CharField(max_length=100)
     email = models.EmailField()
     password = models.CharField(max_length=255)
     imap_server = models.CharField(max_length=100, default='imap.gmail.com')
     imap_port = models.IntegerField(default=993)
+    uidvalidity = models.BigIntegerField(null=True, blank=True)
+    last_seen_uid = models.BigIntegerField(default=0)
+    last_synced_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = DeferredStatsQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.name} ({self.email})"
 
-class Email(models.Model):
+class MailboxStats(models.Model):
+    """Denormalized per-account counters, kept in step by the ingest path"""
+    account = models.OneToOneField(EmailAccount, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    total_count = models.IntegerField(default=0)
+    unread_count = models.IntegerField(default=0)
+    attachment_bytes = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'Mailbox stats'
+
+    def __str__(self):
+        return f"{self.account}: {self.unread_count}/{self.total_count}"
+
+SPAM_LABEL_CHOICES = [
+    ('spam', 'Spam'),
+    ('ham', 'Not spam'),
+]
+
+class Email(DeferredStatsDeleteMixin, models.Model):
     account = models.ForeignKey(EmailAccount, on_delete=models.CASCADE, related_name='emails')
     subject = models.CharField(max_length=500)
     sender = models.EmailField()
@@ -23,22 +65,105 @@ class Email(models.Model):
     body_html = models.TextField(blank=True)
     is_read = models.BooleanField(default=False)
     message_id = models.CharField(max_length=255, unique=True)
+    uid = models.BigIntegerField(null=True, blank=True)
+    message_size = models.IntegerField(default=0)
+    mime_parts = models.JSONField(default=list, blank=True)
+    body_loaded = models.BooleanField(default=True)
+    in_reply_to = models.CharField(max_length=255, blank=True)
+    references = models.TextField(blank=True)
+    thread_id = models.BigIntegerField(null=True, blank=True)
+    priority_score = models.FloatField(default=0)
+    spam_label = models.CharField(max_length=4, choices=SPAM_LABEL_CHOICES, blank=True)
+    spam_score = models.FloatField(null=True, blank=True)
+    spam_feedback = models.CharField(max_length=4, choices=SPAM_LABEL_CHOICES, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = DeferredStatsQuerySet.as_manager()
+
     class Meta:
-        ordering = ['-date_received']
+        ordering = ['-date_received', '-id']
+        indexes = [
+            # Conversation view, oldest first
+            models.Index(fields=['thread_id', 'date_received', 'id'], name='email_thread_idx'),
+            # Ranking by priority
+            models.Index(fields=['account', '-priority_score', '-date_received'], name='email_account_priority_idx'),
+            # Inbox listing, optionally per account / unread, newest first
+            models.Index(fields=['-date_received', '-id'], name='email_date_idx'),
+            models.Index(fields=['account', '-date_received', '-id'], name='email_account_date_idx'),
+            models.Index(fields=['account', 'is_read', '-date_received', '-id'], name='email_account_unread_idx'),
+        ]
 
     def __str__(self):
         return f"{self.subject} - {self.sender}"
 
+class ThreadContainer(models.Model):
+    """A Message-ID seen in the mailbox or referenced by a message in it"""
+    message_id = models.CharField(max_length=255, unique=True)
+    thread_id = models.BigIntegerField(null=True, blank=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.message_id} (thread {self.thread_id})"
+
+class EmailSignature(models.Model):
+    """MinHash signature and hashed term vector of an email, as raw arrays"""
+    email = models.OneToOneField(Email, on_delete=models.CASCADE, primary_key=True, related_name='signature')
+    minhash = models.BinaryField()
+    vector = models.BinaryField()
+
+class SimilarityBucket(models.Model):
+    """LSH band key of an email; emails sharing a key are compared"""
+    key = models.BigIntegerField()
+    email = models.ForeignKey(Email, on_delete=models.CASCADE, related_name='similarity_buckets')
+    account = models.ForeignKey(EmailAccount, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', 'key'], name='similarity_bucket_idx'),
+        ]
+
+class SpamTerm(models.Model):
+    """Token counts of one term in messages marked spam / not spam"""
+    term = models.CharField(max_length=100, unique=True)
+    spam_count = models.PositiveIntegerField(default=0)
+    ham_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.term} ({self.spam_count}/{self.ham_count})"
+
+class SpamModel(models.Model):
+    """Corpus totals of the spam classifier, kept in a single row"""
+    spam_messages = models.PositiveIntegerField(default=0)
+    ham_messages = models.PositiveIntegerField(default=0)
+    spam_tokens = models.BigIntegerField(default=0)
+    ham_tokens = models.BigIntegerField(default=0)
+    vocabulary_size = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.spam_messages} spam / {self.ham_messages} ham"
+
+class AttachmentBlob(models.Model):
+    """Attachment content stored once per SHA-256 digest"""
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to='attachments/blobs/')
+    size = models.BigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.sha256} ({self.ref_count} refs)"
+
 class EmailAttachment(models.Model):
     email = models.ForeignKey(Email, related_name='attachments', on_delete=models.CASCADE)
+    blob = models.ForeignKey(AttachmentBlob, related_name='attachments', on_delete=models.PROTECT, null=True, blank=True)
     filename = models.CharField(max_length=255)
     file_path = models.FileField(upload_to='attachments/')
     file_size = models.IntegerField()
     content_type = models.CharField(max_length=100)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = DeferredStatsQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.filename} - {self.email.subject}"
 
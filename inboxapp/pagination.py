@@ -0,0 +1,37 @@
+import base64
+from datetime import datetime
+from django.db.models import Q
+
+def encode_cursor(email_obj):
+    """Opaque cursor pointing just past an email in newest-first order"""
+    raw = f"{email_obj.date_received.isoformat()}|{email_obj.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    """Return (date_received, id) from a cursor, or None if it is invalid"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        date_str, email_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(date_str), int(email_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+def keyset_page(queryset, cursor=None, page_size=25):
+    """Return one page of emails older than the cursor, and the next cursor
+
+    Seeks on (date_received, id) instead of using OFFSET, so every page
+    is a range scan on the listing indexes no matter how deep it is.
+    """
+    queryset = queryset.order_by('-date_received', '-id')
+
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        date_received, email_id = position
+        queryset = queryset.filter(
+            Q(date_received__lt=date_received)
+            | Q(date_received=date_received, id__lt=email_id)
+        )
+
+    emails = list(queryset[:page_size + 1])
+    next_cursor = encode_cursor(emails[page_size - 1]) if len(emails) > page_size else None
+    return emails[:page_size], next_cursor
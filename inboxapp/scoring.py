@@ -0,0 +1,80 @@
+import re
+import numpy as np
+from django.conf import settings
+from .models import Email
+from .keywords import KeywordMatcher, get_matcher, tokenize
+
+ADDRESS_RE = re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)*')
+
+DEFAULT_IMPORTANT_SENDERS = ['boss@company.com', 'hr@company.com']
+
+class PriorityScorer:
+    """Score emails in batches on a 0-10 scale
+
+    Score = min(words / 50, 5) + 5 for an important sender
+    + 2 per priority keyword in the subject, capped at 10.
+    Each text is tokenized once; the arithmetic runs over NumPy arrays.
+    """
+
+    def __init__(self, keywords=None, important_senders=None):
+        # Subject keywords default to the 'urgency' set of INBOX_KEYWORD_SETS
+        if keywords is None:
+            self.matcher = get_matcher()
+        else:
+            self.matcher = KeywordMatcher({'urgency': keywords})
+        self.urgency_column = self.matcher.column('urgency')
+        if important_senders is None:
+            important_senders = getattr(settings, 'INBOX_IMPORTANT_SENDERS', DEFAULT_IMPORTANT_SENDERS)
+        self.important_senders = frozenset(sender.lower() for sender in important_senders)
+
+    def is_important_sender(self, sender):
+        sender = (sender or '').lower()
+        return any(address in self.important_senders for address in ADDRESS_RE.findall(sender))
+
+    def score(self, rows):
+        """Score (subject, sender, body) tuples, returning a float array"""
+        rows = list(rows)
+        count = len(rows)
+        word_counts = np.fromiter(
+            (len(tokenize(body)) for _, _, body in rows), dtype=np.float64, count=count
+        )
+        important = np.fromiter(
+            (self.is_important_sender(sender) for _, sender, _ in rows), dtype=np.float64, count=count
+        )
+        keywords = self.matcher.count_many(subject for subject, _, _ in rows)[:, self.urgency_column]
+
+        scores = np.minimum(word_counts / 50, 5) + important * 5 + keywords * 2
+        return np.minimum(scores, 10)
+
+def score_emails(emails, scorer=None):
+    """Set priority_score on Email instances in memory"""
+    emails = list(emails)
+    scorer = scorer or PriorityScorer()
+    scores = scorer.score((email_obj.subject, email_obj.sender, email_obj.body_text) for email_obj in emails)
+    for email_obj, score in zip(emails, scores.tolist()):
+        email_obj.priority_score = score
+    return emails
+
+def score_queryset(queryset, scorer=None, batch_size=None):
+    """Recompute and store priority_score for every email in a queryset"""
+    scorer = scorer or PriorityScorer()
+    if batch_size is None:
+        batch_size = getattr(settings, 'INBOX_BULK_BATCH_SIZE', 500)
+
+    # Walk the ids in order rather than holding a cursor open while updating
+    queryset = queryset.order_by('id').values_list('id', 'subject', 'sender', 'body_text')
+    last_id = 0
+    scored = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return scored
+
+        scores = scorer.score(row[1:] for row in batch)
+        Email.objects.bulk_update(
+            [Email(id=row[0], priority_score=score) for row, score in zip(batch, scores.tolist())],
+            ['priority_score'],
+            batch_size=batch_size
+        )
+        last_id = batch[-1][0]
+        scored += len(batch)
@@ -0,0 +1,147 @@
+import re
+from django.db import connection
+from django.db.models import Q
+from .models import Email
+
+FTS_TABLE = 'inboxapp_email_fts'
+
+# Column weights for bm25(): subject, sender, sender_name, body_text
+FTS_WEIGHTS = (10.0, 5.0, 5.0, 1.0)
+
+# Must match the expression of the GIN index created in the migration
+PG_DOCUMENT = (
+    "to_tsvector('english', coalesce(subject, '') || ' ' || coalesce(sender, '') || ' ' "
+    "|| coalesce(sender_name, '') || ' ' || coalesce(body_text, ''))"
+)
+
+# Same triggers as migrations 0006 and 0013; rebuild_search_index recreates
+# them in case a later table rebuild on SQLite dropped them again
+SQLITE_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON inboxapp_email BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, subject, sender, sender_name, body_text)
+        VALUES (new.id, new.subject, new.sender, new.sender_name, new.body_text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON inboxapp_email BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, subject, sender, sender_name, body_text)
+        VALUES ('delete', old.id, old.subject, old.sender, old.sender_name, old.body_text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF subject, sender, sender_name, body_text ON inboxapp_email BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, subject, sender, sender_name, body_text)
+        VALUES ('delete', old.id, old.subject, old.sender, old.sender_name, old.body_text);
+        INSERT INTO {FTS_TABLE}(rowid, subject, sender, sender_name, body_text)
+        VALUES (new.id, new.subject, new.sender, new.sender_name, new.body_text);
+    END""",
+]
+
+def rebuild_search_index():
+    """Re-read every email into the index (SQLite; Postgres indexes are maintained by the database)"""
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            for statement in SQLITE_TRIGGERS:
+                cursor.execute(statement)
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+def _fts_query(query):
+    # Quote every term so user input cannot inject FTS5 syntax
+    terms = re.findall(r'\w+', query)
+    return ' '.join(f'"{term}"' for term in terms)
+
+class SearchResults:
+    """Ranked search hits that fetch only the requested slice
+
+    Supports count() and slicing so it can be handed to a Paginator.
+    """
+
+    def __init__(self, query, account_id=None):
+        self.query = query.strip()
+        self.account_id = account_id
+        self.vendor = connection.vendor
+        self._count = None
+
+    def _match_sql(self):
+        """Return (sql, order_by, params) for the backend's full-text match"""
+        account_filter = ""
+        params = []
+        if self.vendor == 'sqlite':
+            match = _fts_query(self.query)
+            if not match:
+                return None
+            weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+            if self.account_id:
+                account_filter = "AND e.account_id = %s"
+            sql = (
+                f"SELECT e.id, bm25({FTS_TABLE}, {weights}) AS rank "
+                f"FROM {FTS_TABLE} JOIN inboxapp_email e ON e.id = {FTS_TABLE}.rowid "
+                f"WHERE {FTS_TABLE} MATCH %s {account_filter} "
+            )
+            params.append(match)
+            order = "ORDER BY rank, e.date_received DESC"
+        elif self.vendor == 'postgresql':
+            if self.account_id:
+                account_filter = "AND account_id = %s"
+            sql = (
+                f"SELECT id, ts_rank({PG_DOCUMENT}, query) AS rank "
+                f"FROM inboxapp_email, websearch_to_tsquery('english', %s) query "
+                f"WHERE {PG_DOCUMENT} @@ query {account_filter} "
+            )
+            params.append(self.query)
+            order = "ORDER BY rank DESC, date_received DESC"
+        else:
+            return None
+        if self.account_id:
+            params.append(self.account_id)
+        return sql, order, params
+
+    def _fallback_queryset(self):
+        emails = Email.objects.filter(
+            Q(subject__icontains=self.query) | Q(sender__icontains=self.query)
+            | Q(sender_name__icontains=self.query) | Q(body_text__icontains=self.query)
+        )
+        if self.account_id:
+            emails = emails.filter(account_id=self.account_id)
+        return emails
+
+    def count(self):
+        if self._count is None:
+            self._count = 0
+            if self.query and self.vendor not in ('sqlite', 'postgresql'):
+                self._count = self._fallback_queryset().count()
+            elif self.query:
+                match = self._match_sql()
+                if match is not None:
+                    sql, order, params = match
+                    with connection.cursor() as cursor:
+                        cursor.execute(f"SELECT COUNT(*) FROM ({sql}) hits", params)
+                        self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        stop = index.stop if index.stop is not None else self.count()
+        if not self.query or stop <= start:
+            return []
+
+        if self.vendor not in ('sqlite', 'postgresql'):
+            return list(self._fallback_queryset()[start:stop])
+
+        match = self._match_sql()
+        if match is None:
+            return []
+
+        sql, order, params = match
+        with connection.cursor() as cursor:
+            cursor.execute(f"{sql} {order} LIMIT %s OFFSET %s", params + [stop - start, start])
+            ids = [row[0] for row in cursor.fetchall()]
+
+        emails = Email.objects.only(
+            'subject', 'sender', 'sender_name', 'date_received', 'is_read', 'account_id'
+        ).in_bulk(ids)
+        return [emails[email_id] for email_id in ids if email_id in emails]
+
+def search_emails(query, account_id=None):
+    return SearchResults(query, account_id)
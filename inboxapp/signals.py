@@ -0,0 +1,25 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from .models import Email, EmailAttachment
+from .attachments import release_blobs
+from .stats import subtract_deleted_attachment, subtract_deleted_email
+
+@receiver(post_delete, sender=EmailAttachment)
+def release_attachment_blob(sender, instance, **kwargs):
+    """Garbage-collect the shared blob when its last attachment goes away"""
+    release_blobs([instance.blob_id])
+
+# Deleting an account cascades to its MailboxStats row too, so these never
+# rebuild a missing row; recompute_stats repairs anything else. Bulk and
+# cascading deletes run inside deferred_stats() (see models.DeferredStatsQuerySet)
+# and cost one UPDATE per account instead of one per row
+
+@receiver(post_delete, sender=EmailAttachment)
+def subtract_attachment_bytes(sender, instance, **kwargs):
+    """Take a deleted attachment's size off its account's counter"""
+    subtract_deleted_attachment(instance)
+
+@receiver(post_delete, sender=Email)
+def subtract_email_counts(sender, instance, **kwargs):
+    """Take a deleted email off its account's total and unread counters"""
+    subtract_deleted_email(instance)
@@ -0,0 +1,144 @@
+import hashlib
+import zlib
+from collections import Counter
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from .models import Email, EmailSignature, SimilarityBucket
+from .keywords import tokenize
+
+# Changing any of these invalidates stored signatures (manage.py index_similarity)
+NUM_PERMUTATIONS = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERMUTATIONS // BANDS
+VECTOR_DIMENSIONS = 512
+SHINGLE_SIZE = 3
+
+# Multiply-shift hashing: (a * x + b) wraps mod 2**64 and the high 32 bits
+# are kept, so each (a, b) orders the shingles differently (a must be odd)
+_rng = np.random.RandomState(1234567)
+PERM_A = _rng.randint(0, 1 << 63, size=NUM_PERMUTATIONS, dtype=np.int64).astype(np.uint64) | np.uint64(1)
+PERM_B = _rng.randint(0, 1 << 63, size=NUM_PERMUTATIONS, dtype=np.int64).astype(np.uint64)
+
+def _hash32(value):
+    return zlib.crc32(value.encode('utf-8'))
+
+def shingles(tokens):
+    """Word n-grams of a message; short messages fall back to single words"""
+    if len(tokens) < SHINGLE_SIZE:
+        return set(tokens)
+    return {' '.join(tokens[index:index + SHINGLE_SIZE]) for index in range(len(tokens) - SHINGLE_SIZE + 1)}
+
+def minhash(shingle_set):
+    """MinHash signature of a set of shingles as a uint32 array"""
+    hashes = np.fromiter((_hash32(shingle) for shingle in shingle_set), dtype=np.uint64, count=len(shingle_set))
+    permuted = (np.outer(hashes, PERM_A) + PERM_B) >> np.uint64(32)
+    return permuted.min(axis=0).astype(np.uint32)
+
+def term_vector(tokens):
+    """Hashed, sublinear term-frequency vector, L2-normalized, as float16"""
+    vector = np.zeros(VECTOR_DIMENSIONS, dtype=np.float32)
+    for term, count in Counter(tokens).items():
+        vector[_hash32(term) % VECTOR_DIMENSIONS] += 1 + np.log(count)
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    return vector.astype(np.float16)
+
+def band_keys(signature):
+    """One LSH bucket key per band; emails sharing a key are candidates"""
+    keys = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(bytes([band]) + rows.tobytes(), digest_size=8).digest()
+        keys.append(int.from_bytes(digest, 'big', signed=True))
+    return keys
+
+def index_emails(emails):
+    """Store signatures and LSH buckets for Email instances, replacing old ones"""
+    emails = list(emails)
+    batch_size = getattr(settings, 'INBOX_BULK_BATCH_SIZE', 500)
+
+    signatures = []
+    buckets = []
+    for email_obj in emails:
+        tokens = tokenize(f"{email_obj.subject} {email_obj.body_text}")
+        if not tokens:
+            continue
+        signature = minhash(shingles(tokens))
+        signatures.append(EmailSignature(
+            email=email_obj,
+            minhash=signature.tobytes(),
+            vector=term_vector(tokens).tobytes()
+        ))
+        buckets.extend(
+            SimilarityBucket(key=key, email=email_obj, account_id=email_obj.account_id)
+            for key in band_keys(signature)
+        )
+
+    with transaction.atomic():
+        email_ids = [email_obj.id for email_obj in emails]
+        SimilarityBucket.objects.filter(email_id__in=email_ids).delete()
+        EmailSignature.objects.filter(email_id__in=email_ids).delete()
+        EmailSignature.objects.bulk_create(signatures, batch_size=batch_size)
+        SimilarityBucket.objects.bulk_create(buckets, batch_size=batch_size)
+    return len(signatures)
+
+def _candidates(email_obj, limit):
+    signature = EmailSignature.objects.filter(email_id=email_obj.id).first()
+    if signature is None:
+        return None, []
+
+    minhash_values = np.frombuffer(signature.minhash, dtype=np.uint32)
+    candidate_ids = list(
+        SimilarityBucket.objects.filter(
+            account_id=email_obj.account_id,
+            key__in=band_keys(minhash_values)
+        )
+        .exclude(email_id=email_obj.id)
+        .values('email_id')
+        .annotate(shared=Count('id'))
+        .order_by('-shared')
+        .values_list('email_id', flat=True)[:limit]
+    )
+    return signature, candidate_ids
+
+def related_emails(email_obj, k=10, candidate_limit=500):
+    """Top-k related emails as (email, cosine, jaccard) triples
+
+    Candidates come from the LSH buckets, so only emails sharing at least
+    one band are compared; they are re-ranked by cosine of term vectors.
+    """
+    signature, candidate_ids = _candidates(email_obj, candidate_limit)
+    if not candidate_ids:
+        return []
+
+    rows = list(
+        EmailSignature.objects.filter(email_id__in=candidate_ids)
+        .values_list('email_id', 'minhash', 'vector')
+    )
+    ids = [row[0] for row in rows]
+    minhashes = np.frombuffer(b''.join(row[1] for row in rows), dtype=np.uint32).reshape(len(rows), NUM_PERMUTATIONS)
+    vectors = np.frombuffer(b''.join(row[2] for row in rows), dtype=np.float16).reshape(len(rows), VECTOR_DIMENSIONS)
+
+    query_minhash = np.frombuffer(signature.minhash, dtype=np.uint32)
+    query_vector = np.frombuffer(signature.vector, dtype=np.float16).astype(np.float32)
+
+    cosines = vectors.astype(np.float32) @ query_vector
+    jaccards = (minhashes == query_minhash).mean(axis=1)
+
+    top = np.argsort(-cosines, kind='stable')[:k]
+    emails = Email.objects.in_bulk([ids[index] for index in top])
+    return [
+        (emails[ids[index]], float(cosines[index]), float(jaccards[index]))
+        for index in top if ids[index] in emails
+    ]
+
+def near_duplicates(email_obj, threshold=0.8, candidate_limit=500):
+    """Emails whose estimated Jaccard similarity is at least threshold"""
+    return [
+        (related, cosine, jaccard)
+        for related, cosine, jaccard in related_emails(email_obj, k=candidate_limit, candidate_limit=candidate_limit)
+        if jaccard >= threshold
+    ]
@@ -0,0 +1,158 @@
+from collections import Counter
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from .models import Email, SpamModel, SpamTerm
+from .keywords import tokenize, classify_texts
+
+SPAM = 'spam'
+HAM = 'ham'
+MAX_TERM_LENGTH = 100
+
+def email_terms(subject, body):
+    """Term counts of one message, the features the classifier sees"""
+    return Counter(
+        term for term in tokenize(f"{subject or ''} {body or ''}")
+        if len(term) <= MAX_TERM_LENGTH
+    )
+
+class SpamClassifier:
+    """Multinomial Naive Bayes over the SpamTerm / SpamModel tables
+
+    Only the terms present in a batch are read from the database, and the
+    batch is scored as one sparse document-term product in NumPy.
+    """
+
+    def __init__(self, alpha=1.0, threshold=None):
+        self.alpha = alpha
+        if threshold is None:
+            threshold = getattr(settings, 'INBOX_SPAM_THRESHOLD', 0.9)
+        self.threshold = threshold
+
+    def totals(self):
+        return SpamModel.objects.filter(pk=1).first() or SpamModel(pk=1)
+
+    def term_counts(self, terms):
+        """Return {term: (spam_count, ham_count)} for the terms that have been seen"""
+        batch_size = getattr(settings, 'INBOX_BULK_BATCH_SIZE', 500)
+        counts = {}
+        for start in range(0, len(terms), batch_size):
+            rows = SpamTerm.objects.filter(term__in=terms[start:start + batch_size])
+            for term, spam_count, ham_count in rows.values_list('term', 'spam_count', 'ham_count'):
+                counts[term] = (spam_count, ham_count)
+        return counts
+
+    def predict(self, documents):
+        """Spam probability per term Counter, or None while untrained"""
+        documents = list(documents)
+        totals = self.totals()
+        if not (totals.spam_messages and totals.ham_messages):
+            return None
+
+        vocabulary = sorted(set().union(*documents)) if documents else []
+        index = {term: position for position, term in enumerate(vocabulary)}
+        counts = self.term_counts(vocabulary)
+        spam_counts = np.array([counts.get(term, (0, 0))[0] for term in vocabulary], dtype=np.float64)
+        ham_counts = np.array([counts.get(term, (0, 0))[1] for term in vocabulary], dtype=np.float64)
+
+        alpha = self.alpha
+        vocabulary_size = max(totals.vocabulary_size, 1)
+        weights = (
+            np.log((spam_counts + alpha) / (totals.spam_tokens + alpha * vocabulary_size))
+            - np.log((ham_counts + alpha) / (totals.ham_tokens + alpha * vocabulary_size))
+        )
+
+        doc_index = np.fromiter(
+            (row for row, document in enumerate(documents) for _ in document), dtype=np.int64
+        )
+        term_index = np.fromiter(
+            (index[term] for document in documents for term in document), dtype=np.int64
+        )
+        frequencies = np.fromiter(
+            (count for document in documents for count in document.values()), dtype=np.float64
+        )
+
+        prior = np.log(totals.spam_messages / totals.ham_messages)
+        logits = prior + np.bincount(
+            doc_index, weights=frequencies * weights[term_index], minlength=len(documents)
+        )
+        return 1 / (1 + np.exp(-np.clip(logits, -500, 500)))
+
+    def classify_emails(self, emails):
+        """Set spam_label and spam_score on Email instances in memory
+
+        Until both classes have training examples the keyword vote is used
+        for the label and no score is stored.
+        """
+        emails = list(emails)
+        probabilities = self.predict(
+            email_terms(email_obj.subject, email_obj.body_text) for email_obj in emails
+        )
+
+        if probabilities is None:
+            labels = classify_texts(f"{email_obj.subject} {email_obj.body_text}" for email_obj in emails)
+            for email_obj, label in zip(emails, labels):
+                email_obj.spam_label = SPAM if label == 'spam' else HAM
+                email_obj.spam_score = None
+            return emails
+
+        for email_obj, probability in zip(emails, probabilities.tolist()):
+            email_obj.spam_label = SPAM if probability >= self.threshold else HAM
+            email_obj.spam_score = probability
+        return emails
+
+def _apply_counts(model, terms, label, sign):
+    field = 'spam_count' if label == SPAM else 'ham_count'
+    batch_size = getattr(settings, 'INBOX_BULK_BATCH_SIZE', 500)
+
+    term_list = list(terms)
+    existing = {}
+    for start in range(0, len(term_list), batch_size):
+        for row in SpamTerm.objects.filter(term__in=term_list[start:start + batch_size]):
+            existing[row.term] = row
+
+    for term, row in existing.items():
+        setattr(row, field, max(getattr(row, field) + sign * terms[term], 0))
+    SpamTerm.objects.bulk_update(existing.values(), [field], batch_size=batch_size)
+
+    if sign > 0:
+        new_terms = [
+            SpamTerm(term=term, **{field: count})
+            for term, count in terms.items() if term not in existing
+        ]
+        SpamTerm.objects.bulk_create(new_terms, batch_size=batch_size)
+        model.vocabulary_size += len(new_terms)
+
+    messages_field = f'{label}_messages'
+    tokens_field = f'{label}_tokens'
+    setattr(model, messages_field, max(getattr(model, messages_field) + sign, 0))
+    setattr(model, tokens_field, max(getattr(model, tokens_field) + sign * sum(terms.values()), 0))
+
+def train(email_obj, label):
+    """Record the user's spam / not-spam verdict and update the model
+
+    Re-marking an email moves its counts from the old class to the new
+    one, so the tables always reflect each email's latest verdict.
+    """
+    with transaction.atomic():
+        # Locking the totals row serializes concurrent training
+        model, _ = SpamModel.objects.select_for_update().get_or_create(pk=1)
+        current = Email.objects.select_for_update().get(pk=email_obj.pk)
+        previous = current.spam_feedback
+
+        if previous != label:
+            terms = email_terms(current.subject, current.body_text)
+            if previous:
+                _apply_counts(model, terms, previous, -1)
+            _apply_counts(model, terms, label, 1)
+            model.save()
+
+        current.spam_feedback = label
+        current.spam_label = label
+        current.spam_score = 1.0 if label == SPAM else 0.0
+        current.save(update_fields=['spam_feedback', 'spam_label', 'spam_score'])
+
+    email_obj.spam_feedback = current.spam_feedback
+    email_obj.spam_label = current.spam_label
+    email_obj.spam_score = current.spam_score
+    return email_obj
@@ -0,0 +1,138 @@
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+from .models import EmailAccount, Email, EmailAttachment, MailboxStats
+
+_deferred = threading.local()
+
+class _DeferredDeltas:
+    """Counter changes collected while deferred_stats() is active"""
+
+    def __init__(self):
+        self.deltas = defaultdict(Counter)
+        # Attachment sizes by email id, and the accounts of deleted emails
+        self.email_bytes = Counter()
+        self.email_accounts = {}
+
+    def apply(self):
+        missing = set(self.email_bytes) - set(self.email_accounts)
+        if missing:
+            self.email_accounts.update(Email.objects.filter(id__in=missing).values_list('id', 'account_id'))
+        for email_id, size in self.email_bytes.items():
+            if email_id in self.email_accounts:
+                self.deltas[(self.email_accounts[email_id], False)]['attachment_bytes'] -= size
+        for (account_id, rebuild_missing), delta in self.deltas.items():
+            apply_stats_delta(account_id, rebuild_missing=rebuild_missing, **delta)
+
+@contextmanager
+def deferred_stats():
+    """Apply the counter changes made in the block as one UPDATE per account
+
+    Bulk and cascading deletes send post_delete once per row; inside this
+    block the receivers only add to per-account totals, which are written
+    in the same transaction when the block exits. Nested blocks join the
+    outermost one.
+    """
+    if getattr(_deferred, 'pending', None) is not None:
+        yield
+        return
+
+    _deferred.pending = _DeferredDeltas()
+    try:
+        with transaction.atomic():
+            yield
+            pending, _deferred.pending = _deferred.pending, None
+            pending.apply()
+    finally:
+        _deferred.pending = None
+
+def apply_stats_delta(account_id, total=0, unread=0, attachment_bytes=0, rebuild_missing=True):
+    """Add to an account's counters with a single UPDATE
+
+    Call inside the transaction that made the change so counters and
+    rows commit together. A missing stats row is rebuilt from scratch
+    unless rebuild_missing is False, as during an account's own deletion.
+    Inside deferred_stats() the change is only recorded.
+    """
+    if not (total or unread or attachment_bytes):
+        return
+    pending = getattr(_deferred, 'pending', None)
+    if pending is not None:
+        pending.deltas[(account_id, rebuild_missing)].update(
+            total=total, unread=unread, attachment_bytes=attachment_bytes
+        )
+        return
+    updated = MailboxStats.objects.filter(account_id=account_id).update(
+        total_count=F('total_count') + total,
+        unread_count=F('unread_count') + unread,
+        attachment_bytes=F('attachment_bytes') + attachment_bytes,
+        updated_at=timezone.now()
+    )
+    if not updated and rebuild_missing:
+        recompute_stats(EmailAccount.objects.filter(id=account_id))
+
+def subtract_deleted_email(email_obj):
+    """Take a deleted email off its account's total and unread counters"""
+    pending = getattr(_deferred, 'pending', None)
+    if pending is not None:
+        pending.email_accounts[email_obj.id] = email_obj.account_id
+    apply_stats_delta(
+        email_obj.account_id,
+        total=-1,
+        unread=0 if email_obj.is_read else -1,
+        rebuild_missing=False
+    )
+
+def subtract_deleted_attachment(attachment):
+    """Take a deleted attachment's size off its account's counter"""
+    pending = getattr(_deferred, 'pending', None)
+    if pending is not None:
+        # Resolved to accounts in one query, or none, when the block exits
+        pending.email_bytes[attachment.email_id] += attachment.file_size
+        return
+    account_id = Email.objects.filter(id=attachment.email_id).values_list('account_id', flat=True).first()
+    if account_id is not None:
+        apply_stats_delta(account_id, attachment_bytes=-attachment.file_size, rebuild_missing=False)
+
+def set_read(email_obj, is_read):
+    """Mark an email read or unread and adjust the unread counter"""
+    with transaction.atomic():
+        changed = Email.objects.filter(id=email_obj.id, is_read=not is_read).update(is_read=is_read)
+        if changed:
+            apply_stats_delta(email_obj.account_id, unread=-1 if is_read else 1)
+    email_obj.is_read = is_read
+    return bool(changed)
+
+def recompute_stats(accounts=None):
+    """Rebuild counters from the Email and EmailAttachment tables"""
+    accounts = EmailAccount.objects.all() if accounts is None else accounts
+    account_ids = list(accounts.values_list('id', flat=True))
+
+    email_counts = {
+        row['account_id']: row
+        for row in Email.objects.filter(account_id__in=account_ids)
+        .values('account_id')
+        .annotate(total=Count('id'), unread=Count('id', filter=Q(is_read=False)))
+    }
+    attachment_bytes = dict(
+        EmailAttachment.objects.filter(email__account_id__in=account_ids)
+        .values('email__account_id')
+        .annotate(size=Sum('file_size'))
+        .values_list('email__account_id', 'size')
+    )
+
+    with transaction.atomic():
+        for account_id in account_ids:
+            counts = email_counts.get(account_id, {})
+            MailboxStats.objects.update_or_create(
+                account_id=account_id,
+                defaults={
+                    'total_count': counts.get('total', 0),
+                    'unread_count': counts.get('unread', 0),
+                    'attachment_bytes': attachment_bytes.get(account_id) or 0,
+                }
+            )
+    return len(account_ids)
@@ -0,0 +1,17 @@
+from celery import shared_task
+from .models import EmailAccount
+from .email_utils import sync_account
+
+@shared_task
+def sync_email_account(account_id):
+    try:
+        account = EmailAccount.objects.get(id=account_id)
+        return sync_account(account)
+    except EmailAccount.DoesNotExist:
+        return 0
+
+@shared_task
+def sync_all_email_accounts():
+    """Queue a sync for every configured email account"""
+    for account_id in EmailAccount.objects.values_list('id', flat=True):
+        sync_email_account.delay(account_id)
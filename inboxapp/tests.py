@@ -1,3 +1,1372 @@
-from django.test import TestCase
+import email
+import email.utils
+import hashlib
+import html
+import imaplib
+import random
+import re
+import socketserver
+import tempfile
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+from email.message import EmailMessage
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.http import QueryDict
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from .async_sync import sync_all_accounts
+from .attachments import spool_part, spool_payload
+from .conversations import assign_threads, get_conversation
+from .html_text import html_to_text
+from .email_utils import (
+    load_email_body, parse_email_message, save_emails_to_db, store_synced_emails, sync_account
+)
+from .idle import IdleListener
+from .imap_pool import IMAPConnectionPool, PooledSession
+from .imap_utils import find_uid_by_message_id
+from .keywords import KeywordMatcher, get_keywords_matcher
+from .mime import parse_message
+from .models import (
+    AttachmentBlob, Email, EmailAccount, EmailAttachment, EmailSignature, MailboxStats, SimilarityBucket, SpamModel,
+    SpamTerm
+)
+from .scoring import PriorityScorer, score_emails, score_queryset
+from .search import rebuild_search_index, search_emails
+from .similarity import BANDS, index_emails, near_duplicates, related_emails
+from .spam import HAM, SPAM, SpamClassifier, email_terms, train
+from .stats import recompute_stats
+from .utils import keyword_frequency, rank_emails
 
-# Create your tests here.
+
+FETCH_ITEM_RE = re.compile(rb'BODY(?:\.PEEK)?\[([^\]]*)\]|[A-Z0-9.]+', re.IGNORECASE)
+
+
+def imap_string(value):
+    if value is None:
+        return b'NIL'
+    value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return b'"' + value.encode() + b'"'
+
+
+def imap_list(items):
+    return b'(' + b' '.join(items) + b')' if items else b'NIL'
+
+
+def imap_literal(name, data):
+    return name + b' {%d}\r\n' % len(data) + data
+
+
+def envelope(msg):
+    def addresses(header):
+        return imap_list([
+            b'(' + b' '.join([
+                imap_string(name or None), b'NIL',
+                imap_string(address.partition('@')[0]), imap_string(address.partition('@')[2])
+            ]) + b')'
+            for name, address in email.utils.getaddresses(msg.get_all(header, []))
+        ])
+
+    return imap_list([
+        imap_string(msg['Date']), imap_string(msg['Subject']),
+        addresses('From'), addresses('From'), addresses('From'),
+        addresses('To'), addresses('Cc'), addresses('Bcc'),
+        imap_string(msg['In-Reply-To']), imap_string(msg['Message-ID']),
+    ])
+
+
+def bodystructure(part):
+    if part.is_multipart():
+        children = b''.join(bodystructure(child) for child in part.get_payload())
+        return b'(' + children + b' ' + imap_string(part.get_content_subtype()) + b')'
+
+    payload = part.get_payload().encode()
+    params = imap_list([
+        imap_string(value)
+        for name, value in part.get_params()[1:]
+        for value in (name, value)
+    ])
+    disposition = b'NIL'
+    if part.get_content_disposition():
+        disposition = imap_list([
+            imap_string(part.get_content_disposition()),
+            imap_list([imap_string('filename'), imap_string(part.get_filename())])
+            if part.get_filename() else b'NIL'
+        ])
+    fields = [
+        imap_string(part.get_content_maintype()), imap_string(part.get_content_subtype()),
+        params, b'NIL', b'NIL',
+        imap_string(part.get('Content-Transfer-Encoding', '7bit')), b'%d' % len(payload)
+    ]
+    if part.get_content_maintype() == 'text':
+        fields.append(b'%d' % len(payload.splitlines()))
+    return imap_list(fields + [b'NIL', disposition])
+
+
+def body_section(msg, raw, section):
+    if not section:
+        return raw
+    if section.upper().startswith(b'HEADER.FIELDS'):
+        names = section[section.index(b'(') + 1:section.rindex(b')')].decode().split()
+        return ''.join(
+            f'{name}: {msg[name]}\r\n' for name in names if msg[name] is not None
+        ).encode() + b'\r\n'
+    part = msg
+    for number in section.decode().split('.'):
+        if part.is_multipart():
+            part = part.get_payload()[int(number) - 1]
+    return part.get_payload().encode()
+
+
+def fetch_items(uid, raw, items):
+    """Answer the FETCH items the client asked for, as a real server would"""
+    msg = email.message_from_bytes(raw)
+    response = [b'UID %d' % uid]
+    for match in FETCH_ITEM_RE.finditer(items.strip(b'()')):
+        item = match.group(0).upper()
+        if item == b'FLAGS':
+            response.append(b'FLAGS ()')
+        elif item == b'RFC822.SIZE':
+            response.append(b'RFC822.SIZE %d' % len(raw))
+        elif item == b'ENVELOPE':
+            response.append(b'ENVELOPE ' + envelope(msg))
+        elif item == b'BODYSTRUCTURE':
+            response.append(b'BODYSTRUCTURE ' + bodystructure(msg))
+        elif item == b'RFC822':
+            response.append(imap_literal(b'RFC822', raw))
+        elif match.group(1) is not None:
+            section = match.group(1)
+            response.append(imap_literal(b'BODY[' + section + b']', body_section(msg, raw, section)))
+    return response
+
+
+class FakeIMAPServer:
+    """Minimal IMAP4rev1 server over plain TCP for offline sync tests
+
+    Serves one INBOX per username from ``mailboxes``: a dict of
+    username -> list of raw RFC822 messages; UIDs are list index + 1.
+    Every user's password is "secret"; any other is refused.
+    FETCH answers the items asked for: RFC822, FLAGS, RFC822.SIZE,
+    ENVELOPE, BODYSTRUCTURE and BODY.PEEK[section]. Once ``fetches_left``
+    UID FETCH commands have been answered, the next one drops the
+    connection.
+    """
+
+    def __init__(self, mailboxes, uidvalidity=1):
+        self.mailboxes = mailboxes
+        self.uidvalidity = uidvalidity
+        self.logins = 0
+        self.fetches_left = None
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def send(self, line):
+                self.wfile.write(line + b'\r\n')
+
+            def handle(self):
+                self.send(b'* OK [CAPABILITY IMAP4rev1] fake server ready')
+                user = None
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    tag, command, *rest = line.rstrip(b'\r\n').split(b' ', 2)
+                    args = rest[0] if rest else b''
+                    command = command.upper()
+                    if command == b'CAPABILITY':
+                        self.send(b'* CAPABILITY IMAP4rev1')
+                    elif command == b'LOGIN':
+                        username, password = (arg.strip(b'"').decode() for arg in args.split(b' ', 1))
+                        if password != 'secret':
+                            self.send(tag + b' NO [AUTHENTICATIONFAILED] invalid credentials')
+                            continue
+                        user = username
+                        server.logins += 1
+                    elif command in (b'SELECT', b'EXAMINE'):
+                        messages = server.mailboxes.get(user, [])
+                        self.send(b'* %d EXISTS' % len(messages))
+                        self.send(b'* OK [UIDVALIDITY %d] UIDs valid' % server.uidvalidity)
+                        self.send(b'* OK [UIDNEXT %d] next' % (len(messages) + 1))
+                    elif command == b'UID':
+                        if args[:5].upper() == b'FETCH' and server.fetches_left is not None:
+                            if not server.fetches_left:
+                                return
+                            server.fetches_left -= 1
+                        self.uid_command(user, args)
+                    elif command == b'LOGOUT':
+                        self.send(b'* BYE')
+                        self.send(tag + b' OK LOGOUT completed')
+                        return
+                    self.send(tag + b' OK ' + command + b' completed')
+
+            def uid_command(self, user, args):
+                subcommand, args = args.split(b' ', 1)
+                messages = server.mailboxes.get(user, [])
+                if subcommand.upper() == b'SEARCH':
+                    uids = self.match(args.split()[-1], len(messages))
+                    self.send(b'* SEARCH ' + b' '.join(b'%d' % uid for uid in uids))
+                else:
+                    uid_set, items = args.split(b' ', 1)
+                    for uid in self.match(uid_set, len(messages)):
+                        self.wfile.write(
+                            b'* %d FETCH (' % uid
+                            + b' '.join(fetch_items(uid, messages[uid - 1], items))
+                            + b')\r\n'
+                        )
+
+            def match(self, uid_set, count):
+                uids = []
+                for item in uid_set.split(b','):
+                    start, _, end = item.partition(b':')
+                    start = int(start)
+                    end = count if end == b'*' else int(end or start)
+                    uids.extend(range(start, end + 1))
+                # "n:*" always includes the highest UID
+                if uid_set.endswith(b'*') and count:
+                    uids.append(count)
+                return sorted(uid for uid in set(uids) if 1 <= uid <= count)
+
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.host, self.port = self.server.server_address
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def make_message(message_id, subject='Hello'):
+    return (
+        f"From: Sender <sender@example.com>\r\n"
+        f"To: me@example.com\r\n"
+        f"Subject: {subject}\r\n"
+        f"Message-ID: <{message_id}@example.com>\r\n"
+        f"Date: Mon, 01 Jan 2024 10:00:00 +0000\r\n"
+        f"Content-Type: text/plain; charset=utf-8\r\n"
+        f"\r\n"
+        f"Body of {message_id}\r\n"
+    ).encode()
+
+
+def make_multipart_message(message_id, attachment=b'%PDF-1.4 fake report'):
+    msg = EmailMessage()
+    msg['From'] = 'Alice Example <alice@example.com>'
+    msg['To'] = 'me@example.com'
+    msg['Subject'] = 'Quarterly report'
+    msg['Message-ID'] = f'<{message_id}@example.com>'
+    msg['In-Reply-To'] = '<parent@example.com>'
+    msg['References'] = '<root@example.com> <parent@example.com>'
+    msg['Date'] = 'Mon, 01 Jan 2024 10:00:00 +0000'
+    msg.set_content('Plain body with caf\u00e9', charset='utf-8', cte='quoted-printable')
+    msg.add_alternative('<p>HTML body</p>', subtype='html')
+    msg.add_attachment(attachment, maintype='application', subtype='pdf', filename='report.pdf')
+    return msg.as_bytes()
+
+
+class FakeIMAPTestCase(TestCase):
+    """Runs a FakeIMAPServer with one EmailAccount per mailbox"""
+
+    def start_imap(self, mailboxes):
+        self.mailboxes = mailboxes
+        self.imap = FakeIMAPServer(self.mailboxes)
+        self.imap.__enter__()
+        self.addCleanup(self.imap.__exit__, None, None, None)
+
+        # Plain-text IMAP against the fake server, and a fresh pool per test
+        patcher = mock.patch('inboxapp.imap_pool.imaplib.IMAP4_SSL', imaplib.IMAP4)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        pool_patcher = mock.patch('inboxapp.imap_pool._pool', None)
+        pool_patcher.start()
+        self.addCleanup(pool_patcher.stop)
+
+        self.accounts = [
+            EmailAccount.objects.create(
+                name=username,
+                email=username,
+                password='secret',
+                imap_server=self.imap.host,
+                imap_port=self.imap.port
+            )
+            for username in self.mailboxes
+        ]
+
+
+@override_settings(INBOX_SYNC_HEADERS_ONLY=False)
+class AsyncSyncTests(FakeIMAPTestCase):
+    def setUp(self):
+        self.start_imap({
+            f'user{i}@example.com': [make_message(f'user{i}-{n}') for n in range(3)]
+            for i in range(4)
+        })
+
+    def test_syncs_all_accounts(self):
+        results = sync_all_accounts(per_server_limit=2)
+
+        self.assertEqual(results, {account.id: 3 for account in self.accounts})
+        for account in self.accounts:
+            account.refresh_from_db()
+            self.assertEqual(account.emails.count(), 3)
+            self.assertEqual(account.uidvalidity, 1)
+            self.assertEqual(account.last_seen_uid, 3)
+            self.assertIsNotNone(account.last_synced_at)
+
+    def test_second_sync_only_fetches_new_mail(self):
+        sync_all_accounts()
+        self.mailboxes['user0@example.com'].append(make_message('user0-new'))
+
+        results = sync_all_accounts()
+
+        self.assertEqual(results[self.accounts[0].id], 1)
+        self.assertEqual(results[self.accounts[1].id], 0)
+        self.assertTrue(Email.objects.filter(message_id='<user0-new@example.com>').exists())
+
+    def test_uidvalidity_change_triggers_full_resync(self):
+        sync_all_accounts()
+        self.imap.uidvalidity = 2
+
+        results = sync_all_accounts()
+
+        self.assertEqual(results, {account.id: 0 for account in self.accounts})
+        account = EmailAccount.objects.get(id=self.accounts[0].id)
+        self.assertEqual(account.uidvalidity, 2)
+        self.assertEqual(account.last_seen_uid, 3)
+        self.assertEqual(Email.objects.count(), 12)
+
+    def test_failed_account_is_reported(self):
+        failing = self.accounts[0]
+        failing.password = 'wrong'
+        failing.save()
+
+        with self.assertLogs('inboxapp', level='ERROR'):
+            results = sync_all_accounts()
+
+        self.assertIsInstance(results.pop(failing.id), imaplib.IMAP4.error)
+        self.assertEqual(results, {account.id: 3 for account in self.accounts[1:]})
+        failing.refresh_from_db()
+        self.assertIsNone(failing.uidvalidity)
+        self.assertEqual(failing.emails.count(), 0)
+
+    def test_command_reports_failed_accounts(self):
+        EmailAccount.objects.filter(id=self.accounts[0].id).update(password='wrong')
+        stdout, stderr = StringIO(), StringIO()
+
+        with self.assertLogs('inboxapp', level='ERROR'):
+            call_command('sync_mailboxes', stdout=stdout, stderr=stderr)
+
+        self.assertIn(f"Account {self.accounts[0].id}: ", stderr.getvalue())
+        self.assertIn('Synced 3 of 4 accounts', stdout.getvalue())
+
+    @override_settings(IMAP_FETCH_CHUNK_SIZE=2)
+    def test_dropped_connection_keeps_stored_chunks(self):
+        account = self.accounts[0]
+        self.mailboxes[account.email].extend(make_message(f'more-{n}') for n in range(2))
+        self.imap.fetches_left = 2
+
+        with self.assertLogs('inboxapp', level='ERROR'), self.assertRaises(imaplib.IMAP4.abort):
+            sync_account(account)
+
+        account.refresh_from_db()
+        self.assertEqual(account.last_seen_uid, 4)
+        self.assertEqual(account.emails.count(), 4)
+
+        self.imap.fetches_left = None
+        self.assertEqual(sync_account(account), 1)
+        account.refresh_from_db()
+        self.assertEqual(account.last_seen_uid, 5)
+
+    @override_settings(IMAP_FETCH_CHUNK_SIZE=2)
+    def test_engine_stores_chunks_as_they_arrive(self):
+        account = self.accounts[0]
+        self.imap.fetches_left = 1
+
+        with self.assertLogs('inboxapp', level='ERROR'):
+            results = sync_all_accounts(EmailAccount.objects.filter(id=account.id))
+
+        self.assertIsInstance(results[account.id], imaplib.IMAP4.abort)
+        account.refresh_from_db()
+        self.assertEqual(account.last_seen_uid, 2)
+        self.assertEqual(account.emails.count(), 2)
+
+    def test_sessions_are_reused_between_syncs(self):
+        sync_all_accounts(per_server_limit=1)
+        logins = self.imap.logins
+        sync_all_accounts(per_server_limit=1)
+
+        self.assertEqual(self.imap.logins, logins)
+
+
+@override_settings(INBOX_SYNC_HEADERS_ONLY=True)
+class HeaderOnlySyncTests(FakeIMAPTestCase):
+    """The default sync path: envelope and structure first, bodies on open"""
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_patcher = override_settings(MEDIA_ROOT=media_root.name)
+        media_patcher.enable()
+        self.addCleanup(media_patcher.disable)
+
+        self.start_imap({'me@example.com': [make_message('plain'), make_multipart_message('report')]})
+        self.account = self.accounts[0]
+
+    def test_sync_stores_headers_without_bodies(self):
+        self.assertEqual(sync_account(self.account), 2)
+
+        email_obj = Email.objects.get(message_id='<report@example.com>')
+        self.assertFalse(email_obj.body_loaded)
+        self.assertEqual(email_obj.body_text, '')
+        self.assertEqual(email_obj.subject, 'Quarterly report')
+        self.assertEqual(email_obj.sender, 'alice@example.com')
+        self.assertEqual(email_obj.sender_name, 'Alice Example')
+        self.assertEqual(email_obj.in_reply_to, '<parent@example.com>')
+        self.assertEqual(email_obj.references, '<root@example.com> <parent@example.com>')
+        self.assertEqual(email_obj.uid, 2)
+        self.assertFalse(email_obj.attachments.exists())
+        self.assertEqual(
+            [(part['section'], part['content_type'], part['attachment']) for part in email_obj.mime_parts],
+            [('1.1', 'text/plain', False), ('1.2', 'text/html', False), ('2', 'application/pdf', True)]
+        )
+
+    def test_body_and_attachments_load_on_open(self):
+        sync_account(self.account)
+        email_obj = Email.objects.get(message_id='<report@example.com>')
+
+        load_email_body(email_obj)
+
+        email_obj.refresh_from_db()
+        self.assertTrue(email_obj.body_loaded)
+        self.assertEqual(email_obj.body_text.strip(), 'Plain body with caf\u00e9')
+        self.assertEqual(email_obj.body_html.strip(), '<p>HTML body</p>')
+        attachment = email_obj.attachments.get()
+        self.assertEqual(attachment.filename, 'report.pdf')
+        self.assertEqual(attachment.content_type, 'application/pdf')
+        with attachment.blob.file.open('rb') as stored:
+            self.assertEqual(stored.read(), b'%PDF-1.4 fake report')
+
+    def test_concurrent_opens_load_the_body_once(self):
+        sync_account(self.account)
+        first = Email.objects.get(message_id='<report@example.com>')
+        # A second tab holding the same email from before the first open
+        second = Email.objects.get(pk=first.pk)
+
+        load_email_body(first)
+        with mock.patch('inboxapp.email_utils.imap_connection') as imap_connection:
+            load_email_body(second)
+
+        imap_connection.assert_not_called()
+        self.assertTrue(second.body_loaded)
+        self.assertEqual(second.body_html.strip(), '<p>HTML body</p>')
+        attachment = EmailAttachment.objects.get(email=first)
+        self.assertEqual(attachment.blob.ref_count, 1)
+        self.assertEqual(
+            MailboxStats.objects.get(account=self.account).attachment_bytes, attachment.file_size
+        )
+
+    def test_failed_body_download_is_logged(self):
+        sync_account(self.account)
+        email_obj = Email.objects.get(message_id='<report@example.com>')
+
+        with mock.patch('inboxapp.email_utils.imap_connection', side_effect=OSError('offline')), \
+                self.assertLogs('inboxapp.email_utils', level='ERROR'):
+            load_email_body(email_obj)
+
+        email_obj.refresh_from_db()
+        self.assertFalse(email_obj.body_loaded)
+
+    def test_single_part_message_loads_its_body(self):
+        sync_account(self.account)
+        email_obj = Email.objects.get(message_id='<plain@example.com>')
+        self.assertEqual(email_obj.mime_parts[0]['section'], '1')
+
+        load_email_body(email_obj)
+
+        email_obj.refresh_from_db()
+        self.assertEqual(email_obj.body_text.strip(), 'Body of plain')
+
+
+class MIMEFixtureTests(SimpleTestCase):
+    """Each part of the .eml fixtures is decoded with its declared charset"""
+
+    FIXTURES = Path(__file__).resolve().parent / 'fixtures' / 'eml'
+
+    def parse(self, name):
+        parsed = parse_message((self.FIXTURES / name).read_bytes())
+        for attachment in parsed['attachments']:
+            self.addCleanup(attachment['file'].close)
+        return parsed
+
+    def test_koi8r_html_only(self):
+        parsed = self.parse('koi8r_html_only.eml')
+        self.assertEqual(parsed['subject'], 'Напоминание о встрече')
+        self.assertEqual(parsed['sender_name'], 'Лена')
+        self.assertIn('<p>Здравствуйте!</p>', parsed['body_html'])
+        # No text/plain part, so the text comes from the HTML
+        self.assertEqual(
+            parsed['body_text'],
+            'Здравствуйте!\n\nНапоминаем о встрече в пятницу в 15:00.'
+        )
+        self.assertEqual(parsed['attachments'], [])
+
+    def test_latin1_quoted_printable(self):
+        parsed = self.parse('latin1_plain.eml')
+        self.assertEqual(parsed['subject'], 'Übersicht für nächste Woche')
+        self.assertEqual(parsed['sender_name'], 'Jürgen Müller')
+        self.assertEqual(
+            parsed['body_text'],
+            'Grüße aus München,\n\nanbei die Übersicht für die nächste Woche.\n\n'
+            'Viele Grüße\nJürgen\n'
+        )
+        self.assertEqual(parsed['body_html'], '')
+
+    def test_iso2022jp_with_csv_attachment(self):
+        parsed = self.parse('shift_jis_report.eml')
+        self.assertEqual(parsed['subject'], '月次レポート')
+        self.assertEqual(parsed['body_text'], 'お疲れ様です。\n月次レポートを添付します。')
+        (attachment,) = parsed['attachments']
+        self.assertEqual((attachment['filename'], attachment['content_type']), ('report.csv', 'text/csv'))
+        content = attachment['file'].open().read()
+        self.assertEqual(attachment['size'], len(content))
+        self.assertTrue(content.startswith(b'month,total\n2025-01,1000\n'))
+
+    def test_forwarded_rfc822_in_cp1252(self):
+        parsed = self.parse('forwarded_rfc822.eml')
+        self.assertEqual(parsed['subject'], 'Fwd: Offer')
+        self.assertEqual(parsed['message_id'], '<fwd-offer@example.com>')
+        self.assertEqual(parsed['body_text'], 'FYI, see below.')
+        # The forwarded message's HTML part is cp1252; 0x93/0x94 are curly quotes
+        self.assertEqual(
+            parsed['body_html'], '<p>Price: 45 &euro; &ndash; <b>“special”</b> offer</p>'
+        )
+        self.assertEqual(parsed['attachments'], [])
+
+    def test_attachments_mixed(self):
+        parsed = self.parse('attachments_mixed.eml')
+        self.assertEqual(parsed['sender_name'], 'Ana Souza')
+        self.assertEqual(parsed['in_reply_to'], '<contract-1@example.com>')
+        self.assertTrue(parsed['body_text'].startswith('Hi,\n\nplease find the signed contract'))
+        self.assertEqual(
+            [(attachment['filename'], attachment['content_type']) for attachment in parsed['attachments']],
+            [('contract signed.pdf', 'application/pdf'), ('floor-plan.png', 'image/png')]
+        )
+        pdf = parsed['attachments'][0]['file'].open().read()
+        self.assertTrue(pdf.startswith(b'%PDF-1.4'))
+        self.assertEqual(parsed['attachments'][0]['size'], len(pdf))
+
+    def test_utf8_encoded_word_subject(self):
+        parsed = self.parse('newsletter_alternative.eml')
+        self.assertEqual(parsed['subject'], 'Weekly digest — 30 new items')
+        self.assertTrue(parsed['body_text'].startswith("This week's highlights\n\n* Item 0:"))
+        self.assertIn('<h1>This week&#39;s highlights</h1>', parsed['body_html'])
+
+
+class SpoolPayloadTests(SimpleTestCase):
+    """Transfer-encoded payloads decoded chunk by chunk match the email package"""
+
+    CHUNK_SIZES = [1, 2, 3, 4, 5, 7, 64, 75, 76, 77, 1000]
+
+    def make_part(self, content, cte):
+        msg = EmailMessage()
+        if isinstance(content, str):
+            msg.set_content(content, charset='utf-8', cte=cte)
+        else:
+            msg.set_content(content, maintype='application', subtype='octet-stream', cte=cte)
+        return msg
+
+    def assert_spools_like_email_package(self, part, encoding):
+        expected = part.get_payload(decode=True)
+        for chunk_size in self.CHUNK_SIZES:
+            with self.subTest(encoding=encoding, chunk_size=chunk_size):
+                spool = spool_payload(part.get_payload(), encoding, buffer_size=16, chunk_size=chunk_size)
+                self.assertEqual(spool.open().read(), expected)
+                self.assertEqual(spool.size, len(expected))
+                self.assertEqual(spool.sha256, hashlib.sha256(expected).hexdigest())
+                spool.close()
+
+    def test_base64(self):
+        content = bytes(random.Random(0).randrange(256) for _ in range(1000))
+        self.assert_spools_like_email_package(self.make_part(content, 'base64'), 'base64')
+
+    def test_base64_with_padding(self):
+        for length in (1, 2, 3, 57, 58, 59):
+            self.assert_spools_like_email_package(self.make_part(b'x' * length, 'base64'), 'base64')
+
+    def test_base64_bytes_payload(self):
+        part = self.make_part(b'binary \x00\xff content', 'base64')
+        spool = spool_payload(part.get_payload().encode(), 'base64', chunk_size=3)
+        self.assertEqual(spool.open().read(), b'binary \x00\xff content')
+
+    def test_quoted_printable(self):
+        content = '\n'.join(
+            f'Line {index}: caf\u00e9 = 100\u20ac ' + 'long ' * index for index in range(40)
+        )
+        part = self.make_part(content, 'quoted-printable')
+        encoded = part.get_payload()
+        self.assertIn('=\n', encoded)
+        self.assertIn('=C3=A9', encoded)
+        self.assert_spools_like_email_package(part, 'quoted-printable')
+
+    def test_unencoded(self):
+        part = self.make_part('plain 7bit text\n' * 20, '7bit')
+        self.assert_spools_like_email_package(part, '7bit')
+
+    def test_spool_part(self):
+        content = bytes(range(256)) * 4
+        for cte in ('base64', 'quoted-printable'):
+            with self.subTest(cte=cte):
+                spool = spool_part(self.make_part(content, cte))
+                self.assertEqual(spool.open().read(), content)
+                self.assertEqual(spool.sha256, hashlib.sha256(content).hexdigest())
+                spool.close()
+
+
+class AttachmentBlobTests(TestCase):
+    """Attachment content is stored once per digest and reference counted"""
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_patcher = override_settings(MEDIA_ROOT=media_root.name)
+        media_patcher.enable()
+        self.addCleanup(media_patcher.disable)
+
+        self.account = EmailAccount.objects.create(
+            name='me', email='me@example.com', password='secret', imap_server='imap.example.com'
+        )
+
+    def save(self, *messages):
+        save_emails_to_db(
+            [
+                parse_email_message(make_multipart_message(message_id, attachment))
+                for message_id, attachment in messages
+            ],
+            self.account
+        )
+        return [Email.objects.get(message_id=f'<{message_id}@example.com>') for message_id, _ in messages]
+
+    def test_identical_content_is_stored_once(self):
+        first, second, other = self.save(
+            ('first', b'shared report'), ('second', b'shared report'), ('other', b'other report')
+        )
+        (third,) = self.save(('third', b'shared report'))
+
+        self.assertEqual(AttachmentBlob.objects.count(), 2)
+        shared = AttachmentBlob.objects.get(size=len(b'shared report'))
+        self.assertEqual(shared.ref_count, 3)
+        self.assertEqual(
+            {attachment.blob_id for email_obj in (first, second, third) for attachment in email_obj.attachments.all()},
+            {shared.id}
+        )
+        self.assertEqual(AttachmentBlob.objects.get(size=len(b'other report')).ref_count, 1)
+        with shared.file.open('rb') as stored:
+            self.assertEqual(stored.read(), b'shared report')
+
+    def test_blob_is_removed_after_its_last_attachment(self):
+        first, second = self.save(('first', b'shared report'), ('second', b'shared report'))
+        blob = AttachmentBlob.objects.get()
+        storage, name = blob.file.storage, blob.file.name
+
+        first.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 1)
+        self.assertTrue(storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(AttachmentBlob.objects.exists())
+        self.assertFalse(storage.exists(name))
+
+    def test_attachments_from_before_blobs(self):
+        self.save(('shared', b'shared report'))
+        legacy = Email.objects.create(
+            account=self.account, subject='Old', sender='old@example.com', recipient='me@example.com',
+            date_received=datetime(2023, 1, 1, tzinfo=dt_timezone.utc), message_id='<legacy@example.com>'
+        )
+        attachment = EmailAttachment(
+            email=legacy, filename='old.txt', file_size=11, content_type='text/plain'
+        )
+        attachment.file_path.save('old.txt', ContentFile(b'legacy file'), save=False)
+        attachment.save()
+        self.assertIsNone(attachment.blob_id)
+
+        response = self.client.get(reverse('download_attachment', args=[attachment.id]))
+        self.assertEqual(b''.join(response.streaming_content), b'legacy file')
+        response.close()
+
+        legacy.delete()
+        self.assertFalse(EmailAttachment.objects.filter(id=attachment.id).exists())
+        self.assertEqual(AttachmentBlob.objects.get().ref_count, 1)
+
+
+class StoreSyncedEmailsTests(TestCase):
+    def setUp(self):
+        self.account = EmailAccount.objects.create(
+            name='me', email='me@example.com', password='secret', imap_server='imap.example.com'
+        )
+
+    def fetched(self, *uids):
+        return [parse_email_message(make_message(f'msg-{uid}'), uid, 1) for uid in uids]
+
+    def test_overlapping_syncs_store_once(self):
+        # Two syncs started from the same stale account state, as beat and IDLE would
+        first = EmailAccount.objects.get(pk=self.account.pk)
+        second = EmailAccount.objects.get(pk=self.account.pk)
+
+        self.assertEqual(store_synced_emails(first, 1, self.fetched(1, 2, 3)), 3)
+        self.assertEqual(store_synced_emails(second, 1, self.fetched(2)), 0)
+
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.emails.count(), 3)
+        self.assertEqual(self.account.last_seen_uid, 3)
+
+
+class FindUidByMessageIdTests(TestCase):
+    def test_message_id_is_sent_as_quoted_string(self):
+        mail = mock.Mock()
+        mail.uid.return_value = ('OK', [b'7'])
+
+        self.assertEqual(find_uid_by_message_id(mail, '<a"b\\c@example.com>'), 7)
+        mail.uid.assert_called_once_with(
+            'search', None, 'HEADER', 'Message-ID', '"<a\\"b\\\\c@example.com>"'
+        )
+
+
+class IMAPConnectionPoolTests(TestCase):
+    def test_slow_logout_does_not_block_other_servers(self):
+        pool = IMAPConnectionPool(idle_timeout=0)
+        logout_started = threading.Event()
+        finish_logout = threading.Event()
+        self.addCleanup(finish_logout.set)
+
+        stale = mock.Mock()
+        stale.logout.side_effect = lambda: (logout_started.set(), finish_logout.wait(10))
+        pool._idle[('slow.example.com', 993, 'a')].append(PooledSession(stale, 'secret'))
+        pool._open_per_server['slow.example.com'] = 1
+
+        with mock.patch.object(pool, '_connect', side_effect=lambda *args: PooledSession(mock.Mock(), 'secret')):
+            # Prunes the stale session and hangs in its LOGOUT
+            slow = threading.Thread(
+                target=pool.acquire, args=('slow.example.com', 993, 'b', 'secret'), daemon=True
+            )
+            slow.start()
+            self.assertTrue(logout_started.wait(5))
+
+            acquired = []
+            worker = threading.Thread(
+                target=lambda: acquired.append(pool.acquire('fast.example.com', 993, 'c', 'secret')),
+                daemon=True
+            )
+            worker.start()
+            worker.join(2)
+            acquired_during_logout = list(acquired)
+
+            # Let the slow acquire finish while _connect is still patched
+            finish_logout.set()
+            slow.join(5)
+        self.assertFalse(slow.is_alive())
+
+        self.assertEqual(len(acquired_during_logout), 1)
+        self.assertEqual(pool._open_per_server['fast.example.com'], 1)
+
+
+class IdleListenerTests(TestCase):
+    def test_sync_errors_are_retried(self):
+        account = EmailAccount(email='me@example.com', imap_server='imap.example.com')
+        calls = []
+
+        def on_new_mail(account):
+            calls.append(account)
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            listener.stop_event.set()
+            return 0
+
+        listener = IdleListener(account, on_new_mail=on_new_mail)
+        mail = mock.Mock(capabilities=('IMAP4REV1',))
+        with mock.patch.object(listener, '_connect', return_value=mail), \
+                mock.patch.object(account, 'refresh_from_db'), \
+                mock.patch.object(listener.stop_event, 'wait', side_effect=lambda timeout: listener.stop_event.is_set()), \
+                self.assertLogs('inboxapp.idle', level='ERROR'):
+            listener.run()
+
+        self.assertEqual(len(calls), 2)
+
+
+class SearchIndexTests(TestCase):
+    """Mail written through the sync path is found by search_emails"""
+
+    def setUp(self):
+        self.account = EmailAccount.objects.create(
+            name='me', email='me@example.com', password='secret', imap_server='imap.example.com'
+        )
+
+    def ingest(self, message_id, subject, body):
+        raw = make_message(message_id, subject).replace(
+            f'Body of {message_id}'.encode(), body.encode()
+        )
+        save_emails_to_db([parse_email_message(raw, 1, 1)], self.account)
+        return Email.objects.get(message_id=f'<{message_id}@example.com>')
+
+    def search(self, query):
+        return list(search_emails(query, self.account.id)[:10])
+
+    def test_ingested_mail_is_searchable(self):
+        email_obj = self.ingest('thread-1', 'Project update', 'Please reply before Friday')
+
+        self.assertEqual(self.search('reply'), [email_obj])
+        self.assertEqual(self.search('project'), [email_obj])
+        self.assertEqual(search_emails('reply', self.account.id).count(), 1)
+
+    def test_updated_body_is_reindexed(self):
+        email_obj = self.ingest('lazy-1', 'Invoice', '')
+        self.assertEqual(self.search('overdue'), [])
+
+        # What load_email_body does when a header-only email is opened
+        email_obj.body_text = 'Your payment is overdue'
+        email_obj.save(update_fields=['body_text'])
+
+        self.assertEqual(self.search('overdue'), [email_obj])
+        self.assertEqual(self.search('invoice'), [email_obj])
+
+    def test_deleted_mail_leaves_the_index(self):
+        kept = self.ingest('keep-1', 'Lunch', 'Reply about lunch')
+        deleted = self.ingest('drop-1', 'Dinner', 'Reply about dinner')
+        self.assertEqual(len(self.search('reply')), 2)
+
+        deleted.delete()
+
+        self.assertEqual(self.search('reply'), [kept])
+        self.assertEqual(self.search('dinner'), [])
+
+    @skipUnless(connection.vendor == 'sqlite', 'FTS5 triggers are SQLite only')
+    def test_rebuild_restores_missing_triggers(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER inboxapp_email_fts_ai")
+        rebuild_search_index()
+
+        email_obj = self.ingest('after-1', 'Status', 'Weekly report attached')
+        self.assertEqual(self.search('weekly'), [email_obj])
+
+
+class HTMLToTextTests(SimpleTestCase):
+    def test_unclosed_head_keeps_body(self):
+        html = '<html><head><title>x</title><body><p>Hello world</p></body></html>'
+        self.assertEqual(html_to_text(html), 'Hello world')
+        html = '<html><head><title>Newsletter<style>p {}</style><body><p>Hello world</p></body></html>'
+        self.assertEqual(html_to_text(html), 'Hello world')
+
+    def test_unclosed_svg_keeps_following_text(self):
+        html = '<p>Logo <svg width="10"><title>Icon</title><path d="M0 0"/><p>After the logo</p>'
+        self.assertEqual(html_to_text(html), 'Logo\nAfter the logo')
+
+    def test_script_and_style_are_dropped(self):
+        html = '<style>p { color: red }</style><p>Shown</p><script>alert("hidden")</script>'
+        self.assertEqual(html_to_text(html), 'Shown')
+
+    def test_entities_are_decoded(self):
+        html = '<p>Fish &amp; chips&nbsp;for &euro;5 &lt;today&gt; &#8212; &#x263A;</p>'
+        self.assertEqual(html_to_text(html), 'Fish & chips for \u20ac5 <today> \u2014 \u263a')
+
+    def test_block_spacing(self):
+        html = (
+            '<div>One</div><div>Two</div>'
+            '<table><tr><td>A</td><td>B</td></tr><tr><td>C</td></tr></table>'
+            'line<br>break<br/>end<ul><li>x</li><li>y</li></ul>'
+        )
+        self.assertEqual(html_to_text(html), 'One\n\nTwo\n\nA B\n\nC\n\nline\nbreak\nend\n\nx\n\ny')
+
+
+@override_settings(INBOX_PAGE_SIZE=2)
+class InboxViewTests(TestCase):
+    def setUp(self):
+        self.account = EmailAccount.objects.create(
+            name='me', email='me@example.com', password='secret', imap_server='imap.example.com'
+        )
+        start = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        self.emails = [
+            Email.objects.create(
+                account=self.account,
+                subject=f'Subject {index}',
+                sender='sender@example.com',
+                recipient='me@example.com',
+                date_received=start + timedelta(hours=index),
+                message_id=f'<inbox-{index}@example.com>'
+            )
+            for index in range(3)
+        ]
+
+    def test_first_page(self):
+        response = self.client.get(reverse('inbox'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['emails']), self.emails[:0:-1])
+        self.assertContains(response, 'Older')
+        self.assertNotContains(response, 'Newest')
+
+    def test_cursor_page(self):
+        next_cursor = self.client.get(reverse('inbox')).context['next_cursor']
+
+        response = self.client.get(reverse('inbox'), {'cursor': next_cursor})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['emails']), self.emails[:1])
+        self.assertContains(response, 'Newest')
+        self.assertNotContains(response, 'Older')
+
+    def page_links(self, response):
+        return {
+            label: QueryDict(html.unescape(query))
+            for query, label in re.findall(r'href="\?([^"]*)">(Newest|Older)<', response.content.decode())
+        }
+
+    def test_paging_keeps_filters(self):
+        self.emails[0].is_read = True
+        self.emails[0].save()
+        Email.objects.create(
+            account=self.account, subject='Unread', sender='sender@example.com', recipient='me@example.com',
+            date_received=datetime(2023, 12, 31, tzinfo=dt_timezone.utc), message_id='<inbox-unread@example.com>'
+        )
+        filters = {'unread': '1', 'account': str(self.account.id)}
+
+        first = self.client.get(reverse('inbox'), filters)
+        older = self.page_links(first)['Older']
+        self.assertEqual(older['unread'], '1')
+        self.assertEqual(older['account'], str(self.account.id))
+        self.assertEqual(older['cursor'], first.context['next_cursor'])
+
+        second = self.client.get(reverse('inbox'), older)
+        self.assertEqual([email_obj.subject for email_obj in second.context['emails']], ['Unread'])
+        newest = self.page_links(second)['Newest']
+        self.assertEqual(newest.dict(), filters)
+
+    def test_malformed_parameters(self):
+        self.assertEqual(self.client.get(reverse('inbox'), {'account': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('inbox_api'), {'account': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('search'), {'q': 'x', 'account': 'abc'}).status_code, 400)
+
+        for limit, expected in (('abc', 3), ('-3', 1), ('0', 1), ('1000', 3)):
+            with self.subTest(limit=limit):
+                response = self.client.get(reverse('inbox_api'), {'limit': limit})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()['emails']), expected)
+
+
+class MailboxStatsDeleteTests(TestCase):
+    def setUp(self):
+        self.account = EmailAccount.objects.create(
+            name='me', email='me@example.com', password='secret', imap_server='imap.example.com'
+        )
+        self.emails = [
+            Email.objects.create(
+                account=self.account,
+                subject=f'Subject {index}',
+                sender='sender@example.com',
+                recipient='me@example.com',
+                date_received=datetime(2024, 1, 1, tzinfo=dt_timezone.utc),
+                message_id=f'<stats-{index}@example.com>',
+                is_read=index == 0
+            )
+            for index in range(3)
+        ]
+        for email_obj in self.emails:
+            EmailAttachment.objects.create(
+                email=email_obj, filename='a.txt', file_path='attachments/a.txt',
+                file_size=40, content_type='text/plain'
+            )
+        recompute_stats()
+
+    def stats(self):
+        stats = MailboxStats.objects.get(account=self.account)
+        return stats.total_count, stats.unread_count, stats.attachment_bytes
+
+    def test_counters_follow_deletes(self):
+        self.assertEqual(self.stats(), (3, 2, 120))
+
+        self.emails[1].attachments.get().delete()
+        self.assertEqual(self.stats(), (3, 2, 80))
+
+        # Cascades to the attachment
+        self.emails[2].delete()
+        self.assertEqual(self.stats(), (2, 1, 40))
+
+        self.emails[0].delete()
+        self.assertEqual(self.stats(), (1, 1, 0))
+        self.assertEqual(recompute_stats(), 1)
+        self.assertEqual(self.stats(), (1, 1, 0))
+
+    def test_account_delete_cascades_cleanly(self):
+        self.account.delete()
+
+        self.assertFalse(MailboxStats.objects.exists())
+        self.assertFalse(Email.objects.exists())
+
+    def add_emails(self, account, count, is_read=False):
+        for index in range(count):
+            email_obj = Email.objects.create(
+                account=account, subject='Bulk', sender='sender@example.com', recipient='me@example.com',
+                date_received=datetime(2024, 1, 1, tzinfo=dt_timezone.utc),
+                message_id=f'<bulk-{account.id}-{index}@example.com>', is_read=is_read
+            )
+            EmailAttachment.objects.create(
+                email=email_obj, filename='a.txt', file_path='attachments/a.txt',
+                file_size=10, content_type='text/plain'
+            )
+
+    def delete_queries(self, queryset):
+        with CaptureQueriesContext(connection) as queries:
+            queryset.delete()
+        return [query['sql'] for query in queries]
+
+    def test_bulk_delete_updates_stats_once_per_account(self):
+        other = EmailAccount.objects.create(
+            name='other', email='other@example.com', password='secret', imap_server='imap.example.com'
+        )
+        self.add_emails(self.account, 20, is_read=True)
+        self.add_emails(other, 5)
+        recompute_stats()
+
+        queries = self.delete_queries(Email.objects.filter(subject='Bulk'))
+        stats_updates = [sql for sql in queries if sql.startswith('UPDATE') and 'mailboxstats' in sql]
+        self.assertEqual(len(stats_updates), 2)
+        self.assertEqual(self.stats(), (3, 2, 120))
+        self.assertEqual(MailboxStats.objects.get(account=other).total_count, 0)
+
+    def test_bulk_delete_query_count_does_not_grow_with_rows(self):
+        self.add_emails(self.account, 2)
+        few = len(self.delete_queries(Email.objects.filter(subject='Bulk')))
+        self.add_emails(self.account, 30)
+        recompute_stats()
+        self.assertEqual(len(self.delete_queries(Email.objects.filter(subject='Bulk'))), few)
+        self.assertEqual(self.stats(), (3, 2, 120))
+
+    def test_bulk_attachment_delete_resolves_accounts_in_one_query(self):
+        queries = self.delete_queries(EmailAttachment.objects.all())
+        self.assertEqual(len([sql for sql in queries if 'mailboxstats' in sql]), 1)
+        self.assertEqual(self.stats(), (3, 2, 0))
+
+    def test_failed_bulk_delete_leaves_counters(self):
+        with mock.patch('inboxapp.signals.release_blobs', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                Email.objects.all().delete()
+        self.assertEqual(Email.objects.count(), 3)
+        self.assertEqual(self.stats(), (3, 2, 120))
+
+        # Nothing left deferred: the next delete is applied right away
+        self.emails[0].attachments.get().delete()
+        self.assertEqual(self.stats(), (3, 2, 80))
+
+
+class BackfillThreadsTests(TestCase):
+    def setUp(self):
+        self.account = EmailAccount.objects.create(
+            name='me', email='me@example.com', password='secret', imap_server='imap.example.com'
+        )
+
+    def create(self, message_id, in_reply_to='', thread_id=None):
+        return Email.objects.create(
+            account=self.account,
+            subject='Plans',
+            sender='sender@example.com',
+            recipient='me@example.com',
+            date_received=datetime(2024, 1, 1, tzinfo=dt_timezone.utc),
+            message_id=message_id,
+            in_reply_to=in_reply_to,
+            thread_id=thread_id
+        )
+
+    def test_command_threads_unthreaded_emails(self):
+        # Rows as they were before 0009: no thread ids
+        root = self.create('<root@example.com>')
+        reply = self.create('<reply@example.com>', in_reply_to='<root@example.com>')
+        other = self.create('<other@example.com>')
+
+        out = StringIO()
+        call_command('backfill_threads', stdout=out)
+        self.assertIn('Threaded 3 emails', out.getvalue())
+
+        for email_obj in (root, reply, other):
+            email_obj.refresh_from_db()
+        self.assertIsNotNone(root.thread_id)
+        self.assertEqual(reply.thread_id, root.thread_id)
+        self.assertNotEqual(other.thread_id, root.thread_id)
+        self.assertEqual(list(get_conversation(root.thread_id)), [root, reply])
+
+        # Mail synced afterwards joins the backfilled thread
+        emails_data = [{'message_id': '<late@example.com>', 'in_reply_to': '<reply@example.com>', 'references': ''}]
+        assign_threads(emails_data)
+        self.assertEqual(emails_data[0]['thread_id'], root.thread_id)
+
+        call_command('backfill_threads', stdout=out)
+        self.assertIn('Threaded 0 emails', out.getvalue())
+
+
+class SpamClassifierTests(TestCase):
+    def setUp(self):
+        self.account = EmailAccount.objects.create(
+            name='me', email='me@example.com', password='secret', imap_server='imap.example.com'
+        )
+        self.count = 0
+
+    def make_email(self, subject, body):
+        self.count += 1
+        return Email.objects.create(
+            account=self.account, subject=subject, body_text=body, sender='sender@example.com',
+            recipient='me@example.com', date_received=datetime(2024, 1, 1, tzinfo=dt_timezone.utc),
+            message_id=f'<spam-{self.count}@example.com>'
+        )
+
+    def term_counts(self):
+        return {term.term: (term.spam_count, term.ham_count) for term in SpamTerm.objects.all()}
+
+    def test_training_updates_counts(self):
+        email_obj = self.make_email('Cheap pills', 'cheap cheap pills')
+
+        train(email_obj, SPAM)
+        train(email_obj, SPAM)
+
+        model = SpamModel.objects.get()
+        self.assertEqual((model.spam_messages, model.ham_messages), (1, 0))
+        self.assertEqual((model.spam_tokens, model.vocabulary_size), (5, 2))
+        self.assertEqual(self.term_counts(), {'cheap': (3, 0), 'pills': (2, 0)})
+        email_obj.refresh_from_db()
+        self.assertEqual((email_obj.spam_feedback, email_obj.spam_label, email_obj.spam_score), (SPAM, SPAM, 1.0))
+
+    def test_remarking_moves_counts_to_the_other_class(self):
+        email_obj = self.make_email('Team lunch', 'lunch at noon')
+        train(email_obj, SPAM)
+
+        train(email_obj, HAM)
+
+        model = SpamModel.objects.get()
+        self.assertEqual((model.spam_messages, model.ham_messages), (0, 1))
+        self.assertEqual((model.spam_tokens, model.ham_tokens), (0, 5))
+        self.assertEqual(
+            self.term_counts(),
+            {'team': (0, 1), 'lunch': (0, 2), 'at': (0, 1), 'noon': (0, 1)}
+        )
+        self.assertEqual(email_obj.spam_label, HAM)
+        self.assertEqual(email_obj.spam_score, 0.0)
+
+    def test_keyword_vote_until_both_classes_have_examples(self):
+        candidates = [
+            Email(subject='Win a free offer', body_text='click now'),
+            Email(subject='Agenda', body_text='')
+        ]
+        classifier = SpamClassifier(threshold=0.5)
+
+        classifier.classify_emails(candidates)
+        self.assertEqual([email_obj.spam_label for email_obj in candidates], [SPAM, HAM])
+        self.assertEqual([email_obj.spam_score for email_obj in candidates], [None, None])
+
+        train(self.make_email('Agenda', 'meeting agenda for monday'), HAM)
+        classifier.classify_emails(candidates)
+        self.assertEqual([email_obj.spam_score for email_obj in candidates], [None, None])
+
+        train(self.make_email('Prize', 'win win free offer click'), SPAM)
+        classifier.classify_emails(candidates)
+        self.assertEqual([email_obj.spam_label for email_obj in candidates], [SPAM, HAM])
+        self.assertGreater(candidates[0].spam_score, 0.5)
+        self.assertLess(candidates[1].spam_score, 0.5)
+
+    @override_settings(INBOX_SPAM_THRESHOLD=0.5)
+    def test_label_and_score_are_stored_at_ingest(self):
+        for _ in range(3):
+            train(self.make_email('Cheap pills', 'cheap pills online pharmacy discount'), SPAM)
+            train(self.make_email('Standup', 'standup notes for the release meeting'), HAM)
+
+        save_emails_to_db([
+            dict(parse_email_message(make_message('incoming-0', 'Cheap pharmacy discount')), uid=1),
+            dict(parse_email_message(make_message('incoming-1', 'Release meeting notes')), uid=2),
+        ], self.account)
+
+        spam = Email.objects.get(message_id='<incoming-0@example.com>')
+        ham = Email.objects.get(message_id='<incoming-1@example.com>')
+        self.assertEqual(spam.spam_label, SPAM)
+        self.assertGreater(spam.spam_score, 0.5)
+        self.assertEqual(ham.spam_label, HAM)
+        self.assertLess(ham.spam_score, 0.5)
+        expected = SpamClassifier().predict([email_terms(spam.subject, spam.body_text)])[0]
+        self.assertAlmostEqual(spam.spam_score, expected)
+
+
+class KeywordFrequencyTests(TestCase):
+    @staticmethod
+    def naive_frequency(text, keywords):
+        # The Counter implementation keyword_frequency replaced
+        freq = Counter(re.findall(r'\w+', text.lower()))
+        return sum(freq.get(keyword.lower(), 0) for keyword in keywords)
+
+    def test_matches_naive_counter(self):
+        rng = random.Random(0)
+        vocabulary = ['free', 'Free', 'FREE', 'freedom', 'freebie', 'offer', 'offers', 'win', 'winner', 'click']
+        keyword_lists = [
+            ['free', 'offer'],
+            ['Free', 'FREE', 'free'],
+            ['free', 'freedom', 'freebie'],
+            ['WIN', 'winner', 'Click', 'click'],
+        ]
+        for _ in range(200):
+            text = ' '.join(rng.choice(vocabulary) for _ in range(rng.randint(0, 30)))
+            text += rng.choice(['', '!', ' free.', ' FREE-offer'])
+            for keywords in keyword_lists:
+                with self.subTest(text=text, keywords=keywords):
+                    self.assertEqual(keyword_frequency(text, keywords), self.naive_frequency(text, keywords))
+
+    def test_matcher_is_built_once_per_keyword_list(self):
+        get_keywords_matcher.cache_clear()
+        with mock.patch('inboxapp.keywords.KeywordMatcher', wraps=KeywordMatcher) as matcher_class:
+            for _ in range(3):
+                keyword_frequency('Free offer', ['free', 'offer'])
+            keyword_frequency('Free offer', ['win'])
+
+        self.assertEqual(matcher_class.call_count, 2)
+
+
+class PriorityScorerTests(TestCase):
+    @staticmethod
+    def naive_score(subject, sender, body):
+        # compute_priority_score as it was before PriorityScorer
+        score = min(len(re.findall(r'\w+', body)) / 50, 5)
+        if any(s.lower() in sender.lower() for s in ['boss@company.com', 'hr@company.com']):
+            score += 5
+        freq = Counter(re.findall(r'\w+', subject.lower()))
+        score += sum(freq.get(k, 0) for k in ['urgent', 'action', 'important']) * 2
+        return min(score, 10)
+
+    def random_rows(self, count):
+        rng = random.Random(0)
+        subjects = ['urgent', 'Urgent', 'ACTION', 'important', 'urgently', 'report', 'lunch', 'action-item']
+        senders = [
+            'boss@company.com', 'Boss <BOSS@company.com>', 'hr@company.com', 'HR Team <hr@company.com>',
+            'alice@example.com', 'bob@company.com', ''
+        ]
+        return [
+            (
+                ' '.join(rng.choice(subjects) for _ in range(rng.randint(0, 4))),
+                rng.choice(senders),
+                ' '.join('word' for _ in range(rng.randint(0, 400))) + rng.choice(['', ' caf\u00e9-bar', '\n\n'])
+            )
+            for _ in range(count)
+        ]
+
+    def test_matches_old_formula(self):
+        rows = self.random_rows(300)
+        scores = PriorityScorer().score(rows).tolist()
+        for row, score in zip(rows, scores):
+            with self.subTest(row=row[:2]):
+                self.assertAlmostEqual(score, self.naive_score(*row))
+
+    def test_sender_must_be_a_whole_address(self):
+        # The old substring test also matched addresses merely containing one
+        scorer = PriorityScorer()
+        self.assertTrue(scorer.is_important_sender('The Boss <boss@company.com>'))
+        self.assertFalse(scorer.is_important_sender('notboss@company.com.evil.example'))
+
+    def test_scores_are_stored_and_ranked_in_the_database(self):
+        account = EmailAccount.objects.create(
+            name='me', email='me@example.com', password='secret', imap_server='imap.example.com'
+        )
+        rows = self.random_rows(30)
+        emails = Email.objects.bulk_create([
+            Email(
+                account=account, subject=subject, sender=sender, body_text=body,
+                recipient='me@example.com', date_received=datetime(2024, 1, 1, tzinfo=dt_timezone.utc),
+                message_id=f'<score-{index}@example.com>'
+            )
+            for index, (subject, sender, body) in enumerate(rows)
+        ])
+
+        self.assertEqual(score_queryset(Email.objects.all(), batch_size=7), 30)
+
+        stored = dict(Email.objects.values_list('message_id', 'priority_score'))
+        for email_obj, row in zip(emails, rows):
+            self.assertAlmostEqual(stored[email_obj.message_id], self.naive_score(*row))
+        ranked = [score for _, score in rank_emails(Email.objects.all())]
+        self.assertEqual(ranked, sorted(ranked, reverse=True))
+        self.assertEqual(
+            [email_obj.priority_score for email_obj in score_emails(emails)],
+            [self.naive_score(*row) for row in rows]
+        )
+
+
+class SimilarityTests(TestCase):
+    def setUp(self):
+        self.account = EmailAccount.objects.create(
+            name='me', email='me@example.com', password='secret', imap_server='imap.example.com'
+        )
+        self.other_account = EmailAccount.objects.create(
+            name='other', email='other@example.com', password='secret', imap_server='imap.example.com'
+        )
+        self.words = [f'word{index}' for index in range(60)]
+        self.count = 0
+
+    def make_email(self, words, account=None):
+        self.count += 1
+        return Email.objects.create(
+            account=account or self.account, subject='Report', body_text=' '.join(words),
+            sender='sender@example.com', recipient='me@example.com',
+            date_received=datetime(2024, 1, 1, tzinfo=dt_timezone.utc),
+            message_id=f'<similar-{self.count}@example.com>'
+        )
+
+    def edited(self, *positions):
+        words = list(self.words)
+        for position in positions:
+            words[position] = f'edit{position}'
+        return words
+
+    def test_candidates_share_a_band_in_the_same_account(self):
+        original = self.make_email(self.words)
+        close = self.make_email(self.edited(30))
+        unrelated = self.make_email([f'other{index}' for index in range(60)])
+        elsewhere = self.make_email(self.words, account=self.other_account)
+        index_emails([original, close, unrelated, elsewhere])
+
+        related = [email_obj for email_obj, _, _ in related_emails(original)]
+        self.assertEqual(related, [close])
+        self.assertNotIn(unrelated, related)
+        self.assertNotIn(elsewhere, related)
+        self.assertNotIn(original, related)
+
+    def test_candidate_limit_keeps_the_most_shared_bands(self):
+        original = self.make_email(self.words)
+        close = self.make_email(self.edited(30))
+        farther = self.make_email(self.edited(10, 30, 50))
+        index_emails([original, close, farther])
+
+        self.assertEqual({email_obj for email_obj, _, _ in related_emails(original)}, {close, farther})
+        self.assertEqual([email_obj for email_obj, _, _ in related_emails(original, candidate_limit=1)], [close])
+        self.assertEqual(len(related_emails(original, k=1)), 1)
+
+    def test_near_duplicates_apply_the_jaccard_threshold(self):
+        original = self.make_email(self.words)
+        close = self.make_email(self.edited(30))
+        farther = self.make_email(self.edited(10, 30, 50))
+        index_emails([original, close, farther])
+
+        scores = {email_obj: jaccard for email_obj, _, jaccard in related_emails(original)}
+        self.assertGreater(scores[close], scores[farther])
+        threshold = (scores[close] + scores[farther]) / 2
+        self.assertEqual([email_obj for email_obj, _, _ in near_duplicates(original, threshold=threshold)], [close])
+
+    def test_unindexed_email_has_no_candidates(self):
+        original = self.make_email(self.words)
+        self.make_email(self.words)
+        self.assertEqual(related_emails(original), [])
+
+    def test_reindexing_replaces_buckets(self):
+        original = self.make_email(self.words)
+        index_emails([original])
+        index_emails([original])
+        self.assertEqual(SimilarityBucket.objects.filter(email=original).count(), BANDS)
+        self.assertEqual(EmailSignature.objects.filter(email=original).count(), 1)
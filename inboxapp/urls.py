@@ -3,5 +3,13 @@ from . import views
 
 urlpatterns = [
     path('', views.inbox_view, name='inbox'),
+    path('search/', views.search_view, name='search'),
+    path('api/inbox/', views.inbox_api, name='inbox_api'),
+    path('api/stats/', views.mailbox_stats_api, name='mailbox_stats_api'),
+    path('email/<int:email_id>/', views.email_detail, name='email_detail'),
+    path('email/<int:email_id>/mark/', views.mark_email, name='mark_email'),
+    path('email/<int:email_id>/spam/', views.mark_spam, name='mark_spam'),
+    path('thread/<int:thread_id>/', views.thread_view, name='thread'),
+    path('attachment/<int:attachment_id>/download/', views.download_attachment, name='download_attachment'),
 
 ]
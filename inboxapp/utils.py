@@ -1,96 +1,39 @@
-import imaplib
-import email
-from email.header import decode_header
 import datetime
 import re
-import math
 import random
-import logging
-from collections import Counter
-from .models import Email, EmailAccount, EmailAttachment
+import numpy as np
+from .imap_pool import imap_connection
+from .mime import walk_message
+from .email_utils import create_attachments, sync_account
+from .scoring import PriorityScorer, score_emails
+from .keywords import get_keywords_matcher
+from .spam import SpamClassifier
+from django.db.models import QuerySet
 from django.utils import timezone
-from bs4 import BeautifulSoup
-import base64
-
-logger = logging.getLogger(__name__)
 
 def connect_to_email_server(email_account):
-    try:
-        mail = imaplib.IMAP4_SSL(email_account.imap_server)
-        mail.login(email_account.email, email_account.password)
-        mail.select("inbox")
-        return mail
-    except Exception as e:
-        logger.error(f"IMAP Connection failed: {e}")
-        return None
-
-def decode_mime_words(s):
-    decoded_fragments = decode_header(s)
-    return ''.join([
-        fragment.decode(charset or 'utf-8') if isinstance(fragment, bytes) else fragment
-        for fragment, charset in decoded_fragments
-    ])
+    """Borrow a pooled IMAP session with the inbox selected
+
+    Use as a context manager; the session is returned to the pool on exit.
+    """
+    return imap_connection(email_account)
 
 def clean_text(text):
     clean = re.sub(r'<[^>]+>', '', text)
     return re.sub(r'\s+', ' ', clean).strip()
 
 def get_body(msg):
-    if msg.is_multipart():
-        for part in msg.walk():
-            ctype = part.get_content_type()
-            if ctype == "text/plain":
-                return part.get_payload(decode=True).decode(errors="ignore")
-            elif ctype == "text/html":
-                html = part.get_payload(decode=True).decode(errors="ignore")
-                soup = BeautifulSoup(html, "html.parser")
-                return soup.get_text()
-    else:
-        return msg.get_payload(decode=True).decode(errors="ignore")
+    """Plain-text body of an email.message.Message, from the HTML part if needed"""
+    return walk_message(msg, with_attachments=False)['body_text']
 
 def fetch_emails(email_account, limit=20):
-    mail = connect_to_email_server(email_account)
-    if not mail:
-        return []
-
-    result, data = mail.search(None, "ALL")
-    mail_ids = data[0].split()
-    latest_ids = mail_ids[-limit:]
-    fetched_emails = []
-
-    for mail_id in reversed(latest_ids):
-        result, data = mail.fetch(mail_id, "(RFC822)")
-        if result != "OK":
-            continue
-
-        raw_email = data[0][1]
-        msg = email.message_from_bytes(raw_email)
-
-        subject = decode_mime_words(msg.get("Subject", "No Subject"))
-        from_email = decode_mime_words(msg.get("From", ""))
-        to_email = decode_mime_words(msg.get("To", ""))
-        date_str = msg.get("Date")
-        date = parse_email_date(date_str)
-
-        body = get_body(msg)
-        text = clean_text(body)
-
-        # Save to DB
-        email_obj = Email(
-            subject=subject,
-            sender=from_email,
-            receiver=to_email,
-            body=text,
-            received_at=date,
-            account=email_account
-        )
-        email_obj.save()
+    """Sync the account and return its newest emails
 
-        save_attachments(msg, email_obj)
-
-        fetched_emails.append(email_obj)
-
-    return fetched_emails
+    Syncing goes through email_utils.sync_account, which owns the
+    UIDVALIDITY handling and the account's sync state.
+    """
+    sync_account(email_account)
+    return list(email_account.emails.order_by('-date_received')[:limit])
 
 def parse_email_date(date_str):
     try:
@@ -99,20 +42,10 @@ def parse_email_date(date_str):
         return timezone.now()
 
 def save_attachments(msg, email_obj):
-    for part in msg.walk():
-        if part.get_content_maintype() == 'multipart':
-            continue
-        if part.get('Content-Disposition') is None:
-            continue
-        filename = part.get_filename()
-        if filename:
-            payload = part.get_payload(decode=True)
-            attachment = EmailAttachment(
-                email=email_obj,
-                filename=filename,
-                filedata=base64.b64encode(payload).decode()
-            )
-            attachment.save()
+    return create_attachments(
+        (email_obj, attachment_data)
+        for attachment_data in walk_message(msg)['attachments']
+    )
 
 ### ------------------------------
 ### 🔍 Math/Algo Based Utilities
@@ -122,49 +55,37 @@ def word_count(text):
     return len(re.findall(r'\w+', text))
 
 def keyword_frequency(text, keywords):
-    words = re.findall(r'\w+', text.lower())
-    freq = Counter(words)
-    score = sum(freq.get(k.lower(), 0) for k in keywords)
-    return score
+    """Count keyword hits in text; the matcher for each keyword list is cached"""
+    return get_keywords_matcher(tuple(keywords)).match(text)[0]
 
 def cosine_similarity(vec1, vec2):
-    dot = sum([vec1[i]*vec2[i] for i in range(len(vec1))])
-    mag1 = math.sqrt(sum([i**2 for i in vec1]))
-    mag2 = math.sqrt(sum([i**2 for i in vec2]))
-    return dot / (mag1 * mag2 + 1e-5)
+    vec1 = np.asarray(vec1, dtype=np.float64)
+    vec2 = np.asarray(vec2, dtype=np.float64)
+    return float(vec1 @ vec2 / (np.linalg.norm(vec1) * np.linalg.norm(vec2) + 1e-5))
 
 def compute_priority_score(email_obj):
-    score = 0
-
-    # 1. Word count score
-    wc = word_count(email_obj.body)
-    score += min(wc / 50, 5)
-
-    # 2. Important sender weight
-    important_senders = ['boss@company.com', 'hr@company.com']
-    if any(s.lower() in email_obj.sender.lower() for s in important_senders):
-        score += 5
-
-    # 3. Subject keyword boost
-    score += keyword_frequency(email_obj.subject, ['urgent', 'action', 'important']) * 2
-
-    return min(score, 10)
+    """Score one email; use scoring.score_queryset for anything larger"""
+    return PriorityScorer().score([(email_obj.subject, email_obj.sender, email_obj.body_text)])[0].item()
 
 def classify_email(email_obj):
-    """Simple classifier for demonstration"""
-    spam_keywords = ['win', 'free', 'offer', 'click']
-    ham_keywords = ['meeting', 'schedule', 'project']
-
-    spam_score = keyword_frequency(email_obj.body, spam_keywords)
-    ham_score = keyword_frequency(email_obj.body, ham_keywords)
+    """Return 'spam' or 'important' from the trained spam classifier
 
-    if spam_score > ham_score:
-        return 'spam'
-    return 'important'
+    Falls back to the INBOX_KEYWORD_SETS vote until the classifier has
+    seen both spam and not-spam examples.
+    """
+    SpamClassifier().classify_emails([email_obj])
+    return 'spam' if email_obj.spam_label == 'spam' else 'important'
 
 def rank_emails(email_list):
-    scored = [(email, compute_priority_score(email)) for email in email_list]
-    return sorted(scored, key=lambda x: x[1], reverse=True)
+    """Return (email, score) pairs, highest priority first
+
+    Querysets are ranked by the stored priority_score in the database.
+    """
+    if isinstance(email_list, QuerySet):
+        return [(email_obj, email_obj.priority_score) for email_obj in email_list.order_by('-priority_score', '-date_received')]
+
+    scored = score_emails(email_list)
+    return sorted(((email_obj, email_obj.priority_score) for email_obj in scored), key=lambda x: x[1], reverse=True)
 
 def generate_summary(email_obj):
     words = email_obj.body.split()
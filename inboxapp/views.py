@@ -1,48 +1,179 @@
-import imaplib
-import email
-from email.header import decode_header
-from django.shortcuts import render
-from .models import Email  # optional, only if saving to DB
-
-# Email credentials
-EMAIL_USER = "lokendarjoshi384@gmail.com"
-EMAIL_PASS = "csph rizi xyhz loly"
-IMAP_SERVER = "imap.gmail.com"
-IMAP_PORT = 993
-
-def fetch_emails():
-    """Fetch emails from Gmail using IMAP and return a list of dicts."""
-    mail = imaplib.IMAP4_SSL(IMAP_SERVER)
-    mail.login(EMAIL_USER, EMAIL_PASS)
-    mail.select("inbox")
-
-    status, messages = mail.search(None, "ALL")
-    email_ids = messages[0].split()
-
-    fetched_emails = []
-
-    for num in email_ids[-20:][::-1]:  # fetch last 20 emails
-        status, data = mail.fetch(num, "(RFC822)")
-        raw_email = data[0][1]
-        msg = email.message_from_bytes(raw_email)
-
-        subject, encoding = decode_header(msg["Subject"])[0]
-        if isinstance(subject, bytes):
-            subject = subject.decode(encoding or "utf-8", errors="ignore")
-
-        from_ = msg.get("From")
-        date = msg.get("Date")
-
-        fetched_emails.append({
-            "subject": subject,
-            "from": from_,
-            "date": date,
-        })
-
-    mail.logout()
-    return fetched_emails
+from django.conf import settings
+from django.core.exceptions import BadRequest
+from django.core.paginator import Paginator
+from django.db.models import Max
+from django.http import FileResponse, Http404, JsonResponse
+from django.shortcuts import render, get_object_or_404, redirect
+from django.views.decorators.http import require_POST
+from .models import Email, EmailAccount, EmailAttachment, MailboxStats
+from .email_utils import load_email_body
+from .search import search_emails
+from .pagination import keyset_page
+from .stats import set_read
+from .spam import SPAM, HAM, train
+from .conversations import get_conversation
+from .similarity import related_emails
+
+def _account_param(request):
+    """The ?account= filter as an int, or None; malformed ids are a 400"""
+    account_id = request.GET.get('account')
+    if not account_id:
+        return None
+    try:
+        return int(account_id)
+    except ValueError:
+        raise BadRequest("account must be an integer id")
+
+def _limit_param(request, default=25, maximum=100):
+    """The ?limit= page size clamped to 1..maximum, default when not a number"""
+    try:
+        limit = int(request.GET.get('limit') or default)
+    except ValueError:
+        limit = default
+    return max(1, min(limit, maximum))
+
+def _inbox_queryset(request):
+    emails = Email.objects.only(
+        'subject', 'sender', 'sender_name', 'date_received', 'is_read'
+    )
+    account_id = _account_param(request)
+    if account_id:
+        emails = emails.filter(account_id=account_id)
+    if request.GET.get('unread'):
+        emails = emails.filter(is_read=False)
+    return emails
 
 def inbox_view(request):
-    """View to render inbox.html with fetched email data"""
-    emails = fetch_emails()
-    return render(request, "inboxapp/inbox.html", {"emails": emails})
+    """Render the inbox from locally synced emails"""
+    emails, next_cursor = keyset_page(
+        _inbox_queryset(request),
+        cursor=request.GET.get('cursor'),
+        page_size=getattr(settings, 'INBOX_PAGE_SIZE', 25)
+    )
+
+    accounts = EmailAccount.objects.all()
+    account_id = _account_param(request)
+    if account_id:
+        accounts = accounts.filter(id=account_id)
+    last_synced_at = accounts.aggregate(last_synced_at=Max('last_synced_at'))['last_synced_at']
+
+    return render(request, "inboxapp/inbox.html", {
+        "emails": emails,
+        "next_cursor": next_cursor,
+        "is_first_page": not request.GET.get('cursor'),
+        "last_synced_at": last_synced_at,
+    })
+
+def inbox_api(request):
+    """JSON inbox listing with cursor pagination: ?cursor=<next_cursor>"""
+    emails, next_cursor = keyset_page(
+        _inbox_queryset(request),
+        cursor=request.GET.get('cursor'),
+        page_size=_limit_param(request)
+    )
+    return JsonResponse({
+        "emails": [
+            {
+                "id": email_obj.id,
+                "subject": email_obj.subject,
+                "sender": email_obj.sender,
+                "sender_name": email_obj.sender_name,
+                "date_received": email_obj.date_received.isoformat(),
+                "is_read": email_obj.is_read,
+            }
+            for email_obj in emails
+        ],
+        "next_cursor": next_cursor,
+    })
+
+def search_view(request):
+    """Ranked full-text search over subject, sender and body"""
+    query = request.GET.get('q', '')
+    account_id = _account_param(request)
+
+    results = search_emails(query, account_id=account_id)
+    paginator = Paginator(results, getattr(settings, 'INBOX_PAGE_SIZE', 25))
+    page_obj = paginator.get_page(request.GET.get('page'))
+
+    return render(request, "inboxapp/search_results.html", {
+        "query": query,
+        "emails": page_obj,
+        "page_obj": page_obj,
+    })
+
+def email_detail(request, email_id):
+    """Show one email, downloading its body on first open"""
+    email_obj = get_object_or_404(Email.objects.select_related('account'), id=email_id)
+    if not email_obj.body_loaded:
+        load_email_body(email_obj)
+    if not email_obj.is_read:
+        set_read(email_obj, True)
+
+    return render(request, "inboxapp/email_detail.html", {
+        "email": email_obj,
+        "attachments": email_obj.attachments.all(),
+        "related_emails": [related for related, _, _ in related_emails(email_obj, k=5)],
+    })
+
+def thread_view(request, thread_id):
+    """Show a whole conversation, oldest message first"""
+    emails = list(get_conversation(thread_id).only(
+        'subject', 'sender', 'sender_name', 'date_received', 'is_read', 'body_text'
+    ))
+    if not emails:
+        raise Http404("No such conversation")
+
+    return render(request, "inboxapp/thread.html", {
+        "thread_id": thread_id,
+        "subject": emails[0].subject,
+        "emails": emails,
+    })
+
+@require_POST
+def mark_email(request, email_id):
+    """Toggle read state: POST read=1 or read=0"""
+    email_obj = get_object_or_404(Email.objects.only('account_id', 'is_read'), id=email_id)
+    set_read(email_obj, request.POST.get('read') == '1')
+
+    if request.headers.get('Accept') == 'application/json':
+        return JsonResponse({"id": email_obj.id, "is_read": email_obj.is_read})
+    return redirect('inbox')
+
+@require_POST
+def mark_spam(request, email_id):
+    """Train the spam classifier: POST spam=1 or spam=0"""
+    email_obj = get_object_or_404(Email.objects.select_related('account'), id=email_id)
+    if not email_obj.body_loaded:
+        load_email_body(email_obj)
+    train(email_obj, SPAM if request.POST.get('spam') == '1' else HAM)
+
+    if request.headers.get('Accept') == 'application/json':
+        return JsonResponse({"id": email_obj.id, "spam_label": email_obj.spam_label})
+    return redirect('email_detail', email_id=email_obj.id)
+
+def mailbox_stats_api(request):
+    """Per-account total/unread/attachment counters, read from MailboxStats"""
+    stats = MailboxStats.objects.values(
+        'account_id', 'account__name', 'total_count', 'unread_count', 'attachment_bytes'
+    )
+    return JsonResponse({
+        "accounts": [
+            {
+                "account_id": row['account_id'],
+                "name": row['account__name'],
+                "total": row['total_count'],
+                "unread": row['unread_count'],
+                "attachment_bytes": row['attachment_bytes'],
+            }
+            for row in stats
+        ]
+    })
+
+def download_attachment(request, attachment_id):
+    attachment = get_object_or_404(EmailAttachment, id=attachment_id)
+    return FileResponse(
+        attachment.file_path.open('rb'),
+        as_attachment=True,
+        filename=attachment.filename,
+        content_type=attachment.content_type
+    )